@@ -0,0 +1,54 @@
+"""Benchmark of decoding of the enormous batch response
+
+Compares the email parser based decode_multipart followed by
+ODataHttpResponse.from_string with decode_multipart_bytes.
+
+Run from the repository root:
+
+    python -m benchmarks.batch_decoding
+"""
+
+import os
+import timeit
+
+from pyodata.v2.service import ODataHttpResponse, decode_multipart, decode_multipart_bytes
+
+CONTENT_TYPE = 'multipart/mixed; boundary=16804F9C063D8720EACA19F7DFB3CD4A0'
+REPEAT = 20
+
+
+def load_response():
+    """Returns body of the enormous batch response fixture"""
+
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'enormous_batch_response')
+    with open(path, 'rb') as response_file:
+        return response_file.read()
+
+
+def decode_string(body):
+    """Decodes batch response by the email parser"""
+
+    parts = decode_multipart(body.decode('utf-8'), CONTENT_TYPE)
+
+    return [ODataHttpResponse.from_string(part[0]).json() for part in parts]
+
+
+def decode_bytes(body):
+    """Decodes batch response by the bytes scanner"""
+
+    return [part[0].json() for part in decode_multipart_bytes(body, CONTENT_TYPE)]
+
+
+def main():
+    """Prints average time of both decoders"""
+
+    body = load_response()
+    assert decode_string(body) == decode_bytes(body)
+
+    for name, decoder in (('decode_multipart + from_string', decode_string), ('decode_multipart_bytes', decode_bytes)):
+        seconds = timeit.timeit(lambda decoder=decoder: decoder(body), number=REPEAT) / REPEAT
+        print(f'{name:32} {seconds * 1000:8.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Benchmark of encoding of a batch of thousands of create requests
+
+Compares encode_multipart followed by encoding of the string to UTF-8
+with encode_multipart_bytes and iter_encode_multipart.
+
+Run from the repository root:
+
+    python -m benchmarks.batch_encoding
+"""
+
+import os
+import timeit
+
+from pyodata.v2.model import schema_from_xml
+from pyodata.v2.service import Service, encode_multipart, encode_multipart_bytes, iter_encode_multipart
+
+REQUESTS = 5000
+REPEAT = 10
+
+
+def create_batch():
+    """Returns batch of create requests of the example service"""
+
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'metadata.xml')
+    with open(path, 'rb') as metadata_file:
+        service = Service('http://example.com/', schema_from_xml(metadata_file.read()), None)
+
+    batch = service.create_batch()
+    for employee_id in range(REQUESTS):
+        batch.add_request(service.entity_sets.Employees.create_entity().set(
+            ID=employee_id, NameFirst='Jane', NameLast=f'Doe {employee_id}'))
+
+    return batch
+
+
+def main():
+    """Prints average time of all encoders"""
+
+    batch = create_batch()
+    boundary = batch.get_boundary()
+
+    encoders = (
+        ('encode_multipart + encode', lambda: encode_multipart(boundary, batch.requests).encode('utf-8')),
+        ('encode_multipart_bytes', lambda: encode_multipart_bytes(boundary, batch.requests)),
+        ('iter_encode_multipart', lambda: sum(len(chunk) for chunk in iter_encode_multipart(boundary, batch.requests))))
+
+    assert encoders[0][1]() == encoders[1][1]()
+
+    for name, encoder in encoders:
+        seconds = timeit.timeit(encoder, number=REPEAT) / REPEAT
+        print(f'{name:32} {seconds * 1000:8.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Benchmark of building of ORM style $filter expressions at high request rates
+
+Compares building of filters with the cache of compiled lookups cleared
+before every request, with the warm cache and with binding of a prepared
+query.
+
+Run from the repository root:
+
+    python -m benchmarks.filter_building
+"""
+
+import os
+import timeit
+
+from pyodata.v2.model import schema_from_xml
+from pyodata.v2.service import GetEntitySetFilterChainable, QueryParameter, Service
+
+REQUESTS = 10000
+REPEAT = 5
+
+
+def create_service():
+    """Returns service of the example metadata"""
+
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'metadata.xml')
+    with open(path, 'rb') as metadata_file:
+        return Service('http://example.com/', schema_from_xml(metadata_file.read()), None)
+
+
+def main():
+    """Prints the best average time of building of one filter"""
+
+    # pylint: disable=protected-access
+
+    employees = create_service().entity_sets.Employees
+    prepared = employees.prepare(filter={'NameFirst__startswith': QueryParameter('name'),
+                                         'ID__gt': QueryParameter('id'),
+                                         'NickName__in': QueryParameter('nicks')})
+
+    def filter_request(employee_id):
+        return employees.get_entities().filter(NameFirst__startswith='Ja', ID__gt=employee_id,
+                                               NickName__in=['Jay', 'Jane'])
+
+    def cold(employee_id):
+        GetEntitySetFilterChainable._compiled.clear()
+        return filter_request(employee_id)
+
+    def bound(employee_id):
+        return prepared.bind(name='Ja', id=employee_id, nicks=['Jay', 'Jane'])
+
+    builders = (('cold cache', cold), ('compiled lookups', filter_request), ('prepared query', bound))
+
+    expected = builders[0][1](1).get_query_params()
+    for _, builder in builders:
+        assert builder(1).get_query_params() == expected
+
+    for name, builder in builders:
+        seconds = min(timeit.repeat(lambda builder=builder: [builder(i) for i in range(REQUESTS)], number=1,
+                                    repeat=REPEAT))
+        print(f'{name:32} {seconds * 1000000 / REQUESTS:8.2f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -6,10 +6,23 @@
 
 # pylint: disable=too-many-lines
 
+import asyncio
+import concurrent.futures
+import dataclasses
+import itertools
 import logging
 from functools import partial
 import json
 import random
+import re
+import sys
+import types
+import threading
+import time
+import typing
+import weakref
+from collections import OrderedDict, deque, namedtuple
+from decimal import Decimal
 from email.parser import Parser
 from http.client import HTTPResponse
 from io import BytesIO
@@ -23,6 +36,7 @@ LOGGER_NAME = 'pyodata.service'
 
 HTTP_CODE_OK = 200
 HTTP_CODE_CREATED = 201
+HTTP_CODE_NOT_MODIFIED = 304
 
 
 def urljoin(*path):
@@ -76,6 +90,59 @@ def encode_multipart(boundary, http_requests):
     return '\r\n'.join(lines)
 
 
+_HTTP_PART_HEADERS = b'Content-Type: application/http\r\nContent-Transfer-Encoding:binary\r\n\r\n'
+
+
+def iter_encode_multipart(boundary, http_requests):
+    """Encode list of requests into chunks of UTF-8 encoded multipart body
+
+       Yields one chunk per request (nested multipart requests are yielded
+       part by part), the chunks join to the body produced by encode_multipart.
+    """
+
+    delimiter = f'\r\n--{boundary}\r\n'.encode('utf-8')
+
+    for req in http_requests:
+        head = [f'{hdr}: {hdr_val}\r\n' for hdr, hdr_val in req.get_headers().items()]
+        head.append('\r\n')
+
+        if isinstance(req, MultipartRequest):
+            yield delimiter + ''.join(head).encode('utf-8')
+            yield from iter_encode_multipart(req.get_boundary(), req.requests)
+            continue
+
+        # request  line (method + path + query params)
+        query_params = urlencode(req.get_query_params())
+        if query_params:
+            head.insert(0, f'{req.get_method()} {req.get_path()}?{query_params} HTTP/1.1\r\n')
+        else:
+            head.insert(0, f'{req.get_method()} {req.get_path()} HTTP/1.1\r\n')
+
+        # empty body must be represented by blank line, see encode_multipart
+        body = req.get_body()
+        if body is not None:
+            head.append(body)
+
+        yield delimiter + _HTTP_PART_HEADERS + ''.join(head).encode('utf-8')
+
+    yield f'\r\n--{boundary}--'.encode('utf-8')
+
+
+async def async_iter_encode_multipart(boundary, http_requests):
+    """Encode list of requests into chunks of multipart body the same way
+       as iter_encode_multipart for asynchronous HTTP clients
+    """
+
+    for chunk in iter_encode_multipart(boundary, http_requests):
+        yield chunk
+
+
+def encode_multipart_bytes(boundary, http_requests):
+    """Encode list of requests into UTF-8 encoded multipart body"""
+
+    return b''.join(iter_encode_multipart(boundary, http_requests))
+
+
 def decode_multipart(data, content_type):
     """Decode parts of the multipart mime content"""
 
@@ -99,6 +166,206 @@ def decode_multipart(data, content_type):
     return decoded
 
 
+def _multipart_boundary(content_type):
+    for param in content_type.split(';')[1:]:
+        name, _, value = param.strip().partition('=')
+        if name.strip().lower() == 'boundary':
+            return value.strip().strip('"')
+
+    raise PyODataException(f'Multipart content type without boundary: {content_type}')
+
+
+def _decode_headers(data, start, end):
+    """Decode header lines starting at start and return them with position of body"""
+
+    headers = {}
+    while start < end:
+        line_end = data.find(b'\n', start, end)
+        if line_end == -1:
+            line_end = end
+
+        line = data[start:line_end].rstrip(b'\r')
+        start = line_end + 1
+        if not line:
+            break
+
+        name, _, value = line.partition(b':')
+        headers[name.strip().decode('utf-8')] = value.strip().decode('utf-8')
+
+    return headers, min(start, end)
+
+
+def _decode_http_response(data, view, start, end):
+    """Decode HTTP response embedded in data without copying its body"""
+
+    line_end = data.find(b'\n', start, end)
+    if line_end == -1:
+        line_end = end
+
+    status_line = data[start:line_end].split(None, 2)
+    if len(status_line) < 2 or not status_line[0].startswith(b'HTTP/') or not status_line[1].isdigit():
+        raise PyODataException(f'Invalid HTTP status line: {data[start:line_end]!r}')
+
+    headers, body_start = _decode_headers(data, line_end + 1, end)
+
+    return ODataHttpResponse(headers, int(status_line[1]), view[body_start:end])
+
+
+def _decode_multipart_part(data, view, start, end):
+    headers, body_start = _decode_headers(data, start, end)
+    content_type = next((value for name, value in headers.items() if name.lower() == 'content-type'), '')
+
+    if content_type.lower().startswith('multipart/mixed'):
+        return _decode_multipart_parts(data, view, body_start, end, _multipart_boundary(content_type))
+
+    return [_decode_http_response(data, view, body_start, end)]
+
+
+def _decode_multipart_parts(data, view, start, end, boundary):
+    delimiter = b'--' + boundary.encode('utf-8')
+    parts = []
+
+    position = data.find(delimiter, start, end)
+    while position != -1:
+        position += len(delimiter)
+        if data.startswith(b'--', position, end):
+            break
+
+        line_end = data.find(b'\n', position, end)
+        if line_end == -1:
+            break
+
+        next_delimiter = data.find(b'\n' + delimiter, line_end, end)
+        if next_delimiter != -1:
+            part_end = next_delimiter - 1 if data[next_delimiter - 1] == ord('\r') else next_delimiter
+            next_delimiter += 1
+        else:
+            # tolerate delimiter not preceded by line break as the email parser does
+            next_delimiter = data.find(delimiter, line_end + 1, end)
+            part_end = next_delimiter if next_delimiter != -1 else end
+
+        part_start = line_end + 1
+        parts.append(_decode_multipart_part(data, view, part_start, max(part_start, part_end)))
+
+        position = next_delimiter
+
+    return parts
+
+
+def decode_multipart_bytes(data, content_type):
+    """Decode parts of the multipart mime content of HTTP responses
+
+       Returns the same tree of parts as decode_multipart but with
+       ODataHttpResponse instances in place of HTTP response strings.
+       Bodies of the responses are memoryview slices of data.
+    """
+
+    data = bytes(data)
+
+    return _decode_multipart_parts(data, memoryview(data), 0, len(data), _multipart_boundary(content_type))
+
+
+class MultipartStreamDecoder:
+    """Incremental decoder of multipart mime content of HTTP responses
+
+       Chunks of the content are passed to feed() which returns the parts
+       completed by the chunk, decoded the same way as decode_multipart_bytes
+       does. Only the incomplete part is kept in memory.
+    """
+
+    def __init__(self, content_type):
+        self._delimiter = b'--' + _multipart_boundary(content_type).encode('utf-8')
+        self._buffer = bytearray()
+        self._searched = 0
+        self._in_part = False
+        self._finished = False
+
+    def _decode_part(self, end, next_start):
+        part = bytes(self._buffer[:end])
+        del self._buffer[:next_start]
+        self._searched = 0
+        self._in_part = False
+
+        return _decode_multipart_part(part, memoryview(part), 0, len(part))
+
+    def feed(self, chunk):
+        """Returns list of parts completed by the chunk"""
+
+        self._buffer += chunk
+        parts = []
+
+        while not self._finished:
+            if not self._in_part:
+                position = self._buffer.find(self._delimiter)
+                if position == -1:
+                    # drop preamble but keep possible beginning of the delimiter
+                    del self._buffer[:max(0, len(self._buffer) - len(self._delimiter))]
+                    break
+
+                position += len(self._delimiter)
+                if len(self._buffer) < position + 2:
+                    break
+
+                if self._buffer.startswith(b'--', position):
+                    self._finished = True
+                    self._buffer.clear()
+                    break
+
+                line_end = self._buffer.find(b'\n', position)
+                if line_end == -1:
+                    break
+
+                del self._buffer[:line_end + 1]
+                self._in_part = True
+
+            next_delimiter = self._buffer.find(b'\n' + self._delimiter, self._searched)
+            if next_delimiter == -1:
+                self._searched = max(0, len(self._buffer) - len(self._delimiter))
+                break
+
+            end = next_delimiter
+            if end and self._buffer[end - 1] == ord('\r'):
+                end -= 1
+
+            parts.append(self._decode_part(end, next_delimiter + 1))
+
+        return parts
+
+    def close(self):
+        """Returns list with the last part if the content was not properly terminated"""
+
+        if self._finished or not self._in_part:
+            return []
+
+        # tolerate delimiter not preceded by line break as decode_multipart_bytes does
+        end = self._buffer.find(self._delimiter)
+        if end == -1:
+            end = len(self._buffer)
+
+        self._finished = True
+        return [self._decode_part(end, len(self._buffer))]
+
+    def iter_parts(self, chunks):
+        """Yields parts of the content as soon as the chunks complete them"""
+
+        for chunk in chunks:
+            yield from self.feed(chunk)
+
+        yield from self.close()
+
+    async def async_iter_parts(self, chunks):
+        """Yields parts of the content as soon as the asynchronously
+           iterated chunks complete them
+        """
+
+        async for chunk in chunks:
+            for part in self.feed(chunk):
+                yield part
+
+        for part in self.close():
+            yield part
+
+
 class ODataHttpResponse:
     """Representation of http response"""
 
@@ -108,6 +375,20 @@ class ODataHttpResponse:
         self.status_code = status_code
         self.content = content
 
+    @property
+    def content(self):
+        """Body of the response"""
+
+        # bodies of batch responses are kept as slices of the batch body until needed
+        if isinstance(self._content, memoryview):
+            self._content = self._content.tobytes()
+
+        return self._content
+
+    @content.setter
+    def content(self, value):
+        self._content = value
+
     @staticmethod
     def from_string(data):
         """Parse http response to status code, headers and body
@@ -138,14 +419,22 @@ class ODataHttpResponse:
             response.read(len(data))  # the len here will give a 'big enough' value to read the whole content
         )
 
+    @staticmethod
+    def from_bytes(data):
+        """Parse http response to status code, headers and body"""
+
+        data = bytes(data)
+
+        return _decode_http_response(data, memoryview(data), 0, len(data))
+
     def json(self):
         """Return response as decoded json"""
 
         # TODO: see implementation in python requests, our simple
         # approach can bring issues with encoding
         # https://github.com/requests/requests/blob/master/requests/models.py#L868
-        if self.content:
-            return json.loads(self.content.decode('utf-8'))
+        if self._content:
+            return json.loads(str(self._content, 'utf-8'))
         return None
 
 
@@ -157,18 +446,23 @@ class EntityKey:
       within the entity-set, and thus defines an entity's identity.
 
       The string representation of an entity-key is wrapped with parentheses,
-      such as (2), ('foo') or (a=1,foo='bar').
+      such as (2), ('foo') or (a=1,foo='bar'). It is built once and cached.
 
-      Entity-keys are equal if their string representations are equal.
+      Entity-keys of the same entity type (the same instance, so same named
+      types of different schemas differ) are equal if their string
+      representations are equal. Entity-keys are hashable and can be used
+      as keys of dictionaries and members of sets. Their attributes and key
+      property values cannot be changed after initialization.
     """
 
+    __slots__ = ('_proprties', '_entity_type', '_key', '_type', '_key_string')
+
     TYPE_SINGLE = 0
     TYPE_COMPLEX = 1
 
     def __init__(self, entity_type, single_key=None, **args):
 
-        self._logger = logging.getLogger(LOGGER_NAME)
-        self._proprties = args
+        logger = logging.getLogger(LOGGER_NAME)
         self._entity_type = entity_type
         self._key = entity_type.key_proprties
 
@@ -187,8 +481,8 @@ class EntityKey:
 
             self._type = EntityKey.TYPE_SINGLE
 
-            self._logger.debug(('Detected single property key, adding pair %s->%s to key'
-                                'properties'), key_prop.name, single_key)
+            logger.debug(('Detected single property key, adding pair %s->%s to key'
+                          'properties'), key_prop.name, single_key)
         else:
             for key_prop in self._key:
                 if key_prop.name not in args:
@@ -196,6 +490,18 @@ class EntityKey:
 
             self._type = EntityKey.TYPE_COMPLEX
 
+        self._proprties = types.MappingProxyType(dict(args))
+
+    def __setattr__(self, name, value):
+        # every attribute is set only once - in __init__ or by caching the string representation
+        if hasattr(self, name):
+            raise AttributeError(f'{self.__class__.__name__} is immutable, cannot set {name}')
+
+        super(EntityKey, self).__setattr__(name, value)
+
+    def __delattr__(self, name):
+        raise AttributeError(f'{self.__class__.__name__} is immutable, cannot delete {name}')
+
     @property
     def key_properties(self):
         """Key properties"""
@@ -223,1165 +529,3517 @@ class EntityKey:
     def to_key_string(self):
         """Gets the string representation of the key, including parentheses"""
 
-        return f'({self.to_key_string_without_parentheses()})'
+        try:
+            return self._key_string
+        except AttributeError:
+            # pylint: disable=attribute-defined-outside-init
+            self._key_string = sys.intern(f'({self.to_key_string_without_parentheses()})')
+
+        return self._key_string
 
     def __repr__(self):
         return self.to_key_string()
 
+    def __eq__(self, other):
+        if not isinstance(other, EntityKey):
+            return NotImplemented
 
-class ODataHttpRequest:
-    """Deferred HTTP Request"""
+        return self._entity_type is other._entity_type and self.to_key_string() == other.to_key_string()
 
-    def __init__(self, url, connection, handler, headers=None, response_hook=None):
-        self._connection = connection
-        self._url = url
-        self._handler = handler
-        self._headers = headers or dict()
-        self._logger = logging.getLogger(LOGGER_NAME)
-        self._customs = {}  # string -> string hash
-        self._next_url = None
-        self._response_hook = response_hook
+    def __hash__(self):
+        return hash((id(self._entity_type), self.to_key_string()))
 
-    @property
-    def handler(self):
-        """Getter for handler"""
-        return self._handler
 
-    def get_path(self):
-        """Get path of the HTTP request"""
-        # pylint: disable=no-self-use
-        return ''
+class EntityIdentityMap:
+    """Identity map of entity proxies keyed by entity set name and entity key
 
-    def get_query_params(self):
-        """Get query params"""
-        # pylint: disable=no-self-use
-        return dict(self._customs)
+       Keeps a single EntityProxy instance per entity, so the same entity
+       fetched several times (pages, $expand results, navigation) is
+       represented by one proxy whose values are refreshed with every
+       occurrence.
 
-    def get_method(self):
-        """Get HTTP method"""
-        # pylint: disable=no-self-use
-        return 'GET'
+       The map either keeps max_size most recently used proxies or, if weak
+       is True, only the proxies referenced elsewhere in the program.
 
-    def get_body(self):
-        """Get HTTP body or None if not applicable"""
-        # pylint: disable=no-self-use
-        return None
+       If revalidate is True, tracked entities with ETag are not returned
+       from memory directly but revalidated by conditional GET requests.
+    """
 
-    def get_default_headers(self):
-        """Get dict of Child specific HTTP headers"""
-        # pylint: disable=no-self-use
-        return dict()
+    def __init__(self, max_size=1000, weak=False, revalidate=False):
+        self._max_size = max_size
+        self._weak = weak
+        self._revalidate = revalidate
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
 
-    def get_headers(self):
-        """Get dict of HTTP headers which is union of return value
-           of the method get_default_headers() and the headers
-           added via the method add_headers() where the latter
-           headers have priority - same keys get value of the latter.
-        """
+        if weak:
+            self._entities = weakref.WeakValueDictionary()
+        else:
+            self._entities = OrderedDict()
 
-        headers = self.get_default_headers()
-        headers.update(self._headers)
+    def __len__(self):
+        return len(self._entities)
 
-        return headers
+    @staticmethod
+    def _identity(entity_set_name, entity_key):
+        return entity_set_name, entity_key
 
-    def add_headers(self, value):
-        """Add the give dictionary of HTTP headers to
-           HTTP request sent by this ODataHttpRequest instance.
-        """
+    @property
+    def revalidate(self):
+        """Whether tracked entities are revalidated by conditional requests"""
 
-        if not isinstance(value, dict):
-            raise TypeError(f"Headers must be of type 'dict' not {type(value)}")
+        return self._revalidate
 
-        self._headers.update(value)
+    @property
+    def hits(self):
+        """Number of lookups (get) answered by the map"""
 
-    def _build_request(self):
-        if self._next_url:
-            parsed_next = urlparse(self._next_url)
-            parsed_base = urlparse(self._url)
-            if (parsed_next.scheme, parsed_next.netloc) != (parsed_base.scheme, parsed_base.netloc):
-                raise PyODataException(
-                    f'cross-origin __next URL rejected: {self._next_url!r} differs from '
-                    f'service root {self._url!r}'
-                )
-            url = self._next_url
-        else:
-            url = urljoin(self._url, self.get_path())
-        # pylint: disable=assignment-from-none
-        body = self.get_body()
+        return self._hits
 
-        headers = self.get_headers()
+    @property
+    def misses(self):
+        """Number of lookups not answered by the map"""
 
-        self._logger.debug('Send (execute) %s request to %s', self.get_method(), url)
-        self._logger.debug('  query params: %s', self.get_query_params())
-        self._logger.debug('  headers: %s', headers)
-        if body:
-            self._logger.debug('  body: %s', body)
+        return self._misses
 
-        params = self.get_query_params()
+    @property
+    def hit_ratio(self):
+        """Ratio of hits to all lookups"""
 
-        return url, body, headers, params
+        lookups = self._hits + self._misses
+        if not lookups:
+            return 0.0
 
-    async def async_execute(self):
-        """Fetches HTTP response and returns processed result
+        return self._hits / lookups
 
-                  Sends the query-request to the OData service, returning a client-side Enumerable for
-                  subsequent in-memory operations.
+    def get(self, entity_set_name, entity_key):
+        """Returns the tracked proxy of the entity or None"""
 
-                  Fetches HTTP response and returns processed result"""
+        identity = EntityIdentityMap._identity(entity_set_name, entity_key)
 
-        url, body, headers, params = self._build_request()
-        async with self._connection.request(self.get_method(),
-                                            url,
-                                            headers=headers,
-                                            params=params,
-                                            data=body) as async_response:
-            response = ODataHttpResponse(url=async_response.url,
-                                         headers=async_response.headers,
-                                         status_code=async_response.status,
-                                         content=await async_response.read())
-        return self._call_handler(response)
+        with self._lock:
+            entity = self._entities.get(identity)
+            if entity is None:
+                self._misses += 1
+                return None
 
-    def execute(self):
-        """Fetches HTTP response and returns processed result
+            self._hits += 1
+            if not self._weak:
+                self._entities.move_to_end(identity)
 
-           Sends the query-request to the OData service, returning a client-side Enumerable for
-           subsequent in-memory operations.
+            return entity
 
-           Fetches HTTP response and returns processed result"""
+    def add(self, entity):
+        """Returns the tracked proxy of the entity updated with values of the
+           passed proxy or starts tracking the passed proxy.
+        """
 
-        url, body, headers, params = self._build_request()
+        if entity.entity_set is None or entity.entity_key is None:
+            return entity
 
-        response = self._connection.request(
-            self.get_method(), url, headers=headers, params=urlencode(params), data=body)
+        identity = EntityIdentityMap._identity(entity.entity_set.name, entity.entity_key)
 
-        return self._call_handler(response)
+        with self._lock:
+            tracked = self._entities.get(identity)
+            if tracked is None:
+                self._entities[identity] = entity
 
-    def _call_handler(self, response):
-        self._logger.debug('Received response')
-        self._logger.debug('  url: %s', response.url)
-        self._logger.debug('  headers: %s', response.headers)
-        self._logger.debug('  status code: %d', response.status_code)
+                if not self._weak and self._max_size is not None:
+                    while len(self._entities) > self._max_size:
+                        # the least recently used entity is the first one
+                        del self._entities[next(iter(self._entities))]
 
-        try:
-            self._logger.debug('  body: %s', response.content.decode('utf-8'))
-        except UnicodeDecodeError:
-            self._logger.debug('  body: <cannot be decoded>')
+                return entity
 
-        if self._response_hook is not None:
-            self._response_hook(response)
+            if not self._weak:
+                self._entities.move_to_end(identity)
 
-        return self._handler(response)
+        # pylint: disable=protected-access
+        tracked._cache.update(entity._cache)
+        if entity.etag is not None:
+            tracked._etag = entity.etag
 
-    def custom(self, name, value):
-        """Adds a custom name-value pair."""
-        # returns QueryRequest
-        self._customs[name] = value
-        return self
+        return tracked
 
+    def discard(self, entity_set_name, entity_key):
+        """Stops tracking the entity"""
 
-class EntityGetRequest(ODataHttpRequest):
-    """Used for GET operations of a single entity"""
+        with self._lock:
+            self._entities.pop(EntityIdentityMap._identity(entity_set_name, entity_key), None)
 
-    def __init__(self, handler, entity_key, entity_set_proxy, encode_path=True):
-        super(EntityGetRequest, self).__init__(entity_set_proxy.service.url, entity_set_proxy.service.connection,
-                                               handler, response_hook=entity_set_proxy.service.response_hook)
-        self._logger = logging.getLogger(LOGGER_NAME)
-        self._entity_key = entity_key
-        self._entity_set_proxy = entity_set_proxy
-        self._select = None
-        self._expand = None
-        self._encode_path = encode_path
+    def clear(self):
+        """Stops tracking all entities and resets statistics"""
 
-        self._logger.debug('New instance of EntityGetRequest for last segment: %s', self._entity_set_proxy.last_segment)
+        with self._lock:
+            self._entities.clear()
+            self._hits = 0
+            self._misses = 0
 
-    def nav(self, nav_property):
-        """Navigates to given navigation property and returns the EntitySetProxy"""
-        return self._entity_set_proxy.nav(nav_property, self._entity_key)
 
-    def select(self, select):
-        """Specifies a subset of properties to return.
+NavigationRoute = namedtuple('NavigationRoute', 'navigation_property entity_set multiplicity key_mapping')
 
-           @param select  a comma-separated list of selection clauses
-        """
-        self._select = select
-        return self
 
-    def expand(self, expand):
-        """Specifies related entities to expand inline as part of the response.
+class NavigationRoutingTable:
+    """Routes of navigation properties of all entity types of a schema
 
-           @param expand  a comma-separated list of navigation properties
-        """
-        self._expand = expand
-        return self
+       Every route maps a pair (EntityType, navigation property name)
+       to the target entity set, the multiplicity of the target end and the
+       pairs (source property name, target property name) of the referential
+       constraint of the association. The table is built once so navigation
+       costs one dictionary lookup per hop.
+    """
 
-    def get_path(self):
-        if self.get_encode_path():
-            return quote(self._entity_set_proxy.last_segment + self._entity_key.to_key_string())
-        return self._entity_set_proxy.last_segment + self._entity_key.to_key_string()
+    def __init__(self, schema):
+        self._routes = {}
 
-    def get_default_headers(self):
-        return {'Accept': 'application/json'}
+        for entity_type in schema.entity_types:
+            for navigation_property in entity_type.nav_proprties:
+                if navigation_property.association is None:
+                    continue
 
-    def get_query_params(self):
-        qparams = super(EntityGetRequest, self).get_query_params()
+                entity_set = self._target_entity_set(schema, navigation_property)
+                if entity_set is None:
+                    continue
 
-        if self._select is not None:
-            qparams['$select'] = self._select
+                self._routes[(entity_type, navigation_property.name)] = NavigationRoute(
+                    navigation_property,
+                    entity_set,
+                    navigation_property.to_role.multiplicity,
+                    self._key_mapping(navigation_property))
 
-        if self._expand is not None:
-            qparams['$expand'] = self._expand
+    @staticmethod
+    def _target_entity_set(schema, navigation_property):
+        # association sets are matched by the association object because
+        # associations of different namespaces can share the name
+        for association_set in schema.association_sets:
+            if association_set.association_type is not navigation_property.association:
+                continue
 
-        return qparams
-
-    def get_value(self, connection=None):
-        """Returns Value of Media EntityTypes also known as the $value URL suffix."""
+            try:
+                end = association_set.end_by_role(navigation_property.to_role.role)
+                if end.entity_set is not None:
+                    return end.entity_set
 
-        if connection is None:
-            connection = self._connection
+                return schema.entity_set(end.entity_set_name)
+            except KeyError:
+                return None
 
-        def stream_handler(response):
-            """Returns $value from HTTP Response"""
+        return None
 
-            if response.status_code != HTTP_CODE_OK:
-                raise HttpError('HTTP GET for $value failed with status code {}'
-                                .format(response.status_code), response)
+    @staticmethod
+    def _key_mapping(navigation_property):
+        constraint = navigation_property.association.referential_constraint
+        if constraint is None:
+            return ()
 
-            return response
+        if constraint.principal.name == navigation_property.from_role_name:
+            source, target = constraint.principal, constraint.dependent
+        else:
+            source, target = constraint.dependent, constraint.principal
 
-        return ODataHttpRequest(
-            urljoin(self._url, self.get_path(), '/$value'),
-            connection,
-            stream_handler)
+        return tuple(zip(source.property_names, target.property_names))
 
-    def get_encode_path(self):
-        """Getter for encode path flag"""
-        return self._encode_path
+    def __len__(self):
+        return len(self._routes)
 
+    def route(self, entity_type, navigation_property_name):
+        """Returns NavigationRoute of the navigation property of the EntityType or raises KeyError"""
 
-class NavEntityGetRequest(EntityGetRequest):
-    """Used for GET operations of a single entity accessed via a Navigation property"""
+        return self._routes[(entity_type, navigation_property_name)]
 
-    def __init__(self, handler, master_key, entity_set_proxy, nav_property):
-        super(NavEntityGetRequest, self).__init__(handler, master_key, entity_set_proxy)
+    def resolve(self, entity_type, navigation_property_name):
+        """Returns NavigationRoute of the navigation property of the EntityType
+           or raises PyODataException telling whether the navigation property
+           is not declared or its target entity set cannot be resolved
+        """
 
-        self._nav_property = nav_property
+        try:
+            return self._routes[(entity_type, navigation_property_name)]
+        except KeyError:
+            pass
 
-    def get_path(self):
-        return f"{super(NavEntityGetRequest, self).get_path()}/{self._nav_property}"
+        try:
+            entity_type.nav_proprty(navigation_property_name)
+        except KeyError:
+            raise PyODataException(
+                f'Navigation property {navigation_property_name} is not declared in {entity_type} entity type')
 
+        raise PyODataException(f'Target entity set of navigation property {navigation_property_name} '
+                               f'of {entity_type} entity type cannot be resolved')
 
-class EntityCreateRequest(ODataHttpRequest):
-    """Used for creating entities (POST operations of a single entity)
 
-       Call execute() to send the create-request to the OData service
-       and get the newly created entity."""
+class RequestCoalescer:
+    """Coalesces single entity GET requests executed at the same time
+       into one $batch request
 
-    def __init__(self, url, connection, handler, entity_set, last_segment=None, response_hook=None):
-        super(EntityCreateRequest, self).__init__(url, connection, handler, response_hook=response_hook)
-        self._logger = logging.getLogger(LOGGER_NAME)
-        self._entity_set = entity_set
-        self._entity_type = entity_set.entity_type
+       Synchronous requests executed by concurrent threads within window
+       seconds and asynchronous requests awaited within one iteration of
+       the event loop (or within window seconds if window is given) are sent
+       together as one $batch request of at most max_batch_size parts.
 
-        if last_segment is None:
-            self._last_segment = self._entity_set.name
-        else:
-            self._last_segment = last_segment
+       Identical requests of plain get_entity() calls are sent only once and
+       all their callers receive the same result. Requests with other
+       handlers, e.g. loading properties into a particular proxy, are never
+       merged because only their own handler fills the proxy.
+    """
 
-        self._values = {}
+    def __init__(self, window=0.005, max_batch_size=100):
+        self._window = window
+        self._max_batch_size = max_batch_size
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._async_pending = {}
+        self._async_scheduled = False
+        # the event loop keeps only weak references to the dispatching tasks
+        self._async_tasks = set()
 
-        # get all properties declared by entity type
-        self._type_props = self._entity_type.proprties()
+    @property
+    def window(self):
+        """Seconds to wait for other requests before sending a batch"""
 
-        self._logger.debug('New instance of EntityCreateRequest for entity type: %s on path %s', self._entity_type.name,
-                           self._last_segment)
+        return self._window
 
-    def get_path(self):
-        return self._last_segment
+    @property
+    def max_batch_size(self):
+        """Maximal number of requests sent in one batch"""
 
-    def get_method(self):
-        # pylint: disable=no-self-use
-        return 'POST'
+        return self._max_batch_size
 
-    def _get_body(self):
-        """Recursively builds a dictionary of values where some of the values
-           might be another entities.
+    @staticmethod
+    def _identity(request):
+        return (request.get_method(),
+                request.get_path(),
+                urlencode(sorted(request.get_query_params().items())),
+                tuple(sorted(request.get_headers().items())),
+                None if request.shares_result else request.handler)
+
+    def execute(self, service, request):
+        """Executes the request together with requests of other threads
+           and returns the result of its handler
         """
 
-        body = {}
-        for key, val in self._values.items():
-            # The value is either an entity or a scalar
-            if isinstance(val, EntityProxy):
-                body[key] = val._get_body()  # pylint: disable=protected-access
-            else:
-                body[key] = val
+        identity = RequestCoalescer._identity(request)
 
-        return body
+        with self._lock:
+            leader = not self._pending
+            pending = self._pending.get(identity)
+            if pending is None:
+                pending = (request, concurrent.futures.Future())
+                self._pending[identity] = pending
 
-    def get_body(self):
-        return json.dumps(self._get_body())
+        # the first thread collects requests of the others and sends them
+        if leader:
+            time.sleep(self._window)
 
-    def get_default_headers(self):
-        return {'Accept': 'application/json', 'Content-Type': 'application/json', 'X-Requested-With': 'X'}
+            with self._lock:
+                requests, self._pending = list(self._pending.values()), {}
 
-    @staticmethod
-    def _build_values(entity_type, entity):
-        """Recursively converts a dictionary of values where some of the values
-           might be another entities (navigation properties) into the internal
-           representation.
-        """
+            for start in range(0, len(requests), self._max_batch_size):
+                self._dispatch(service, requests[start:start + self._max_batch_size])
 
-        if isinstance(entity, list):
-            return [EntityCreateRequest._build_values(entity_type, item) for item in entity]
+        return pending[1].result()
 
-        values = {}
-        for key, val in entity.items():
-            try:
-                val = entity_type.proprty(key).to_json(val)
-            except KeyError:
-                try:
-                    nav_prop = entity_type.nav_proprty(key)
-                    val = EntityCreateRequest._build_values(nav_prop.typ, val)
-                except KeyError:
-                    raise PyODataException('Property {} is not declared in {} entity type'.format(
-                        key, entity_type.name))
+    async def async_execute(self, service, request):
+        """Executes the request together with other requests awaited
+           in the same iteration of the event loop and returns the result
+           of its handler
+        """
 
-            values[key] = val
+        loop = asyncio.get_running_loop()
+        identity = RequestCoalescer._identity(request)
 
-        return values
+        pending = self._async_pending.get(identity)
+        if pending is None:
+            pending = (request, loop.create_future())
+            self._async_pending[identity] = pending
 
-    def set(self, **kwargs):
-        """Set properties on the new entity."""
+        if not self._async_scheduled:
+            self._async_scheduled = True
+            flush = partial(self._async_flush, service)
+            if self._window:
+                loop.call_later(self._window, flush)
+            else:
+                loop.call_soon(flush)
 
-        self._logger.info(kwargs)
+        return await pending[1]
 
-        # TODO: consider use of attset for setting properties
-        self._values = EntityCreateRequest._build_values(self._entity_type, kwargs)
+    def _async_flush(self, service):
+        requests, self._async_pending = list(self._async_pending.values()), {}
+        self._async_scheduled = False
 
-        return self
+        for start in range(0, len(requests), self._max_batch_size):
+            task = asyncio.ensure_future(self._async_dispatch(service, requests[start:start + self._max_batch_size]))
+            self._async_tasks.add(task)
+            task.add_done_callback(self._async_tasks.discard)
 
+    def _dispatch(self, service, requests):
+        # pylint: disable=broad-except
+        # all exceptions must be passed to the waiting callers
 
-class EntityDeleteRequest(ODataHttpRequest):
-    """Used for deleting entity (DELETE operations on a single entity)"""
+        if len(requests) == 1:
+            request, future = requests[0]
+            try:
+                future.set_result(ODataHttpRequest.execute(request))
+            except Exception as ex:
+                future.set_exception(ex)
+            return
 
-    def __init__(self, url, connection, handler, entity_set, entity_key, encode_path=True, response_hook=None):
-        super(EntityDeleteRequest, self).__init__(url, connection, handler, response_hook=response_hook)
-        self._logger = logging.getLogger(LOGGER_NAME)
-        self._entity_set = entity_set
-        self._entity_key = entity_key
-        self._encode_path = encode_path
+        try:
+            self._create_batch(service, requests).execute()
+        except Exception as ex:
+            RequestCoalescer._fail(requests, ex)
+        else:
+            RequestCoalescer._fail(requests, PyODataException('Batch response does not contain all responses'))
 
-        self._logger.debug('New instance of EntityDeleteRequest for entity type: %s', entity_set.entity_type.name)
+    async def _async_dispatch(self, service, requests):
+        # pylint: disable=broad-except
+        # all exceptions must be passed to the waiting callers
 
-    def get_path(self):
-        if self.get_encode_path():
-            return quote(self._entity_set.name + self._entity_key.to_key_string())
-        return self._entity_set.name + self._entity_key.to_key_string()
+        if len(requests) == 1:
+            request, future = requests[0]
+            try:
+                future.set_result(await ODataHttpRequest.async_execute(request))
+            except Exception as ex:
+                future.set_exception(ex)
+            return
 
-    def get_encode_path(self):
-        """Getter for encode path flag"""
-        return self._encode_path
+        try:
+            await self._create_batch(service, requests).async_execute()
+        except Exception as ex:
+            RequestCoalescer._fail(requests, ex)
+        else:
+            RequestCoalescer._fail(requests, PyODataException('Batch response does not contain all responses'))
 
-    def get_method(self):
-        # pylint: disable=no-self-use
-        return 'DELETE'
+    @staticmethod
+    def _fail(requests, exception):
+        for _, future in requests:
+            if not future.done():
+                future.set_exception(exception)
 
+    @staticmethod
+    def _create_batch(service, requests):
+        futures = [future for _, future in requests]
 
-# pylint: disable=too-many-instance-attributes
-class EntityModifyRequest(ODataHttpRequest):
-    """Used for modyfing entities (UPDATE/MERGE operations on a single entity)
+        def coalesced_batch_handler(batch, parts):
+            """Passes result of every part to the future of its request"""
 
-       Call execute() to send the update-request to the OData service
-       and get the modified entity."""
+            # pylint: disable=broad-except
+            for part, req, future in zip(parts, batch.requests, futures):
+                try:
+                    future.set_result(req.handler(part[0]))
+                except Exception as ex:
+                    future.set_exception(ex)
 
-    ALLOWED_HTTP_METHODS = ['PATCH', 'PUT', 'MERGE']
+        batch = BatchRequest(service.url, service.connection, coalesced_batch_handler,
+                             response_hook=service.response_hook)
+        for request, _ in requests:
+            batch.add_request(request)
 
-    # pylint: disable=too-many-arguments
-    def __init__(self, url, connection, handler, entity_set, entity_key, method="PATCH", encode_path=True,
-                 response_hook=None):
-        super(EntityModifyRequest, self).__init__(url, connection, handler, response_hook=response_hook)
-        self._logger = logging.getLogger(LOGGER_NAME)
-        self._entity_set = entity_set
-        self._entity_type = entity_set.entity_type
-        self._entity_key = entity_key
-        self._encode_path = encode_path
+        return batch
 
-        self._method = method.upper()
-        if self._method not in EntityModifyRequest.ALLOWED_HTTP_METHODS:
-            raise ValueError('The value "{}" is not on the list of allowed Entity Update HTTP Methods: {}'
-                             .format(method, ', '.join(EntityModifyRequest.ALLOWED_HTTP_METHODS)))
 
-        self._values = {}
+class AccessRecord:
+    """Thread safe set of names of attributes read on entity proxies
+       returned by one query site
+    """
 
-        # get all properties declared by entity type
-        self._type_props = self._entity_type.proprties()
+    __slots__ = ('_names', '_lock')
 
-        self._logger.debug('New instance of EntityModifyRequest for entity type: %s', self._entity_type.name)
+    def __init__(self):
+        self._names = set()
+        self._lock = threading.Lock()
 
-    def get_path(self):
-        if self.get_encode_path():
-            return quote(self._entity_set.name + self._entity_key.to_key_string())
-        return self._entity_set.name + self._entity_key.to_key_string()
+    def add(self, name):
+        """Records read of the attribute"""
 
-    def get_method(self):
-        # pylint: disable=no-self-use
-        return self._method
+        # names are rarely new, so the lock is taken only to add them
+        if name not in self._names:
+            with self._lock:
+                self._names.add(name)
 
-    def get_body(self):
-        # pylint: disable=no-self-use
-        body = {}
-        for key, val in self._values.items():
-            body[key] = val
-        return json.dumps(body)
+    def names(self):
+        """Returns copy of the recorded names"""
 
-    def get_default_headers(self):
-        return {'Accept': 'application/json', 'Content-Type': 'application/json'}
+        with self._lock:
+            return set(self._names)
 
-    def get_encode_path(self):
-        """Getter for encode path flag"""
-        return self._encode_path
 
-    def set(self, **kwargs):
-        """Set properties to be changed."""
+class SelectProfiler:
+    """Learns $select of entity set queries from the attributes read on
+       the returned entity proxies
 
-        self._logger.info(kwargs)
+       Queries are grouped into sites by entity set, names of query options
+       and $expand. Once a site has been executed warmup times without
+       $select, its later executions select only the key properties and the
+       properties read so far. Properties read later are loaded on demand
+       as usual and are selected by the next executions.
+    """
 
-        for key, val in kwargs.items():
-            try:
-                val = self._entity_type.proprty(key).to_json(val)
-            except KeyError:
-                raise PyODataException(
-                    f'Property {key} is not declared in {self._entity_type.name} entity type')
+    def __init__(self, warmup=1):
+        self._warmup = warmup
+        self._accessed = {}
+        self._observations = {}
+        self._lock = threading.Lock()
 
-            self._values[key] = val
+    def select(self, site, entity_type):
+        """Returns learned $select of the query site or None"""
 
-        return self
+        with self._lock:
+            if self._observations.get(site, 0) < self._warmup:
+                return None
 
+            accessed = self._accessed[site].names()
 
-class QueryRequest(ODataHttpRequest):
-    """INTERFACE A consumer-side query-request builder. Call execute() to issue the request."""
+        expand = {path.split('/', 1)[0] for path in site[2].split(',')} if site[2] else set()
+        names = [proprty.name for proprty in entity_type.key_proprties]
+        names.extend(sorted(name for name in accessed
+                            if name not in names and (entity_type.has_proprty(name) or name in expand)))
 
-    # pylint: disable=too-many-instance-attributes
+        return ','.join(names)
 
-    def __init__(self, url, connection, handler, last_segment, response_hook=None):
-        super(QueryRequest, self).__init__(url, connection, handler, response_hook=response_hook)
+    def track(self, site, entities):
+        """Records reads of attributes of the entities returned by the query site"""
 
-        self._logger = logging.getLogger(LOGGER_NAME)
-        self._count = None
-        self._inlinecount = None
-        self._top = None
-        self._skip = None
-        self._order_by = None
-        self._filter = None
-        self._select = None
-        self._expand = None
-        self._last_segment = last_segment
-        self._logger.debug('New instance of QueryRequest for last segment: %s', self._last_segment)
+        with self._lock:
+            accessed = self._accessed.setdefault(site, AccessRecord())
+            self._observations[site] = self._observations.get(site, 0) + 1
 
-    def count(self, inline=False):
-        """Sets a flag to return the number of items. Can be inline with results or just the count."""
-        if inline:
-            self._inlinecount = True
-        else:
-            self._count = True
-        return self
+        for entity in entities:
+            if isinstance(entity, EntityProxy):
+                entity._accessed = accessed  # pylint: disable=protected-access
 
-    def next_url(self, next_url):
-        """
-        Sets URL which identifies the next partial set of entities from the originally identified complete set. Once
-        set, this URL takes precedence over all query parameters.
+    def profiles(self):
+        """Returns list of learned profiles which can be serialized to JSON"""
 
-        For details, see section "6. Representing Collections of Entries" on
-        https://www.odata.org/documentation/odata-version-2-0/json-format/
-        """
-        self._next_url = next_url
-        return self
+        with self._lock:
+            return [{'entity_set': site[0],
+                     'query': list(site[1]),
+                     'expand': site[2],
+                     'observations': self._observations[site],
+                     'properties': sorted(accessed.names())}
+                    for site, accessed in sorted(self._accessed.items(), key=lambda item: repr(item[0]))]
 
-    def expand(self, expand):
-        """Sets the expand expressions."""
-        self._expand = expand
-        return self
 
-    def filter(self, filter_val):
-        """Sets the filter expression."""
-        # returns QueryRequest
-        self._filter = filter_val
-        return self
+class ODataHttpRequest:
+    """Deferred HTTP Request"""
 
-    # def nav(self, key_value, nav_property):
-    #    """Navigates to a referenced collection using a collection-valued navigation property."""
-    #    # returns QueryRequest
-    #    raise NotImplementedError
+    def __init__(self, url, connection, handler, headers=None, response_hook=None):
+        self._connection = connection
+        self._url = url
+        self._handler = handler
+        self._headers = headers or dict()
+        self._logger = logging.getLogger(LOGGER_NAME)
+        self._customs = {}  # string -> string hash
+        self._next_url = None
+        self._response_hook = response_hook
 
-    def order_by(self, order_by):
-        """Sets the ordering expressions."""
-        self._order_by = order_by
-        return self
+    @property
+    def handler(self):
+        """Getter for handler"""
+        return self._handler
 
-    def select(self, select):
-        """Sets the selection clauses."""
+    def get_path(self):
+        """Get path of the HTTP request"""
+        # pylint: disable=no-self-use
+        return ''
+
+    def get_query_params(self):
+        """Get query params"""
+        # pylint: disable=no-self-use
+        return dict(self._customs)
+
+    def get_method(self):
+        """Get HTTP method"""
+        # pylint: disable=no-self-use
+        return 'GET'
+
+    def get_body(self):
+        """Get HTTP body or None if not applicable"""
+        # pylint: disable=no-self-use
+        return None
+
+    def get_payload(self):
+        """Get HTTP body in the form passed to the connection or None if not applicable"""
+        return self.get_body()
+
+    def get_async_payload(self):
+        """Get HTTP body in the form passed to the asynchronous connection or None if not applicable"""
+        return self.get_payload()
+
+    def get_default_headers(self):
+        """Get dict of Child specific HTTP headers"""
+        # pylint: disable=no-self-use
+        return dict()
+
+    def get_max_url_length(self):
+        """Get length of URL above which GET request is sent wrapped in $batch
+           or None if the URL length is not limited
+        """
+        # pylint: disable=no-self-use
+        return None
+
+    def get_headers(self):
+        """Get dict of HTTP headers which is union of return value
+           of the method get_default_headers() and the headers
+           added via the method add_headers() where the latter
+           headers have priority - same keys get value of the latter.
+        """
+
+        headers = self.get_default_headers()
+        headers.update(self._headers)
+
+        return headers
+
+    def add_headers(self, value):
+        """Add the give dictionary of HTTP headers to
+           HTTP request sent by this ODataHttpRequest instance.
+        """
+
+        if not isinstance(value, dict):
+            raise TypeError(f"Headers must be of type 'dict' not {type(value)}")
+
+        self._headers.update(value)
+
+    def _build_request(self, asynchronous=False):
+        if self._next_url:
+            parsed_next = urlparse(self._next_url)
+            parsed_base = urlparse(self._url)
+            if (parsed_next.scheme, parsed_next.netloc) != (parsed_base.scheme, parsed_base.netloc):
+                raise PyODataException(
+                    f'cross-origin __next URL rejected: {self._next_url!r} differs from '
+                    f'service root {self._url!r}'
+                )
+            url = self._next_url
+        else:
+            url = urljoin(self._url, self.get_path())
+        # pylint: disable=assignment-from-none
+        body = self.get_async_payload() if asynchronous else self.get_payload()
+
+        headers = self.get_headers()
+
+        self._logger.debug('Send (execute) %s request to %s', self.get_method(), url)
+        self._logger.debug('  query params: %s', self.get_query_params())
+        self._logger.debug('  headers: %s', headers)
+        if body:
+            self._logger.debug('  body: %s', body)
+
+        params = self.get_query_params()
+
+        return url, body, headers, params
+
+    def _tunnel(self, url, params):
+        """Returns BatchRequest wrapping this GET request if its URL exceeds
+           get_max_url_length(), otherwise None. The batch request returns
+           the result of the handler of this request.
+        """
+
+        # pylint: disable=assignment-from-none
+        max_url_length = self.get_max_url_length()
+        if max_url_length is None or self._next_url or self.get_method() != 'GET':
+            return None
+
+        url_length = len(url)
+        if params:
+            url_length += len(urlencode(params)) + 1
+
+        if url_length <= max_url_length:
+            return None
+
+        self._logger.info('Tunneling GET request to %s through $batch, URL length: %d', url, url_length)
+
+        def tunnel_handler(batch, parts):
+            # pylint: disable=unused-argument
+            return self._call_handler(parts[0][0])
+
+        batch = BatchRequest(self._url, self._connection, tunnel_handler)
+        batch.add_request(self)
+        return batch
+
+    async def async_execute(self):
+        """Fetches HTTP response and returns processed result
+
+                  Sends the query-request to the OData service, returning a client-side Enumerable for
+                  subsequent in-memory operations.
+
+                  Fetches HTTP response and returns processed result"""
+
+        url, body, headers, params = self._build_request(asynchronous=True)
+
+        batch = self._tunnel(url, params)
+        if batch is not None:
+            return await batch.async_execute()
+
+        async with self._connection.request(self.get_method(),
+                                            url,
+                                            headers=headers,
+                                            params=params,
+                                            data=body) as async_response:
+            response = ODataHttpResponse(url=async_response.url,
+                                         headers=async_response.headers,
+                                         status_code=async_response.status,
+                                         content=await async_response.read())
+        return self._call_handler(response)
+
+    def execute(self):
+        """Fetches HTTP response and returns processed result
+
+           Sends the query-request to the OData service, returning a client-side Enumerable for
+           subsequent in-memory operations.
+
+           Fetches HTTP response and returns processed result"""
+
+        url, body, headers, params = self._build_request()
+
+        batch = self._tunnel(url, params)
+        if batch is not None:
+            return batch.execute()
+
+        response = self._connection.request(
+            self.get_method(), url, headers=headers, params=urlencode(params), data=body)
+
+        return self._call_handler(response)
+
+    def _call_handler(self, response):
+        self._log_response(response)
+
+        try:
+            self._logger.debug('  body: %s', response.content.decode('utf-8'))
+        except UnicodeDecodeError:
+            self._logger.debug('  body: <cannot be decoded>')
+
+        self._call_response_hook(response)
+
+        return self._handler(response)
+
+    def _log_response(self, response):
+        self._logger.debug('Received response')
+        self._logger.debug('  url: %s', response.url)
+        self._logger.debug('  headers: %s', response.headers)
+        self._logger.debug('  status code: %d', response.status_code)
+
+    def _call_response_hook(self, response):
+        if self._response_hook is not None:
+            self._response_hook(response)
+
+    def custom(self, name, value):
+        """Adds a custom name-value pair."""
+        # returns QueryRequest
+        self._customs[name] = value
+        return self
+
+
+class EntityGetRequest(ODataHttpRequest):
+    """Used for GET operations of a single entity"""
+
+    # pylint: disable=too-many-instance-attributes
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, handler, entity_key, entity_set_proxy, encode_path=True, shares_result=False):
+        super(EntityGetRequest, self).__init__(entity_set_proxy.service.url, entity_set_proxy.service.connection,
+                                               handler, response_hook=entity_set_proxy.service.response_hook)
+        self._logger = logging.getLogger(LOGGER_NAME)
+        self._entity_key = entity_key
+        self._entity_set_proxy = entity_set_proxy
+        self._shares_result = shares_result
+        self._select = None
+        self._expand = None
+        self._encode_path = encode_path
+        self._revalidated_entity = None
+
+        self._logger.debug('New instance of EntityGetRequest for last segment: %s', self._entity_set_proxy.last_segment)
+
+    @property
+    def shares_result(self):
+        """True if the result of the handler does not depend on the caller
+           so identical requests can be sent once and share the result
+        """
+
+        return self._shares_result
+
+    def nav(self, nav_property):
+        """Navigates to given navigation property and returns the EntitySetProxy"""
+        return self._entity_set_proxy.nav(nav_property, self._entity_key)
+
+    def get_max_url_length(self):
+        return self._entity_set_proxy.service.config['http']['max_url_length']
+
+    def select(self, select):
+        """Specifies a subset of properties to return.
+
+           @param select  a comma-separated list of selection clauses
+        """
         self._select = select
         return self
 
-    def skip(self, skip):
-        """Sets the number of items to skip."""
-        self._skip = skip
-        return self
+    def expand(self, expand):
+        """Specifies related entities to expand inline as part of the response.
+
+           @param expand  a comma-separated list of navigation properties
+        """
+        self._expand = expand
+        return self
+
+    def get_path(self):
+        if self.get_encode_path():
+            return quote(self._entity_set_proxy.last_segment + self._entity_key.to_key_string())
+        return self._entity_set_proxy.last_segment + self._entity_key.to_key_string()
+
+    def get_default_headers(self):
+        return {'Accept': 'application/json'}
+
+    def get_query_params(self):
+        qparams = super(EntityGetRequest, self).get_query_params()
+
+        if self._select is not None:
+            qparams['$select'] = self._select
+
+        if self._expand is not None:
+            qparams['$expand'] = self._expand
+
+        return qparams
+
+    def get_value(self, connection=None):
+        """Returns Value of Media EntityTypes also known as the $value URL suffix."""
+
+        if connection is None:
+            connection = self._connection
+
+        def stream_handler(response):
+            """Returns $value from HTTP Response"""
+
+            if response.status_code != HTTP_CODE_OK:
+                raise HttpError('HTTP GET for $value failed with status code {}'
+                                .format(response.status_code), response)
+
+            return response
+
+        return ODataHttpRequest(
+            urljoin(self._url, self.get_path(), '/$value'),
+            connection,
+            stream_handler)
+
+    def get_encode_path(self):
+        """Getter for encode path flag"""
+        return self._encode_path
+
+    def if_none_match(self, entity):
+        """Sends the request with the header If-None-Match set to the ETag of
+           the given entity proxy and returns the proxy without decoding
+           anything if the service responds 304 Not Modified.
+        """
+
+        handler = self._handler
+
+        def revalidate_handler(response):
+            """Returns the revalidated entity if it has not been modified"""
+
+            if response.status_code == HTTP_CODE_NOT_MODIFIED:
+                self._logger.debug('Entity %s has not been modified', entity.entity_key)
+                return entity
+
+            return handler(response)
+
+        self._revalidated_entity = entity
+        self._handler = revalidate_handler
+
+        if entity.etag is not None:
+            self._headers['If-None-Match'] = entity.etag
+
+        return self
+
+    def _tracked_entity(self):
+        """Returns the entity proxy from the identity map of the service if available
+           and prepares conditional request if the identity map revalidates entities.
+        """
+
+        identity_map = self._entity_set_proxy.service.identity_map
+        if identity_map is None or self._revalidated_entity is not None:
+            return None
+
+        # only requests for whole entities can be answered from memory
+        if self._select is not None or self._expand is not None:
+            return None
+
+        entity = identity_map.get(self._entity_set_proxy.entity_set.name, self._entity_key)
+        if entity is None or not identity_map.revalidate:
+            return entity
+
+        if entity.etag is not None:
+            self.if_none_match(entity)
+
+        return None
+
+    async def async_execute(self):
+        entity = self._tracked_entity()
+        if entity is not None:
+            return entity
+
+        service = self._entity_set_proxy.service
+        if service.coalescer is not None:
+            return await service.coalescer.async_execute(service, self)
+
+        return await super(EntityGetRequest, self).async_execute()
+
+    def execute(self):
+        entity = self._tracked_entity()
+        if entity is not None:
+            return entity
+
+        service = self._entity_set_proxy.service
+        if service.coalescer is not None:
+            return service.coalescer.execute(service, self)
+
+        return super(EntityGetRequest, self).execute()
+
+
+class NavEntityGetRequest(EntityGetRequest):
+    """Used for GET operations of a single entity accessed via a Navigation property"""
+
+    def __init__(self, handler, master_key, entity_set_proxy, nav_property):
+        super(NavEntityGetRequest, self).__init__(handler, master_key, entity_set_proxy)
+
+        self._nav_property = nav_property
+
+    def get_path(self):
+        return f"{super(NavEntityGetRequest, self).get_path()}/{self._nav_property}"
+
+    def _tracked_entity(self):
+        # the key belongs to the master entity, not to the navigation target
+        return None
+
+
+class EntityCreateRequest(ODataHttpRequest):
+    """Used for creating entities (POST operations of a single entity)
+
+       Call execute() to send the create-request to the OData service
+       and get the newly created entity."""
+
+    def __init__(self, url, connection, handler, entity_set, last_segment=None, response_hook=None):
+        super(EntityCreateRequest, self).__init__(url, connection, handler, response_hook=response_hook)
+        self._logger = logging.getLogger(LOGGER_NAME)
+        self._entity_set = entity_set
+        self._entity_type = entity_set.entity_type
+
+        if last_segment is None:
+            self._last_segment = self._entity_set.name
+        else:
+            self._last_segment = last_segment
+
+        self._values = {}
+
+        # get all properties declared by entity type
+        self._type_props = self._entity_type.proprties()
+
+        self._logger.debug('New instance of EntityCreateRequest for entity type: %s on path %s', self._entity_type.name,
+                           self._last_segment)
+
+    def get_path(self):
+        return self._last_segment
+
+    def get_method(self):
+        # pylint: disable=no-self-use
+        return 'POST'
+
+    def _get_body(self):
+        """Recursively builds a dictionary of values where some of the values
+           might be another entities.
+        """
+
+        body = {}
+        for key, val in self._values.items():
+            # The value is either an entity or a scalar
+            if isinstance(val, EntityProxy):
+                body[key] = val._get_body()  # pylint: disable=protected-access
+            else:
+                body[key] = val
+
+        return body
+
+    def get_body(self):
+        return json.dumps(self._get_body())
+
+    def get_default_headers(self):
+        return {'Accept': 'application/json', 'Content-Type': 'application/json', 'X-Requested-With': 'X'}
+
+    @staticmethod
+    def _build_values(entity_type, entity):
+        """Recursively converts a dictionary of values where some of the values
+           might be another entities (navigation properties) into the internal
+           representation.
+        """
+
+        if isinstance(entity, list):
+            return [EntityCreateRequest._build_values(entity_type, item) for item in entity]
+
+        values = {}
+        for key, val in entity.items():
+            try:
+                val = entity_type.proprty(key).to_json(val)
+            except KeyError:
+                try:
+                    nav_prop = entity_type.nav_proprty(key)
+                    val = EntityCreateRequest._build_values(nav_prop.typ, val)
+                except KeyError:
+                    raise PyODataException('Property {} is not declared in {} entity type'.format(
+                        key, entity_type.name))
+
+            values[key] = val
+
+        return values
+
+    def set(self, **kwargs):
+        """Set properties on the new entity."""
+
+        self._logger.info(kwargs)
+
+        # TODO: consider use of attset for setting properties
+        self._values = EntityCreateRequest._build_values(self._entity_type, kwargs)
+
+        return self
+
+
+class EntityDeleteRequest(ODataHttpRequest):
+    """Used for deleting entity (DELETE operations on a single entity)"""
+
+    def __init__(self, url, connection, handler, entity_set, entity_key, encode_path=True, response_hook=None):
+        super(EntityDeleteRequest, self).__init__(url, connection, handler, response_hook=response_hook)
+        self._logger = logging.getLogger(LOGGER_NAME)
+        self._entity_set = entity_set
+        self._entity_key = entity_key
+        self._encode_path = encode_path
+
+        self._logger.debug('New instance of EntityDeleteRequest for entity type: %s', entity_set.entity_type.name)
+
+    def get_path(self):
+        if self.get_encode_path():
+            return quote(self._entity_set.name + self._entity_key.to_key_string())
+        return self._entity_set.name + self._entity_key.to_key_string()
+
+    def get_encode_path(self):
+        """Getter for encode path flag"""
+        return self._encode_path
+
+    def get_method(self):
+        # pylint: disable=no-self-use
+        return 'DELETE'
+
+
+# pylint: disable=too-many-instance-attributes
+class EntityModifyRequest(ODataHttpRequest):
+    """Used for modyfing entities (UPDATE/MERGE operations on a single entity)
+
+       Call execute() to send the update-request to the OData service
+       and get the modified entity."""
+
+    ALLOWED_HTTP_METHODS = ['PATCH', 'PUT', 'MERGE']
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, url, connection, handler, entity_set, entity_key, method="PATCH", encode_path=True,
+                 response_hook=None):
+        super(EntityModifyRequest, self).__init__(url, connection, handler, response_hook=response_hook)
+        self._logger = logging.getLogger(LOGGER_NAME)
+        self._entity_set = entity_set
+        self._entity_type = entity_set.entity_type
+        self._entity_key = entity_key
+        self._encode_path = encode_path
+
+        self._method = method.upper()
+        if self._method not in EntityModifyRequest.ALLOWED_HTTP_METHODS:
+            raise ValueError('The value "{}" is not on the list of allowed Entity Update HTTP Methods: {}'
+                             .format(method, ', '.join(EntityModifyRequest.ALLOWED_HTTP_METHODS)))
+
+        self._values = {}
+
+        # get all properties declared by entity type
+        self._type_props = self._entity_type.proprties()
+
+        self._logger.debug('New instance of EntityModifyRequest for entity type: %s', self._entity_type.name)
+
+    def get_path(self):
+        if self.get_encode_path():
+            return quote(self._entity_set.name + self._entity_key.to_key_string())
+        return self._entity_set.name + self._entity_key.to_key_string()
+
+    def get_method(self):
+        # pylint: disable=no-self-use
+        return self._method
+
+    def get_body(self):
+        # pylint: disable=no-self-use
+        body = {}
+        for key, val in self._values.items():
+            body[key] = val
+        return json.dumps(body)
+
+    def get_default_headers(self):
+        return {'Accept': 'application/json', 'Content-Type': 'application/json'}
+
+    def get_encode_path(self):
+        """Getter for encode path flag"""
+        return self._encode_path
+
+    def set(self, **kwargs):
+        """Set properties to be changed."""
+
+        self._logger.info(kwargs)
+
+        for key, val in kwargs.items():
+            try:
+                val = self._entity_type.proprty(key).to_json(val)
+            except KeyError:
+                raise PyODataException(
+                    f'Property {key} is not declared in {self._entity_type.name} entity type')
+
+            self._values[key] = val
+
+        return self
+
+
+class QueryRequest(ODataHttpRequest):
+    """INTERFACE A consumer-side query-request builder. Call execute() to issue the request."""
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, url, connection, handler, last_segment, response_hook=None):
+        super(QueryRequest, self).__init__(url, connection, handler, response_hook=response_hook)
+
+        self._logger = logging.getLogger(LOGGER_NAME)
+        self._count = None
+        self._inlinecount = None
+        self._top = None
+        self._skip = None
+        self._order_by = None
+        self._filter = None
+        self._select = None
+        self._expand = None
+        self._last_segment = last_segment
+        self._logger.debug('New instance of QueryRequest for last segment: %s', self._last_segment)
+
+    def count(self, inline=False):
+        """Sets a flag to return the number of items. Can be inline with results or just the count."""
+        if inline:
+            self._inlinecount = True
+        else:
+            self._count = True
+        return self
+
+    def next_url(self, next_url):
+        """
+        Sets URL which identifies the next partial set of entities from the originally identified complete set. Once
+        set, this URL takes precedence over all query parameters.
+
+        For details, see section "6. Representing Collections of Entries" on
+        https://www.odata.org/documentation/odata-version-2-0/json-format/
+        """
+        self._next_url = next_url
+        return self
+
+    def expand(self, expand):
+        """Sets the expand expressions."""
+        self._expand = expand
+        return self
+
+    def filter(self, filter_val):
+        """Sets the filter expression."""
+        # returns QueryRequest
+        self._filter = str(filter_val) if isinstance(filter_val, FilterNode) else filter_val
+        return self
+
+    def filter_tree(self):
+        """Returns the filter expression parsed to the tree of FilterNode
+           objects or None if the request is not filtered
+        """
+
+        if self._filter is None:
+            return None
+
+        return parse_filter(self._filter)
+
+    def normalize_filter(self):
+        """Replaces the filter expression by its simplified canonical form"""
+
+        if self._filter is not None:
+            self._filter = parse_filter(self._filter).canonical_key()
+
+        return self
+
+    # def nav(self, key_value, nav_property):
+    #    """Navigates to a referenced collection using a collection-valued navigation property."""
+    #    # returns QueryRequest
+    #    raise NotImplementedError
+
+    def order_by(self, order_by):
+        """Sets the ordering expressions."""
+        self._order_by = order_by
+        return self
+
+    def select(self, select):
+        """Sets the selection clauses."""
+        self._select = select
+        return self
+
+    def skip(self, skip):
+        """Sets the number of items to skip."""
+        self._skip = skip
+        return self
+
+    def top(self, top):
+        """Sets the number of items to return."""
+        self._top = top
+        return self
+
+    def get_path(self):
+        if self._count:
+            return urljoin(self._last_segment, '/$count')
+
+        return self._last_segment
+
+    def get_default_headers(self):
+        if self._count:
+            return {}
+
+        return {
+            'Accept': 'application/json',
+        }
+
+    def get_query_params(self):
+        if self._next_url:
+            return {}
+
+        qparams = super(QueryRequest, self).get_query_params()
+
+        if self._top is not None:
+            qparams['$top'] = self._top
+
+        if self._skip is not None:
+            qparams['$skip'] = self._skip
+
+        if self._order_by is not None:
+            qparams['$orderby'] = self._order_by
+
+        if self._filter is not None:
+            qparams['$filter'] = self._filter
+
+        if self._select is not None:
+            qparams['$select'] = self._select
+
+        if self._expand is not None:
+            qparams['$expand'] = self._expand
+
+        if self._inlinecount:
+            qparams['$inlinecount'] = 'allpages'
+
+        return qparams
+
+
+class FunctionRequest(QueryRequest):
+    """Function import request (Service call)"""
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, url, connection, handler, function_import, response_hook=None, max_url_length=None):
+        super(FunctionRequest, self).__init__(
+            url, connection, handler, function_import.name,
+            response_hook=response_hook)
+
+        self._function_import = function_import
+        self._max_url_length = max_url_length
+
+        self._logger.debug('New instance of FunctionRequest for %s', self._function_import.name)
+
+    def parameter(self, name, value):
+        '''Sets value of parameter.'''
+
+        # check if param is valid (is declared in metadata)
+        try:
+            param = self._function_import.get_parameter(name)
+
+            # add parameter as custom query argument
+            self.custom(param.name, param.to_literal(value))
+        except KeyError:
+            raise PyODataException('Function import {0} does not have pararmeter {1}'
+                                   .format(self._function_import.name, name))
+
+        return self
+
+    def get_method(self):
+        return self._function_import.http_method
+
+    def get_max_url_length(self):
+        return self._max_url_length
+
+    def get_default_headers(self):
+        return {
+            'Accept': 'application/json'
+        }
+
+
+# pylint: disable=too-many-instance-attributes
+class EntityProxy:
+    """An immutable OData entity instance, consisting of an identity (an
+       entity-set and a unique entity-key within that set), properties (typed,
+       named values), and links (references to other entities).
+    """
+
+    # pylint: disable=too-many-branches,too-many-nested-blocks,too-many-statements
+
+    def __init__(self, service, entity_set, entity_type, proprties=None, entity_key=None, etag=None):
+        self._accessed = None
+        self._logger = logging.getLogger(LOGGER_NAME)
+        self._service = service
+        self._entity_set = entity_set
+        self._entity_type = entity_type
+        self._key_props = entity_type.key_proprties
+        self._cache = dict()
+        self._entity_key = entity_key
+        self._etag = etag
+
+        self._logger.debug('New entity proxy instance of type %s from properties: %s', entity_type.name, proprties)
+
+        # cache values of individual properties if provided
+        if proprties is not None:
+
+            etag_body = proprties.get('__metadata', dict()).get('etag', None)
+            if etag is not None and etag_body is not None and etag_body != etag:
+                raise PyODataException('Etag from header does not match the Etag from response body')
+
+            if etag_body is not None:
+                self._etag = etag_body
+
+            # first, cache values of direct properties
+            self._cache_proprties(proprties)
+
+            # then, assign all navigation properties
+            for prop in self._entity_type.nav_proprties:
+
+                if prop.name in proprties:
+
+                    # entity type of navigation property
+                    prop_etype = prop.to_role.entity_type
+
+                    # expanded entities are tracked by the identity map only when their entity set is known
+                    prop_eset = None
+                    if service.identity_map is not None:
+                        prop_eset = self._nav_entity_set(prop)
+
+                    # cache value according to multiplicity
+                    if prop.to_role.multiplicity in \
+                            [model.EndRole.MULTIPLICITY_ONE,
+                             model.EndRole.MULTIPLICITY_ZERO_OR_ONE]:
+
+                        # cache None in case we receive nothing (null) instead of entity data
+                        if proprties[prop.name] is None:
+                            self._cache[prop.name] = None
+                        else:
+                            self._cache[prop.name] = service.entity_identity(
+                                EntityProxy(service, prop_eset, prop_etype, proprties[prop.name]))
+
+                    elif prop.to_role.multiplicity == model.EndRole.MULTIPLICITY_ZERO_OR_MORE:
+                        # default value is empty array
+                        self._cache[prop.name] = []
+
+                        # if there are no entities available, received data consists of
+                        # metadata properties only.
+                        if 'results' in proprties[prop.name]:
+                            # available entities are serialized in results array
+                            for entity in proprties[prop.name]['results']:
+                                self._cache[prop.name].append(service.entity_identity(
+                                    EntityProxy(service, prop_eset, prop_etype, entity)))
+                        elif isinstance(proprties[prop.name], list):
+                            for entity in proprties[prop.name]:
+                                self._cache[prop.name].append(service.entity_identity(
+                                    EntityProxy(service, prop_eset, prop_etype, entity)))
+                    else:
+                        raise PyODataException('Unknown multiplicity {0} of association role {1}'
+                                               .format(prop.to_role.multiplicity, prop.to_role.name))
+
+        # build entity key if not provided
+        if self._entity_key is None:
+            # try to build key from available property values
+            try:
+                # if key seems to be simple (consists of single property)
+                if len(self._key_props) == 1:
+                    self._entity_key = EntityKey(entity_type, self._cache[self._key_props[0].name])
+                else:
+                    # build complex key
+                    self._entity_key = EntityKey(entity_type, **self._cache)
+            except KeyError:
+                pass
+            except PyODataException:
+                pass
+
+    def __repr__(self):
+        return self._entity_key.to_key_string()
+
+    def _cache_proprties(self, proprties):
+        """Caches values of direct properties available in the JSON data"""
+
+        for type_proprty in self._entity_type.proprties():
+            if type_proprty.name in proprties:
+                # Property value available
+                if proprties[type_proprty.name] is not None:
+                    self._cache[type_proprty.name] = type_proprty.from_json(proprties[type_proprty.name])
+                    continue
+                # Property value missing and user wants a type specific default value filled in
+                if not self._service.retain_null:
+                    # null value is in literal form for now, convert it to python representation
+                    self._cache[type_proprty.name] = type_proprty.from_literal(type_proprty.typ.null_value)
+                    continue
+                # Property is nullable - save it as such
+                if type_proprty.nullable:
+                    self._cache[type_proprty.name] = None
+                    continue
+                raise PyODataException(f'Value of non-nullable Property {type_proprty.name} is null')
+
+    def _unloaded_proprties(self, names=None):
+        """Returns names of the properties (all if names are not given) which values are not cached"""
+
+        if not names:
+            names = [proprty.name for proprty in self._entity_type.proprties()]
+
+        return [name for name in names if name not in self._cache]
+
+    def _nav_entity_set(self, navigation_property):
+        """Returns the entity set of the navigation property target or None"""
+
+        try:
+            return self._service.navigation_routes.route(self._entity_type, navigation_property.name).entity_set
+        except KeyError:
+            return None
+
+    def __getattr__(self, attr):
+        if self._accessed is not None:
+            self._accessed.add(attr)
+
+        try:
+            return self._cache[attr]
+        except KeyError:
+            if self._load_all_on_miss(attr):
+                self.load()
+                if attr in self._cache:
+                    return self._cache[attr]
+
+            try:
+                value = self.get_proprty(attr).execute()
+                self._cache[attr] = value
+                return value
+            except KeyError as ex:
+                raise AttributeError('EntityType {0} does not have Property {1}: {2}'
+                                     .format(self._entity_type.name, attr, str(ex)))
+
+    async def async_getattr(self, attr):
+        """Get cached value of attribute or do async call to service to recover attribute value"""
+        if self._accessed is not None:
+            self._accessed.add(attr)
+
+        try:
+            return self._cache[attr]
+        except KeyError:
+            if self._load_all_on_miss(attr):
+                await self.async_load()
+                if attr in self._cache:
+                    return self._cache[attr]
+
+            try:
+                value = await self.get_proprty(attr).async_execute()
+                self._cache[attr] = value
+                return value
+            except KeyError as ex:
+                raise AttributeError('EntityType {0} does not have Property {1}: {2}'
+                                     .format(self._entity_type.name, attr, str(ex)))
+
+    def _load_all_on_miss(self, attr):
+        """Returns True if the missing attribute shall be loaded together with all not loaded properties"""
+
+        return self._service.config['entity']['load_all_on_miss'] and self._entity_set is not None \
+            and self._entity_type.has_proprty(attr)
+
+    def load(self, *names):
+        """Fetches values of the properties (all not loaded properties if no
+           names are given) which are not cached yet by one request with
+           $select and returns this proxy.
+        """
+
+        unloaded = self._unloaded_proprties(names)
+        if unloaded:
+            self.get_proprties(*unloaded).execute()
+
+        return self
+
+    async def async_load(self, *names):
+        """Fetches values of the properties (all not loaded properties if no
+           names are given) which are not cached yet by one async request
+           with $select and returns this proxy.
+        """
+
+        unloaded = self._unloaded_proprties(names)
+        if unloaded:
+            await self.get_proprties(*unloaded).async_execute()
+
+        return self
+
+    def nav(self, nav_property):
+        """Navigates to given navigation property and returns the EntitySetProxy"""
+
+        # for now duplicated with simillar method in entity set proxy class
+        route = self._service.navigation_routes.resolve(self._entity_type, nav_property)
+
+        if route.multiplicity != model.EndRole.MULTIPLICITY_ZERO_OR_MORE:
+            return self._get_nav_entity(nav_property, route.entity_set)
+
+        return EntitySetProxy(
+            self._service,
+            route.entity_set,
+            nav_property,
+            self._entity_set.name + self._entity_key.to_key_string())
+
+    def _get_nav_entity(self, nav_property, navigation_entity_set):
+        """Get entity based on Navigation property name"""
+
+        def get_entity_handler(parent, nav_property, navigation_entity_set, response):
+            """Gets entity from HTTP response"""
+
+            if response.status_code != HTTP_CODE_OK:
+                raise HttpError('HTTP GET for Entity {0} failed with status code {1}'
+                                .format(self._name, response.status_code), response)
+
+            entity = response.json()['d']
+
+            return NavEntityProxy(parent, nav_property, navigation_entity_set.entity_type, entity)
+
+        self._logger.info(
+            'Getting the nav property %s of the entity %s for the key %s',
+            nav_property,
+            self._entity_set,
+            self.entity_key)
+
+        return NavEntityGetRequest(
+            partial(get_entity_handler, self, nav_property, navigation_entity_set),
+            self.entity_key,
+            getattr(self._service.entity_sets, self.entity_set.name),
+            nav_property)
+
+    def refresh(self):
+        """Returns request fetching the current state of this entity
+
+           The request is conditional if the entity has ETag, so the service
+           can respond 304 Not Modified and this very proxy is returned.
+        """
+
+        if self._entity_set is None:
+            raise PyODataException(f'Entity {self._entity_type.name} without entity set cannot be refreshed')
+
+        request = getattr(self._service.entity_sets, self._entity_set.name).get_entity(self._entity_key)
+
+        return request.if_none_match(self)
+
+    def get_path(self):
+        """Returns this entity's relative path - e.g. EntitySet(KEY)"""
+
+        return self._entity_set._name + self._entity_key.to_key_string()  # pylint: disable=protected-access
+
+    def get_proprty(self, name, connection=None):
+        """Returns value of the property"""
+
+        self._logger.info('Initiating property request for %s', name)
+
+        def proprty_get_handler(key, proprty, response):
+            """Gets property value from HTTP Response"""
+
+            if response.status_code != HTTP_CODE_OK:
+                raise HttpError('HTTP GET for Attribute {0} of Entity {1} failed with status code {2}'
+                                .format(proprty.name, key, response.status_code), response)
+
+            data = response.json()['d']
+            return proprty.from_json(data[proprty.name])
+
+        path = urljoin(self.get_path(), name)
+        return self._service.http_get_odata(
+            path,
+            partial(proprty_get_handler, path, self._entity_type.proprty(name)),
+            connection=connection)
+
+    def _get_request(self, handler):
+        """Returns GET request for this entity"""
+
+        if self._entity_set is None:
+            raise PyODataException(f'Entity {self._entity_type.name} without entity set cannot be requested')
+
+        return EntityGetRequest(handler, self._entity_key, getattr(self._service.entity_sets, self._entity_set.name))
+
+    def get_proprties(self, *names):
+        """Returns request fetching values of the properties by one request
+           with $select and caching them in this proxy
+
+           The request returns this proxy.
+        """
+
+        for name in names:
+            if not self._entity_type.has_proprty(name):
+                raise PyODataException(f'Property {name} is not declared in {self._entity_type.name} entity type')
+
+        self._logger.info('Initiating properties request for %s', ', '.join(names))
+
+        def proprties_get_handler(response):
+            """Caches property values from HTTP Response"""
+
+            if response.status_code != HTTP_CODE_OK:
+                raise HttpError(f'HTTP GET for Properties {", ".join(names)} of Entity {self.get_path()} '
+                                f'failed with status code {response.status_code}', response)
+
+            self._cache_proprties(response.json()['d'])
+            return self
+
+        return self._get_request(proprties_get_handler).select(','.join(names))
+
+    def get_value(self, connection=None):
+        "Returns $value of Stream entities"
+
+        def value_get_handler(key, response):
+            """Gets property value from HTTP Response"""
+
+            if response.status_code != HTTP_CODE_OK:
+                raise HttpError('HTTP GET for $value of Entity {0} failed with status code {1}'
+                                .format(key, response.status_code), response)
+
+            return response
+
+        path = urljoin(self.get_path(), '/$value')
+        return self._service.http_get_odata(path,
+                                            partial(value_get_handler, self.entity_key),
+                                            connection=connection)
+
+    @property
+    def entity_set(self):
+        """Entity set related to this entity"""
+
+        return self._entity_set
+
+    @property
+    def entity_key(self):
+        """Key of entity"""
+
+        return self._entity_key
+
+    @property
+    def url(self):
+        """URL of the real entity"""
+
+        service_url = self._service.url.rstrip('/')
+        entity_path = self.get_path()
+
+        return urljoin(service_url, entity_path)
+
+    @property
+    def etag(self):
+        """ETag generated by service"""
+        return self._etag
+
+    def equals(self, other):
+        """Returns true if the self and the other contains the same data"""
+        # pylint: disable=W0212
+        return self._cache == other._cache
+
+
+class NavEntityProxy(EntityProxy):
+    """Special case of an Entity access via 1 to 1 Navigation property"""
+
+    def __init__(self, parent_entity, prop_name, entity_type, entity):
+        # pylint: disable=protected-access
+        super(NavEntityProxy, self).__init__(parent_entity._service, parent_entity._entity_set, entity_type, entity)
+
+        self._parent_entity = parent_entity
+        self._prop_name = prop_name
+
+    def get_path(self):
+        """Returns URL of the entity"""
+
+        return urljoin(self._parent_entity.get_path(), self._prop_name)
+
+    def _get_request(self, handler):
+        # pylint: disable=protected-access
+        parent = self._parent_entity
+
+        if parent._entity_set is None:
+            raise PyODataException(f'Entity {self._entity_type.name} without entity set cannot be requested')
+
+        return NavEntityGetRequest(handler, parent._entity_key,
+                                   getattr(self._service.entity_sets, parent._entity_set.name), self._prop_name)
+
+
+class GetEntitySetFilter:
+    """Create filters for humans"""
+
+    def __init__(self, proprty):
+        self._proprty = proprty
+
+    @staticmethod
+    def build_expression(operator, operands):
+        """Creates a expression by joining the operands with the operator"""
+
+        if len(operands) < 2:
+            raise ExpressionError('The $filter operator \'{}\' needs at least two operands'.format(operator))
+
+        return f"({' {} '.format(operator).join(operands)})"
+
+    @staticmethod
+    def and_(*operands):
+        """Creates logical AND expression from the operands"""
+
+        return GetEntitySetFilter.build_expression('and', operands)
+
+    @staticmethod
+    def or_(*operands):
+        """Creates logical OR expression from the operands"""
+
+        return GetEntitySetFilter.build_expression('or', operands)
+
+    @staticmethod
+    def format_filter(proprty, operator, value):
+        """Creates a filter expression """
+
+        return f'{proprty.name} {operator} {proprty.to_literal(value)}'
+
+    def __eq__(self, value):
+        return GetEntitySetFilter.format_filter(self._proprty, 'eq', value)
+
+    def __ne__(self, value):
+        return GetEntitySetFilter.format_filter(self._proprty, 'ne', value)
+
+    def __lt__(self, value):
+        return GetEntitySetFilter.format_filter(self._proprty, 'lt', value)
+
+    def __le__(self, value):
+        return GetEntitySetFilter.format_filter(self._proprty, 'le', value)
+
+    def __ge__(self, value):
+        return GetEntitySetFilter.format_filter(self._proprty, 'ge', value)
+
+    def __gt__(self, value):
+        return GetEntitySetFilter.format_filter(self._proprty, 'gt', value)
+
+
+class FilterExpression:
+    """A class representing named expression of OData $filter"""
+
+    def __init__(self, **kwargs):
+        self._expressions = kwargs
+        self._other = None
+        self._operator = None
+
+    @property
+    def expressions(self):
+        """Get expressions where key is property name with the operator suffix
+           and value is the left hand side operand.
+        """
+
+        return self._expressions.items()
+
+    @property
+    def other(self):
+        """Get an instance of the other operand"""
+
+        return self._other
+
+    @property
+    def operator(self):
+        """The other operand"""
+
+        return self._operator
+
+    def __or__(self, other):
+        if self._other is not None:
+            raise RuntimeError('The FilterExpression already initialized')
+
+        self._other = other
+        self._operator = "or"
+        return self
+
+    def __and__(self, other):
+        if self._other is not None:
+            raise RuntimeError('The FilterExpression already initialized')
+
+        self._other = other
+        self._operator = "and"
+        return self
+
+
+class GetEntitySetFilterChainable:
+    """
+    Example expressions
+        FirstName='Tim'
+        FirstName__contains='Tim'
+        Age__gt=56
+        Age__gte=6
+        Age__lt=78
+        Age__lte=90
+        Age__range=(5,9)
+        FirstName__in=['Tim', 'Bob', 'Sam']
+        FirstName__startswith='Tim'
+        FirstName__endswith='mothy'
+        Addresses__Suburb='Chatswood'
+        Addresses__Suburb__contains='wood'
+    """
+
+    OPERATORS = [
+        'startswith',
+        'endswith',
+        'lt',
+        'lte',
+        'gt',
+        'gte',
+        'contains',
+        'range',
+        'in',
+        'length',
+        'eq'
+    ]
+
+    # (prefix, suffix) of literals of values of operators
+    TEMPLATES = {
+        'lt': ('{field} lt ', ''),
+        'lte': ('{field} le ', ''),
+        'gt': ('{field} gt ', ''),
+        'gte': ('{field} ge ', ''),
+        'eq': ('{field} eq ', ''),
+        'startswith': ('startswith({field}, ', ') eq true'),
+        'endswith': ('endswith({field}, ', ') eq true'),
+        'contains': ('substringof(', ', {field}) eq true'),
+    }
+
+    # compiled lookups by entity type, keyed by lookup keywords and by (field, operator)
+    _compiled = weakref.WeakKeyDictionary()
+
+    def __init__(self, entity_type, filter_expressions, exprs):
+        self._entity_type = entity_type
+        self._filter_expressions = filter_expressions
+        self._expressions = exprs
+        self._lookups = self._compiled_lookups(entity_type)
+
+    @staticmethod
+    def _compiled_lookups(entity_type):
+        """Returns the cache of functions rendering lookups of the entity type"""
+
+        try:
+            return GetEntitySetFilterChainable._compiled[entity_type]
+        except KeyError:
+            return GetEntitySetFilterChainable._compiled.setdefault(entity_type, {})
+
+    @property
+    def expressions(self):
+        """Get expressions as a list of tuples where the first item
+           is a property name with the operator suffix and the second item
+           is a left hand side value.
+        """
+
+        return self._expressions.items()
+
+    def proprty_obj(self, name):
+        """Returns a model property for a particular property"""
+
+        return self._entity_type.proprty(name)
+
+    def _decode_and_combine_filter_expression(self, filter_expression):
+        filter_expressions = [self._decode_expression(expr, val) for expr, val in filter_expression.expressions]
+        return self._combine_expressions(filter_expressions)
+
+    def _process_query_objects(self):
+        """Processes FilterExpression objects to OData lookups"""
+
+        filter_expressions = []
+
+        for expr in self._filter_expressions:
+            lhs_expressions = self._decode_and_combine_filter_expression(expr)
+
+            if expr.other is not None:
+                rhs_expressions = self._decode_and_combine_filter_expression(expr.other)
+                filter_expressions.append(f'({lhs_expressions}) {expr.operator} ({rhs_expressions})')
+            else:
+                filter_expressions.append(lhs_expressions)
+
+        return filter_expressions
+
+    def _process_expressions(self):
+        filter_expressions = [self._decode_expression(expr, val) for expr, val in self.expressions]
+
+        filter_expressions.extend(self._process_query_objects())
+
+        return filter_expressions
+
+    def _decode_expression(self, expr, val):
+        try:
+            render = self._lookups[expr]
+        except KeyError:
+            render = self._lookups.setdefault(expr, self._compile_lookup(*self.parse_lookup(expr)))
+
+        return render(val)
+
+    def parse_lookup(self, expr):
+        """Returns the pair (property name, operator) of the lookup
+           like FirstName__contains or raises ValueError.
+        """
+
+        field = None
+        # field_heirarchy = []
+        operator = 'eq'
+        exprs = expr.split('__')
+
+        for part in exprs:
+            if self._entity_type.has_proprty(part):
+                field = part
+                # field_heirarchy.append(part)
+            elif part in self.__class__.OPERATORS:
+                operator = part
+            else:
+                raise ValueError(f'"{part}" is not a valid property or operator')
+        # field = '/'.join(field_heirarchy)
+
+        return field, operator
+
+    # pylint: disable=no-self-use
+    def _combine_expressions(self, expressions):
+        return ' and '.join(expressions)
+
+    def build_lookup(self, field_name, operator, value):
+        """Renders the $filter expression of the lookup parsed by parse_lookup"""
+
+        return self.lookup_renderer(field_name, operator)(value)
+
+    def lookup_renderer(self, field_name, operator):
+        """Returns cached function rendering the $filter expression of the lookup
+           parsed by parse_lookup for a value
+        """
+
+        key = (field_name, operator)
+        try:
+            return self._lookups[key]
+        except KeyError:
+            return self._lookups.setdefault(key, self._compile_lookup(field_name, operator))
+
+    def _compile_lookup(self, field_name, operator):
+        """Returns function rendering the $filter expression of the lookup for a value"""
+
+        to_literal = self.proprty_obj(field_name).to_literal
+
+        try:
+            prefix, suffix = self.__class__.TEMPLATES[operator]
+        except KeyError:
+            pass
+        else:
+            prefix = prefix.format(field=field_name)
+            suffix = suffix.format(field=field_name)
+
+            def render_template(value):
+                return prefix + to_literal(value) + suffix
+
+            return render_template
+
+        if operator == 'length':
+            def render_length(value):
+                return f'length({field_name}) eq {int(value)}'
+
+            return render_length
+
+        if operator == 'range':
+            def render_range(value):
+                if not isinstance(value, (tuple, list)):
+                    raise TypeError(f'Range must be tuple or list not {type(value)}')
+
+                if len(value) != 2:
+                    raise ValueError('Only two items can be passed in a range.')
+
+                return f'{field_name} gte {to_literal(value[0])} and {field_name} lte {to_literal(value[1])}'
+
+            return render_range
+
+        if operator == 'in':
+            prefix = f'{field_name} eq '
+
+            def render_in(value):
+                expression = ' or '.join(prefix + to_literal(item) for item in value)
+                # the expressions of lookups are joined by 'and' which takes precedence over 'or'
+                return f'({expression})' if len(value) > 1 else expression
+
+            return render_in
+
+        raise ValueError(f'Invalid expression {operator}')
+
+    def __str__(self):
+        expressions = self._process_expressions()
+        result = self._combine_expressions(expressions)
+        return result
+
+
+class FilterNode:
+    """Node of the abstract syntax tree of OData $filter expression
+
+       str() of a node renders the expression with the minimal number of
+       parentheses. The tree is created by parse_filter() from $filter
+       strings of all the filter builders as well as from raw strings.
+    """
+
+    # binding power of operators, the higher number binds stronger
+    PRECEDENCE = 8
+
+    def __str__(self):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({str(self)!r})'
+
+    def __eq__(self, other):
+        return isinstance(other, FilterNode) and str(self) == str(other)
+
+    def __hash__(self):
+        return hash(str(self))
+
+    @property
+    def children(self):
+        """Child nodes of this node"""
+
+        return ()
+
+    def members(self):
+        """Returns the set of property paths referenced in the expression"""
+
+        result = set()
+        for child in self.children:
+            result.update(child.members())
+
+        return result
+
+    def simplify(self):
+        """Returns the equivalent normalized expression with folded constants,
+           merged range predicates and deduplicated and sorted operands
+           of logical operators
+        """
+
+        return self
+
+    def canonical_key(self):
+        """Returns the string of the normalized expression which is equal for
+           equivalent expressions differing in order or duplication of terms
+        """
+
+        return str(self.simplify())
+
+    def _render_child(self, child, right=False):
+        text = str(child)
+        if child.PRECEDENCE < self.PRECEDENCE or (right and child.PRECEDENCE == self.PRECEDENCE):
+            return f'({text})'
+
+        return text
+
+
+class FilterLiteral(FilterNode):
+    """Literal of $filter expression
+
+       kind is one of 'null', 'boolean', 'number', 'string' or the prefix of
+       typed literals like 'datetime' or 'guid' whose value is the text.
+    """
+
+    def __init__(self, kind, value, text):
+        self.kind = kind
+        self.value = value
+        self.text = text
+
+    def __str__(self):
+        return self.text
+
+    @staticmethod
+    def from_bool(value):
+        """Creates boolean literal"""
+
+        return FilterLiteral('boolean', value, 'true' if value else 'false')
+
+    @property
+    def number_suffix(self):
+        """Type suffix of number literals like M in 1.5M"""
+
+        if self.kind == 'number' and self.text[-1].isalpha():
+            return self.text[-1]
+
+        return ''
+
+
+class FilterMember(FilterNode):
+    """Property path of $filter expression"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __str__(self):
+        return self.path
+
+    def members(self):
+        return {self.path}
+
+
+class FilterFunctionCall(FilterNode):
+    """Call of function like substringof or startswith in $filter expression"""
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = tuple(args)
+
+    def __str__(self):
+        return f"{self.name}({', '.join(str(arg) for arg in self.args)})"
+
+    @property
+    def children(self):
+        return self.args
+
+    def simplify(self):
+        return FilterFunctionCall(self.name, [arg.simplify() for arg in self.args])
+
+
+class FilterNot(FilterNode):
+    """Logical negation of $filter expression"""
+
+    PRECEDENCE = 7
+
+    def __init__(self, operand):
+        self.operand = operand
+
+    def __str__(self):
+        return f'not {self._render_child(self.operand)}'
+
+    @property
+    def children(self):
+        return (self.operand,)
+
+    def simplify(self):
+        operand = self.operand.simplify()
+
+        if isinstance(operand, FilterLiteral) and operand.kind == 'boolean':
+            return FilterLiteral.from_bool(not operand.value)
+
+        if isinstance(operand, FilterNot):
+            return operand.operand
+
+        # the negation of eq is ne also for null values
+        if isinstance(operand, FilterBinary) and operand.operator in ('eq', 'ne'):
+            return FilterBinary('ne' if operand.operator == 'eq' else 'eq', operand.left, operand.right)
+
+        return FilterNot(operand)
+
+
+class FilterBinary(FilterNode):
+    """Comparison or arithmetic operation of $filter expression"""
+
+    PRECEDENCES = {
+        'eq': 3, 'ne': 3,
+        'lt': 4, 'le': 4, 'gt': 4, 'ge': 4,
+        'add': 5, 'sub': 5,
+        'mul': 6, 'div': 6, 'mod': 6,
+    }
+
+    COMPARISONS = {
+        'eq': lambda left, right: left == right,
+        'ne': lambda left, right: left != right,
+        'lt': lambda left, right: left < right,
+        'le': lambda left, right: left <= right,
+        'gt': lambda left, right: left > right,
+        'ge': lambda left, right: left >= right,
+    }
+
+    # operators of comparisons with swapped operands
+    MIRRORED = {'eq': 'eq', 'ne': 'ne', 'lt': 'gt', 'le': 'ge', 'gt': 'lt', 'ge': 'le'}
+
+    ARITHMETICS = {
+        'add': lambda left, right: left + right,
+        'sub': lambda left, right: left - right,
+        'mul': lambda left, right: left * right,
+    }
+
+    def __init__(self, operator, left, right):
+        self.operator = operator
+        self.left = left
+        self.right = right
+        self.PRECEDENCE = FilterBinary.PRECEDENCES[operator]  # pylint: disable=invalid-name
+
+    def __str__(self):
+        return f'{self._render_child(self.left)} {self.operator} {self._render_child(self.right, right=True)}'
+
+    @property
+    def children(self):
+        return (self.left, self.right)
+
+    def simplify(self):
+        left = self.left.simplify()
+        right = self.right.simplify()
+        operator = self.operator
+
+        if operator in FilterBinary.MIRRORED and isinstance(left, FilterLiteral) and isinstance(right, FilterMember):
+            left, right, operator = right, left, FilterBinary.MIRRORED[operator]
+
+        if isinstance(left, FilterLiteral) and isinstance(right, FilterLiteral):
+            folded = FilterBinary._fold(operator, left, right)
+            if folded is not None:
+                return folded
+
+        return FilterBinary(operator, left, right)
+
+    @staticmethod
+    def _fold(operator, left, right):
+        if operator in FilterBinary.ARITHMETICS:
+            if left.kind != 'number' or right.kind != 'number' or left.number_suffix != right.number_suffix:
+                return None
+
+            value = FilterBinary.ARITHMETICS[operator](left.value, right.value)
+            return FilterLiteral('number', value, f'{value}{left.number_suffix}')
+
+        if operator not in FilterBinary.COMPARISONS or left.kind != right.kind:
+            return None
+
+        if left.kind in ('number', 'string', 'boolean'):
+            return FilterLiteral.from_bool(FilterBinary.COMPARISONS[operator](left.value, right.value))
+
+        if operator in ('eq', 'ne'):
+            return FilterLiteral.from_bool(FilterBinary.COMPARISONS[operator](left.text, right.text))
+
+        return None
+
+
+class FilterLogical(FilterNode):
+    """Logical conjunction or disjunction of any number of $filter expressions"""
+
+    PRECEDENCES = {'or': 1, 'and': 2}
+
+    def __init__(self, operator, operands):
+        self.operator = operator
+        self.operands = tuple(operands)
+        self.PRECEDENCE = FilterLogical.PRECEDENCES[operator]  # pylint: disable=invalid-name
+
+    def __str__(self):
+        return f' {self.operator} '.join(self._render_child(operand) for operand in self.operands)
+
+    @property
+    def children(self):
+        return self.operands
+
+    def _flatten(self):
+        for operand in self.operands:
+            operand = operand.simplify()
+            if isinstance(operand, FilterLogical) and operand.operator == self.operator:
+                yield from operand.operands
+            else:
+                yield operand
+
+    def simplify(self):
+        absorbing = self.operator == 'or'
+
+        operands = OrderedDict()
+        for operand in self._flatten():
+            if isinstance(operand, FilterLiteral) and operand.kind == 'boolean':
+                if operand.value == absorbing:
+                    return operand
+
+                continue
+
+            operands.setdefault(str(operand), operand)
+
+        operands = list(operands.values())
+        if self.operator == 'and':
+            operands = _merge_range_predicates(operands)
+            if operands is None:
+                return FilterLiteral.from_bool(False)
+
+        if not operands:
+            return FilterLiteral.from_bool(not absorbing)
+
+        if len(operands) == 1:
+            return operands[0]
+
+        return FilterLogical(self.operator, sorted(operands, key=str))
+
+
+def _merge_range_predicates(operands):
+    """Merges comparisons of the same property with number or string literals
+       in operands of logical conjunction to the tightest bounds. Returns None
+       if the conjunction cannot be satisfied.
+    """
+
+    groups = OrderedDict()
+    result = []
+    for operand in operands:
+        if isinstance(operand, FilterBinary) and operand.operator in FilterBinary.COMPARISONS \
+                and isinstance(operand.left, FilterMember) and isinstance(operand.right, FilterLiteral) \
+                and operand.right.kind in ('number', 'string'):
+            groups.setdefault((operand.left.path, operand.right.kind), []).append(operand)
+        else:
+            result.append(operand)
+
+    for comparisons in groups.values():
+        merged = _merge_comparisons(comparisons)
+        if merged is None:
+            return None
+
+        result.extend(merged)
+
+    return result
+
+
+def _merge_comparisons(comparisons):
+    """Returns the tightest comparisons equivalent to the conjunction
+       of comparisons of one property or None if they cannot be satisfied
+    """
+
+    # pylint: disable=too-many-branches
+
+    lower = upper = equal = None
+    not_equal = []
+    for comparison in comparisons:
+        value = comparison.right.value
+        if comparison.operator == 'eq':
+            if equal is not None and equal.right.value != value:
+                return None
+            equal = comparison
+        elif comparison.operator == 'ne':
+            not_equal.append(comparison)
+        elif comparison.operator in ('gt', 'ge'):
+            if lower is None or (value, comparison.operator == 'gt') > (lower.right.value, lower.operator == 'gt'):
+                lower = comparison
+        elif upper is None or (value, comparison.operator == 'le') < (upper.right.value, upper.operator == 'le'):
+            upper = comparison
+
+    if lower is not None and upper is not None and lower.right.value >= upper.right.value:
+        if lower.right.value > upper.right.value or lower.operator == 'gt' or upper.operator == 'lt':
+            return None
+
+        if equal is None:
+            equal = FilterBinary('eq', lower.left, lower.right)
+
+    bounds = [bound for bound in (lower, upper) if bound is not None]
+
+    if equal is not None:
+        value = equal.right.value
+        for comparison in bounds + not_equal:
+            if not FilterBinary.COMPARISONS[comparison.operator](value, comparison.right.value):
+                return None
+
+        return [equal]
+
+    not_equal = [comparison for comparison in not_equal
+                 if all(FilterBinary.COMPARISONS[bound.operator](comparison.right.value, bound.right.value)
+                        for bound in bounds)]
+
+    return bounds + not_equal
+
+
+class FilterParser:
+    """Recursive descent parser of OData $filter expressions"""
+
+    TOKENS = re.compile(r"""
+        (?P<space>\s+)
+        |(?P<typed>(?:datetimeoffset|datetime|time|guid|binary|X)'(?:[^']|'')*')
+        |(?P<string>'(?:[^']|'')*')
+        |(?P<number>-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?[mMdDfFlL]?)
+        |(?P<name>[A-Za-z_][A-Za-z0-9_.]*(?:/[A-Za-z_][A-Za-z0-9_.]*)*)
+        |(?P<punctuation>[(),])
+        """, re.VERBOSE)
+
+    # aliases of operators accepted by the parser
+    ALIASES = {'gte': 'ge', 'lte': 'le'}
+
+    LEVELS = [
+        ('eq', 'ne'),
+        ('lt', 'le', 'gt', 'ge'),
+        ('add', 'sub'),
+        ('mul', 'div', 'mod'),
+    ]
+
+    def __init__(self, text):
+        self._text = text
+        self._tokens = list(self._tokenize(text))
+        self._position = 0
+
+    def _tokenize(self, text):
+        position = 0
+        while position < len(text):
+            match = FilterParser.TOKENS.match(text, position)
+            if match is None:
+                raise ExpressionError(f'Invalid character at position {position} of $filter: {text}')
+
+            position = match.end()
+            if match.lastgroup != 'space':
+                yield match.lastgroup, match.group(), match.start()
+
+    def _peek(self):
+        if self._position < len(self._tokens):
+            return self._tokens[self._position]
+
+        return None, None, len(self._text)
+
+    def _keyword(self, *keywords):
+        """Consumes and returns the next token if it is one of the keywords"""
+
+        kind, value, _ = self._peek()
+        if kind == 'name':
+            value = FilterParser.ALIASES.get(value, value)
+            if value in keywords:
+                self._position += 1
+                return value
+
+        return None
+
+    def _expect(self, punctuation):
+        kind, value, position = self._peek()
+        if kind != 'punctuation' or value != punctuation:
+            raise ExpressionError(f'Expected "{punctuation}" at position {position} of $filter: {self._text}')
+
+        self._position += 1
+
+    def parse(self):
+        """Returns the root FilterNode of the expression"""
+
+        node = self._logical('or')
+
+        _, value, position = self._peek()
+        if value is not None:
+            raise ExpressionError(f'Unexpected "{value}" at position {position} of $filter: {self._text}')
+
+        return node
+
+    def _logical(self, operator):
+        parse_operand = self._and if operator == 'or' else partial(self._binary, 0)
+        operands = [parse_operand()]
+        while self._keyword(operator):
+            operands.append(parse_operand())
+
+        if len(operands) == 1:
+            return operands[0]
+
+        return FilterLogical(operator, operands)
+
+    def _and(self):
+        return self._logical('and')
+
+    def _binary(self, level):
+        if level == len(FilterParser.LEVELS):
+            return self._unary()
+
+        node = self._binary(level + 1)
+        operator = self._keyword(*FilterParser.LEVELS[level])
+        while operator:
+            node = FilterBinary(operator, node, self._binary(level + 1))
+            operator = self._keyword(*FilterParser.LEVELS[level])
+
+        return node
+
+    def _unary(self):
+        if self._keyword('not'):
+            return FilterNot(self._unary())
+
+        return self._primary()
+
+    def _primary(self):
+        kind, value, _ = self._peek()
+        if kind is None:
+            raise ExpressionError(f'Unexpected end of $filter: {self._text}')
+
+        if kind == 'punctuation':
+            self._expect('(')
+            node = self._logical('or')
+            self._expect(')')
+            return node
+
+        self._position += 1
+
+        if kind == 'name':
+            return self._name(value)
+
+        if kind == 'string':
+            return FilterLiteral('string', value[1:-1].replace("''", "'"), value)
+
+        if kind == 'number':
+            number = value.rstrip('mMdDfFlL')
+            if number == value.rstrip('lL') and number.lstrip('-').isdigit():
+                return FilterLiteral('number', int(number), value)
+
+            return FilterLiteral('number', Decimal(number), value)
+
+        prefix = value[:value.index("'")]
+        return FilterLiteral(prefix.lower(), value, value)
+
+    def _name(self, name):
+        if name == 'null':
+            return FilterLiteral('null', None, name)
+
+        if name in ('true', 'false'):
+            return FilterLiteral.from_bool(name == 'true')
+
+        kind, value, _ = self._peek()
+        if kind != 'punctuation' or value != '(':
+            return FilterMember(name)
+
+        self._expect('(')
+        args = []
+        if self._peek()[1] != ')':
+            args.append(self._logical('or'))
+            while self._peek()[1] == ',':
+                self._position += 1
+                args.append(self._logical('or'))
+
+        self._expect(')')
+        return FilterFunctionCall(name, args)
+
+
+def parse_filter(text):
+    """Parses OData $filter string to the tree of FilterNode objects"""
+
+    return FilterParser(text).parse()
+
+
+class EntityProjection:
+    """Typed projection of an entity type onto a dataclass or a NamedTuple
+
+       Every field of the projection type must be named after a property of
+       the entity type. A field named after a navigation property must be
+       annotated with another projection type (or a list of it) and makes
+       the navigation property expanded.
+
+       Null values are decoded the way EntityProxy decodes them - to type
+       specific default values unless retain_null is True.
+
+       Instances are created by the given type, which is not replaced by a
+       slotted one: NamedTuples have no instance dictionary and dataclasses
+       must be declared with slots=True to get slotted instances.
+    """
+
+    def __init__(self, entity_type, projection_type, retain_null=False):
+        self._entity_type = entity_type
+        self._projection_type = projection_type
+        self._retain_null = retain_null
+        self._proprties = []
+        self._nav_proprties = []
+
+        try:
+            hints = typing.get_type_hints(projection_type)
+        except (NameError, TypeError):
+            hints = getattr(projection_type, '__annotations__', {})
+
+        for name in EntityProjection._fields(projection_type):
+            if entity_type.has_proprty(name):
+                self._proprties.append((name, entity_type.proprty(name)))
+                continue
+
+            try:
+                nav_proprty = entity_type.nav_proprty(name)
+            except KeyError:
+                raise PyODataException(
+                    f'Projection {projection_type.__name__} field {name} is not declared in {entity_type.name} '
+                    'entity type')
+
+            nested_type, is_list = EntityProjection._nested_projection_type(hints.get(name))
+            if nested_type is None:
+                raise PyODataException(
+                    f'Projection {projection_type.__name__} field {name} refers to navigation property '
+                    'and must be annotated with a projection type')
+
+            self._nav_proprties.append(
+                (name, EntityProjection(nav_proprty.typ, nested_type, retain_null=retain_null), is_list))
+
+    @staticmethod
+    def _fields(projection_type):
+        """Returns names of fields of the dataclass or the NamedTuple"""
+
+        if dataclasses.is_dataclass(projection_type):
+            return [field.name for field in dataclasses.fields(projection_type)]
+
+        if isinstance(projection_type, type) and issubclass(projection_type, tuple) \
+                and hasattr(projection_type, '_fields'):
+            return list(projection_type._fields)
+
+        raise PyODataException(f'Projection {projection_type} is neither a dataclass nor a NamedTuple')
+
+    @staticmethod
+    def _is_projection_type(hint):
+        if not isinstance(hint, type):
+            return False
+
+        return dataclasses.is_dataclass(hint) or (issubclass(hint, tuple) and hasattr(hint, '_fields'))
+
+    @staticmethod
+    def _nested_projection_type(hint):
+        """Returns the projection type of a navigation field and whether the field is a list"""
+
+        if EntityProjection._is_projection_type(hint):
+            return hint, False
+
+        origin = typing.get_origin(hint)
+        args = [arg for arg in typing.get_args(hint) if arg is not types.NoneType]
+
+        if origin in (list, typing.List) and len(args) == 1:
+            nested_type, _ = EntityProjection._nested_projection_type(args[0])
+            return nested_type, True
+
+        if origin in (typing.Union, types.UnionType) and len(args) == 1:
+            return EntityProjection._nested_projection_type(args[0])
+
+        return None, False
+
+    @property
+    def projection_type(self):
+        """The dataclass or NamedTuple entities are decoded into"""
+
+        return self._projection_type
+
+    @property
+    def select(self):
+        """List of property paths for $select"""
+
+        paths = [name for name, _ in self._proprties]
+        for name, projection, _ in self._nav_proprties:
+            paths.extend(f'{name}/{path}' for path in projection.select)
+
+        return paths
+
+    @property
+    def expand(self):
+        """List of navigation property paths for $expand"""
+
+        paths = []
+        for name, projection, _ in self._nav_proprties:
+            paths.append(name)
+            paths.extend(f'{name}/{path}' for path in projection.expand)
+
+        return paths
+
+    def from_json(self, proprties):
+        """Decodes entity JSON data into an instance of the projection type"""
+
+        values = {}
+        for name, proprty in self._proprties:
+            if name in proprties:
+                values[name] = self._decode_proprty(proprty, proprties[name])
+
+        for name, projection, is_list in self._nav_proprties:
+            if name not in proprties:
+                continue
+
+            value = proprties[name]
+            if value is None:
+                values[name] = [] if is_list else None
+            elif is_list:
+                if isinstance(value, dict):
+                    value = value.get('results', [])
+                values[name] = [projection.from_json(item) for item in value]
+            else:
+                values[name] = projection.from_json(value)
+
+        return self._projection_type(**values)
+
+    def _decode_proprty(self, proprty, value):
+        """Decodes JSON value of the property the way EntityProxy caches it"""
+
+        if value is not None:
+            return proprty.from_json(value)
+
+        if not self._retain_null:
+            return proprty.from_literal(proprty.typ.null_value)
+
+        if proprty.nullable:
+            return None
+
+        raise PyODataException(f'Value of non-nullable Property {proprty.name} is null')
+
+
+class GetEntitySetRequest(QueryRequest):
+    """GET on EntitySet"""
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, url, connection, handler, last_segment, entity_type, encode_path=True, response_hook=None,
+                 entity_set_proxy=None):
+        super(GetEntitySetRequest, self).__init__(url, connection, handler, last_segment, response_hook=response_hook)
+
+        self._entity_type = entity_type
+        self._encode_path = encode_path
+        self._entity_set_proxy = entity_set_proxy
+        self._in_lookups = []
+        self._filter_lookups = []
+        self._learned_select = None
+
+    def __getattr__(self, name):
+        proprty = self._entity_type.proprty(name)
+        return GetEntitySetFilter(proprty)
+
+    def _set_filter(self, filter_val):
+        filter_text = self._filter + ' and ' if self._filter else ''
+        filter_text += filter_val
+        self._filter = filter_text
+
+    def filter(self, *args, **kwargs):
+        if args and len(args) == 1 and isinstance(args[0], (str, FilterNode)):
+            self._filter = str(args[0])
+            self._filter_lookups = None
+        else:
+            chainable = GetEntitySetFilterChainable(self._entity_type, args, kwargs)
+            self._set_filter(str(chainable))
+
+            if args:
+                self._filter_lookups = None
+            elif self._filter_lookups is not None:
+                self._filter_lookups.extend(kwargs.items())
+
+            if self._filter_config() is not None:
+                self._add_in_lookups(chainable, kwargs)
+
+        return self
+
+    def _filter_config(self):
+        """Returns config['filter'] of the service if the filter size is limited"""
+
+        if self._entity_set_proxy is None:
+            return None
+
+        config = self._entity_set_proxy.service.config['filter']
+        if config['max_size'] is None:
+            return None
+
+        return config
+
+    def _add_in_lookups(self, chainable, kwargs):
+        """Remembers the rendered __in lookups of the filter to be able to split them"""
+
+        for lookup, values in kwargs.items():
+            field, operator = chainable.parse_lookup(lookup)
+            if operator == 'in':
+                values = list(values)
+                self._in_lookups.append((chainable.build_lookup(field, operator, values),
+                                         chainable.lookup_renderer(field, operator), values))
+
+    def _split_filters(self):
+        """Returns the list of filters of chunks of values of the largest __in
+           lookup of the filter if the filter exceeds config['filter']['max_size']
+           and the request can be split, otherwise None.
+        """
+
+        config = self._filter_config()
+        if config is None or self._filter is None or len(self._filter) <= config['max_size']:
+            return None
+
+        if self._count or self._inlinecount or self._next_url or not self._is_unbounded():
+            return None
+
+        in_lookups = [in_lookup for in_lookup in self._in_lookups if in_lookup[0] in self._filter]
+        if not in_lookups:
+            return None
+
+        in_expr, render, values = max(in_lookups, key=lambda in_lookup: len(in_lookup[0]))
+        base_size = len(self._filter) - len(in_expr)
+
+        filters = []
+        chunk, chunk_size = [], 0
+        for value, expr in ((value, render([value])) for value in OrderedDict.fromkeys(values)):
+            size = len(expr) if not chunk else len(expr) + len(' or ')
+            if chunk and base_size + chunk_size + size + len('()') > config['max_size']:
+                filters.append(self._filter.replace(in_expr, render(chunk), 1))
+                chunk, chunk_size = [], 0
+                size = len(expr)
+
+            chunk.append(value)
+            chunk_size += size
+
+        filters.append(self._filter.replace(in_expr, render(chunk), 1))
+
+        return filters
+
+    def _is_unbounded(self):
+        """Returns True if the request is not paged nor ordered by the client"""
+
+        return self._top is None and self._skip is None and self._order_by is None
+
+    def _chunk_request(self, filter_val):
+        """Returns copy of this request with the given filter"""
+
+        select = self._select if self._select is not None else self._learned_select
+        return self._derived_request(filter_val, select)
+
+    # pylint: disable=too-many-arguments
+    def _derived_request(self, filter_val, select, order_by=None, top=None, skip=None):
+        """Returns request of the same entity set, handler, headers and
+           custom query options with the given query options
+        """
+
+        request = GetEntitySetRequest(self._url, self._connection, self._handler, self._last_segment,
+                                      self._entity_type, encode_path=self._encode_path,
+                                      response_hook=self._response_hook, entity_set_proxy=self._entity_set_proxy)
+
+        if filter_val is not None:
+            request.filter(filter_val)
+
+        request.select(select).expand(self._expand).order_by(order_by).top(top).skip(skip).add_headers(self._headers)
+        for name, value in self._customs.items():
+            request.custom(name, value)
+
+        return request
+
+    def plan(self, page_size=1000):
+        """Returns QueryPlan fetching all entities matching this request the
+           way the capabilities of the entity set and its properties allow
+        """
+
+        if self._entity_set_proxy is None:
+            raise PyODataException(f'The request for {self._last_segment} does not belong to any entity set proxy')
+
+        query = {'filter': self._filter, 'lookups': self._filter_lookups, 'order_by': self._order_by,
+                 'top': self._top, 'skip': self._skip, 'count': self._count, 'inlinecount': self._inlinecount,
+                 'select': self._select}
+
+        return QueryPlan(self._entity_set_proxy.entity_set, self._derived_request, query, page_size)
+
+    def _execute_chunk(self, filter_val):
+        """Fetches all pages of the copy of this request with the given filter"""
+
+        request = self._chunk_request(filter_val)
+        result = ODataHttpRequest.execute(request)
+
+        while isinstance(result, ListWithTotalCount) and result.next_url is not None:
+            page = ODataHttpRequest.execute(request.next_url(result.next_url))
+            page[:0] = result
+            result = page
+
+        return result
+
+    async def _async_execute_chunk(self, filter_val):
+        """Fetches asynchronously all pages of the copy of this request with the given filter"""
 
-    def top(self, top):
-        """Sets the number of items to return."""
-        self._top = top
-        return self
+        request = self._chunk_request(filter_val)
+        result = await ODataHttpRequest.async_execute(request)
 
-    def get_path(self):
-        if self._count:
-            return urljoin(self._last_segment, '/$count')
+        while isinstance(result, ListWithTotalCount) and result.next_url is not None:
+            page = await ODataHttpRequest.async_execute(request.next_url(result.next_url))
+            page[:0] = result
+            result = page
 
-        return self._last_segment
+        return result
 
-    def get_default_headers(self):
-        if self._count:
-            return {}
+    @staticmethod
+    def _merge_results(results):
+        """Concatenates results of chunks dropping entities with duplicate keys"""
 
-        return {
-            'Accept': 'application/json',
-        }
+        merged = ListWithTotalCount(None, None)
+        keys = set()
 
-    def get_query_params(self):
-        if self._next_url:
-            return {}
+        for result in results:
+            for entity in result:
+                if isinstance(entity, EntityProxy):
+                    if entity.entity_key in keys:
+                        continue
 
-        qparams = super(QueryRequest, self).get_query_params()
+                    keys.add(entity.entity_key)
 
-        if self._top is not None:
-            qparams['$top'] = self._top
+                merged.append(entity)
 
-        if self._skip is not None:
-            qparams['$skip'] = self._skip
+        return merged
 
-        if self._order_by is not None:
-            qparams['$orderby'] = self._order_by
+    def execute(self):
+        """Fetches HTTP response and returns processed result
 
-        if self._filter is not None:
-            qparams['$filter'] = self._filter
+           If the filter exceeds config['filter']['max_size'], values of its
+           largest __in lookup are split into chunks which are fetched by
+           concurrent requests and the entities of all pages are merged.
+        """
 
-        if self._select is not None:
-            qparams['$select'] = self._select
+        site = self._profile_site()
 
-        if self._expand is not None:
-            qparams['$expand'] = self._expand
+        filters = self._split_filters()
+        if filters is None:
+            return self._track_profile(site, super(GetEntitySetRequest, self).execute())
 
-        if self._inlinecount:
-            qparams['$inlinecount'] = 'allpages'
+        self._logger.info('Splitting filter of %s into %d requests', self._last_segment, len(filters))
 
-        return qparams
+        parallelism = self._entity_set_proxy.service.config['filter']['parallelism']
+        with concurrent.futures.ThreadPoolExecutor(max_workers=parallelism) as executor:
+            results = list(executor.map(self._execute_chunk, filters))
 
+        return self._track_profile(site, self._merge_results(results))
 
-class FunctionRequest(QueryRequest):
-    """Function import request (Service call)"""
+    async def async_execute(self):
+        """Fetches HTTP response asynchronously and returns processed result
 
-    def __init__(self, url, connection, handler, function_import, response_hook=None):
-        super(FunctionRequest, self).__init__(
-            url, connection, handler, function_import.name,
-            response_hook=response_hook)
+           The oversized filter is split the same way execute() splits it.
+        """
 
-        self._function_import = function_import
+        site = self._profile_site()
 
-        self._logger.debug('New instance of FunctionRequest for %s', self._function_import.name)
+        filters = self._split_filters()
+        if filters is None:
+            return self._track_profile(site, await super(GetEntitySetRequest, self).async_execute())
 
-    def parameter(self, name, value):
-        '''Sets value of parameter.'''
+        self._logger.info('Splitting filter of %s into %d requests', self._last_segment, len(filters))
 
-        # check if param is valid (is declared in metadata)
-        try:
-            param = self._function_import.get_parameter(name)
+        semaphore = asyncio.Semaphore(self._entity_set_proxy.service.config['filter']['parallelism'])
 
-            # add parameter as custom query argument
-            self.custom(param.name, param.to_literal(value))
-        except KeyError:
-            raise PyODataException('Function import {0} does not have pararmeter {1}'
-                                   .format(self._function_import.name, name))
+        async def execute_chunk(filter_val):
+            async with semaphore:
+                return await self._async_execute_chunk(filter_val)
 
-        return self
+        results = await asyncio.gather(*(execute_chunk(filter_val) for filter_val in filters))
 
-    def get_method(self):
-        return self._function_import.http_method
+        return self._track_profile(site, self._merge_results(results))
 
-    def get_default_headers(self):
-        return {
-            'Accept': 'application/json'
-        }
+    def _profile_site(self):
+        """Returns the query site of the request for the select profiler of
+           the service and sets $select learned for the site, or returns None
+           if the service has no profiler or the request selects explicitly.
+        """
 
+        self._learned_select = None
 
-# pylint: disable=too-many-instance-attributes
-class EntityProxy:
-    """An immutable OData entity instance, consisting of an identity (an
-       entity-set and a unique entity-key within that set), properties (typed,
-       named values), and links (references to other entities).
-    """
+        if self._entity_set_proxy is None or self._entity_set_proxy.service.select_profiler is None:
+            return None
 
-    # pylint: disable=too-many-branches,too-many-nested-blocks,too-many-statements
+        if self._select is not None or self._count or self._next_url:
+            return None
 
-    def __init__(self, service, entity_set, entity_type, proprties=None, entity_key=None, etag=None):
-        self._logger = logging.getLogger(LOGGER_NAME)
-        self._service = service
-        self._entity_set = entity_set
-        self._entity_type = entity_type
-        self._key_props = entity_type.key_proprties
-        self._cache = dict()
-        self._entity_key = entity_key
-        self._etag = etag
+        qparams = super(GetEntitySetRequest, self).get_query_params()
+        site = (self._entity_set_proxy.entity_set.name, tuple(sorted(qparams)), self._expand)
 
-        self._logger.debug('New entity proxy instance of type %s from properties: %s', entity_type.name, proprties)
+        self._learned_select = self._entity_set_proxy.service.select_profiler.select(site, self._entity_type)
+        return site
 
-        # cache values of individual properties if provided
-        if proprties is not None:
+    def _track_profile(self, site, result):
+        if site is not None and isinstance(result, list):
+            self._entity_set_proxy.service.select_profiler.track(site, result)
 
-            etag_body = proprties.get('__metadata', dict()).get('etag', None)
-            if etag is not None and etag_body is not None and etag_body != etag:
-                raise PyODataException('Etag from header does not match the Etag from response body')
+        return result
 
-            if etag_body is not None:
-                self._etag = etag_body
+    def get_query_params(self):
+        qparams = super(GetEntitySetRequest, self).get_query_params()
 
-            # first, cache values of direct properties
-            for type_proprty in self._entity_type.proprties():
-                if type_proprty.name in proprties:
-                    # Property value available
-                    if proprties[type_proprty.name] is not None:
-                        self._cache[type_proprty.name] = type_proprty.from_json(proprties[type_proprty.name])
-                        continue
-                    # Property value missing and user wants a type specific default value filled in
-                    if not self._service.retain_null:
-                        # null value is in literal form for now, convert it to python representation
-                        self._cache[type_proprty.name] = type_proprty.from_literal(type_proprty.typ.null_value)
-                        continue
-                    # Property is nullable - save it as such
-                    if type_proprty.nullable:
-                        self._cache[type_proprty.name] = None
-                        continue
-                    raise PyODataException(f'Value of non-nullable Property {type_proprty.name} is null')
+        if self._learned_select is not None and not self._next_url:
+            qparams['$select'] = self._learned_select
 
-            # then, assign all navigation properties
-            for prop in self._entity_type.nav_proprties:
+        return qparams
 
-                if prop.name in proprties:
+    def get_path(self):
+        if self.get_encode_path():
+            path = quote(self._last_segment)
+        else:
+            path = self._last_segment
 
-                    # entity type of navigation property
-                    prop_etype = prop.to_role.entity_type
+        if self._count:
+            return urljoin(path, '/$count')
+        return path
 
-                    # cache value according to multiplicity
-                    if prop.to_role.multiplicity in \
-                            [model.EndRole.MULTIPLICITY_ONE,
-                             model.EndRole.MULTIPLICITY_ZERO_OR_ONE]:
+    def get_encode_path(self):
+        """Getter for encode path flag"""
+        return self._encode_path
 
-                        # cache None in case we receive nothing (null) instead of entity data
-                        if proprties[prop.name] is None:
-                            self._cache[prop.name] = None
-                        else:
-                            self._cache[prop.name] = EntityProxy(service, None, prop_etype, proprties[prop.name])
+    def get_max_url_length(self):
+        if self._entity_set_proxy is None:
+            return None
 
-                    elif prop.to_role.multiplicity == model.EndRole.MULTIPLICITY_ZERO_OR_MORE:
-                        # default value is empty array
-                        self._cache[prop.name] = []
+        return self._entity_set_proxy.service.config['http']['max_url_length']
 
-                        # if there are no entities available, received data consists of
-                        # metadata properties only.
-                        if 'results' in proprties[prop.name]:
-                            # available entities are serialized in results array
-                            for entity in proprties[prop.name]['results']:
-                                self._cache[prop.name].append(EntityProxy(service, None, prop_etype, entity))
-                        elif isinstance(proprties[prop.name], list):
-                            for entity in proprties[prop.name]:
-                                self._cache[prop.name].append(EntityProxy(service, None, prop_etype, entity))
-                    else:
-                        raise PyODataException('Unknown multiplicity {0} of association role {1}'
-                                               .format(prop.to_role.multiplicity, prop.to_role.name))
+    def project(self, projection_type):
+        """Selects and expands only the fields of the projection type and
+           decodes every returned entity into an instance of it instead of
+           EntityProxy.
 
-        # build entity key if not provided
-        if self._entity_key is None:
-            # try to build key from available property values
-            try:
-                # if key seems to be simple (consists of single property)
-                if len(self._key_props) == 1:
-                    self._entity_key = EntityKey(entity_type, self._cache[self._key_props[0].name])
-                else:
-                    # build complex key
-                    self._entity_key = EntityKey(entity_type, **self._cache)
-            except KeyError:
-                pass
-            except PyODataException:
-                pass
+           @param projection_type  a dataclass or a NamedTuple
+        """
 
-    def __repr__(self):
-        return self._entity_key.to_key_string()
+        retain_null = self._entity_set_proxy is not None and self._entity_set_proxy.service.retain_null
+        projection = EntityProjection(self._entity_type, projection_type, retain_null=retain_null)
 
-    def __getattr__(self, attr):
-        try:
-            return self._cache[attr]
-        except KeyError:
-            try:
-                value = self.get_proprty(attr).execute()
-                self._cache[attr] = value
-                return value
-            except KeyError as ex:
-                raise AttributeError('EntityType {0} does not have Property {1}: {2}'
-                                     .format(self._entity_type.name, attr, str(ex)))
+        def projection_handler(response):
+            """Decodes entity set from HTTP Response into projection instances"""
 
-    async def async_getattr(self, attr):
-        """Get cached value of attribute or do async call to service to recover attribute value"""
-        try:
-            return self._cache[attr]
-        except KeyError:
-            try:
-                value = await self.get_proprty(attr).async_execute()
-                self._cache[attr] = value
-                return value
-            except KeyError as ex:
-                raise AttributeError('EntityType {0} does not have Property {1}: {2}'
-                                     .format(self._entity_type.name, attr, str(ex)))
+            if response.status_code != HTTP_CODE_OK:
+                raise HttpError(f'HTTP GET for Entity Set {self._last_segment} failed with status code '
+                                f'{response.status_code}', response)
 
-    def nav(self, nav_property):
-        """Navigates to given navigation property and returns the EntitySetProxy"""
+            content = response.json()
 
-        # for now duplicated with simillar method in entity set proxy class
-        try:
-            navigation_property = self._entity_type.nav_proprty(nav_property)
-        except KeyError:
-            raise PyODataException('Navigation property {} is not declared in {} entity type'.format(
-                nav_property, self._entity_type))
+            if isinstance(content, int):
+                return content
+
+            entities = content['d']
+            total_count = None
+            next_url = None
+
+            if isinstance(entities, dict):
+                if '__count' in entities:
+                    total_count = int(entities['__count'])
+                if '__next' in entities:
+                    next_url = entities['__next']
+                entities = entities['results']
 
-        # Get entity set of navigation property
-        association_info = navigation_property.association_info
-        association_set = self._service.schema.association_set_by_association(
-            association_info.name,
-            association_info.namespace)
+            self._logger.info('Fetched %d entities', len(entities))
 
-        end = association_set.end_by_role(navigation_property.to_role.role)
-        navigation_entity_set = self._service.schema.entity_set(end.entity_set_name)
+            result = ListWithTotalCount(total_count, next_url)
+            result.extend(projection.from_json(props) for props in entities)
 
-        if navigation_property.to_role.multiplicity != model.EndRole.MULTIPLICITY_ZERO_OR_MORE:
-            return self._get_nav_entity(nav_property, navigation_entity_set)
+            return result
 
-        return EntitySetProxy(
-            self._service,
-            self._service.schema.entity_set(navigation_entity_set.name),
-            nav_property,
-            self._entity_set.name + self._entity_key.to_key_string())
+        self._select = ','.join(projection.select)
+        expand = projection.expand
+        if expand:
+            self._expand = ','.join(expand)
 
-    def _get_nav_entity(self, nav_property, navigation_entity_set):
-        """Get entity based on Navigation property name"""
+        self._handler = projection_handler
+        return self
 
-        def get_entity_handler(parent, nav_property, navigation_entity_set, response):
-            """Gets entity from HTTP response"""
+    def keys(self):
+        """Yields tuples of values of key properties of all entities matching
+           the request page by page, following the links to next pages
+           returned by the service. Only the key properties are fetched and
+           no entity proxies are built.
+        """
+
+        key_proprties = self._entity_type.key_proprties
+
+        def keys_handler(response):
+            """Gets key values and link to the next page from HTTP Response"""
 
             if response.status_code != HTTP_CODE_OK:
-                raise HttpError('HTTP GET for Entity {0} failed with status code {1}'
-                                .format(self._name, response.status_code), response)
+                raise HttpError(f'HTTP GET for keys of Entity Set {self._last_segment} failed with status code '
+                                f'{response.status_code}', response)
 
-            entity = response.json()['d']
+            entities = response.json()['d']
+            next_url = None
 
-            return NavEntityProxy(parent, nav_property, navigation_entity_set.entity_type, entity)
+            if isinstance(entities, dict):
+                next_url = entities.get('__next')
+                entities = entities['results']
 
-        self._logger.info(
-            'Getting the nav property %s of the entity %s for the key %s',
-            nav_property,
-            self._entity_set,
-            self.entity_key)
+            keys = [tuple(proprty.from_json(props[proprty.name]) for proprty in key_proprties) for props in entities]
 
-        return NavEntityGetRequest(
-            partial(get_entity_handler, self, nav_property, navigation_entity_set),
-            self.entity_key,
-            getattr(self._service.entity_sets, self.entity_set.name),
-            nav_property)
+            return keys, next_url
 
-    def get_path(self):
-        """Returns this entity's relative path - e.g. EntitySet(KEY)"""
+        # the oversized filter is split here because the split execute() merges entity proxies
+        filters = self._split_filters()
+        requests = [self] if filters is None else [self._chunk_request(filter_val) for filter_val in filters]
+        fetched = set()
 
-        return self._entity_set._name + self._entity_key.to_key_string()  # pylint: disable=protected-access
+        for request in requests:
+            request.select(','.join(proprty.name for proprty in key_proprties)).expand(None)
+            request._handler = keys_handler  # pylint: disable=protected-access
 
-    def get_proprty(self, name, connection=None):
-        """Returns value of the property"""
+            while True:
+                keys, next_url = request.execute()
+                if filters is None:
+                    yield from keys
+                else:
+                    yield from (key for key in keys if key not in fetched)
+                    fetched.update(keys)
 
-        self._logger.info('Initiating property request for %s', name)
+                if next_url is None:
+                    break
 
-        def proprty_get_handler(key, proprty, response):
-            """Gets property value from HTTP Response"""
+                request.next_url(next_url)
+
+    def diff_keys(self, local_keys):
+        """Compares the given keys with keys of entities matching the request
+
+           Returns the pair of sets (inserts, deletes) where inserts are the
+           local keys missing in the service and deletes are the keys of
+           the service missing in the local keys. Keys are tuples of values
+           of key properties as yielded by keys().
+        """
+
+        inserts = set(local_keys)
+        deletes = set()
+
+        for key in self.keys():
+            if key in inserts:
+                inserts.discard(key)
+            else:
+                deletes.add(key)
+
+        return inserts, deletes
+
+    def _entity_keys(self):
+        key_proprties = self._entity_type.key_proprties
+
+        for values in self.keys():
+            if len(values) == 1:
+                yield EntityKey(self._entity_type, values[0])
+            else:
+                yield EntityKey(self._entity_type, **{proprty.name: value
+                                                      for proprty, value in zip(key_proprties, values)})
+
+    def delete(self, chunk_size=None, concurrency=None):
+        """Deletes all entities matching the request by their keys
+
+           All the keys are downloaded page by page first and then the
+           entities are deleted by changesets sent the same way
+           EntitySetProxy.delete_entities sends them. Deleting while paging
+           would skip entities of services whose links to next pages carry
+           offsets ($skiptoken) because the remaining entities shift.
+
+           Returns list of (key, exception) pairs of entities which failed.
+        """
+
+        return self._get_entity_set_proxy().delete_entities(list(self._entity_keys()), chunk_size, concurrency)
+
+    def update(self, chunk_size=None, concurrency=None, method=None, **values):
+        """Sets the values of properties of all entities matching the request
+
+           All the keys are downloaded page by page first and then the
+           entities are updated by changesets sent the same way
+           EntitySetProxy.update_entities sends them, so updates of filtered
+           properties cannot shift the pages of the request.
 
-            if response.status_code != HTTP_CODE_OK:
-                raise HttpError('HTTP GET for Attribute {0} of Entity {1} failed with status code {2}'
-                                .format(proprty.name, key, response.status_code), response)
+           Returns list of (key, exception) pairs of entities which failed.
+        """
 
-            data = response.json()['d']
-            return proprty.from_json(data[proprty.name])
+        updates = [(key, values) for key in self._entity_keys()]
 
-        path = urljoin(self.get_path(), name)
-        return self._service.http_get_odata(
-            path,
-            partial(proprty_get_handler, path, self._entity_type.proprty(name)),
-            connection=connection)
+        return self._get_entity_set_proxy().update_entities(updates, chunk_size, concurrency, method)
 
-    def get_value(self, connection=None):
-        "Returns $value of Stream entities"
+    def _get_entity_set_proxy(self):
+        if self._entity_set_proxy is None:
+            raise PyODataException(f'The request for {self._last_segment} does not belong to any entity set proxy')
 
-        def value_get_handler(key, response):
-            """Gets property value from HTTP Response"""
+        return self._entity_set_proxy
 
-            if response.status_code != HTTP_CODE_OK:
-                raise HttpError('HTTP GET for $value of Entity {0} failed with status code {1}'
-                                .format(key, response.status_code), response)
 
-            return response
+class QueryParameter:
+    """Named placeholder of a value bound to PreparedQuery"""
 
-        path = urljoin(self.get_path(), '/$value')
-        return self._service.http_get_odata(path,
-                                            partial(value_get_handler, self.entity_key),
-                                            connection=connection)
+    def __init__(self, name):
+        self._name = name
 
     @property
-    def entity_set(self):
-        """Entity set related to this entity"""
+    def name(self):
+        """Name of the parameter"""
 
-        return self._entity_set
+        return self._name
 
-    @property
-    def entity_key(self):
-        """Key of entity"""
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self._name!r})'
 
-        return self._entity_key
 
-    @property
-    def url(self):
-        """URL of the real entity"""
+class PreparedQuery:
+    """Query of an entity set validated against the entity type and rendered
+       once. Binding the query formats only the literals of the values of
+       QueryParameter placeholders.
 
-        service_url = self._service.url.rstrip('/')
-        entity_path = self.get_path()
+       Example:
+           prepared = proxy.prepare(filter={'FirstName': QueryParameter('name'), 'Age__gt': 18},
+                                    select='ID,FirstName', top=QueryParameter('top'))
+           prepared.bind(name='Tim', top=10).execute()
+    """
 
-        return urljoin(service_url, entity_path)
+    # pylint: disable=too-many-arguments,too-many-instance-attributes,redefined-builtin
+    def __init__(self, entity_set_proxy, handler, filter=None, select=None, expand=None, order_by=None, top=None,
+                 skip=None):
+        entity_type = entity_set_proxy.entity_set.entity_type
+
+        self._entity_set_proxy = entity_set_proxy
+        self._handler = handler
+        self._entity_type = entity_type
+        self._path = quote(entity_set_proxy.last_segment)
+        self._lookups = GetEntitySetFilterChainable(entity_type, (), {})
+        self._filter_parts = self._prepare_filter(filter)
+        self._select = self._prepare_names(select, self._check_select)
+        self._expand = self._prepare_names(expand, self._check_expand)
+        self._order_by = self._prepare_names(order_by, self._check_order_by)
+        self._top = top
+        self._skip = skip
+
+        self._parameters = {part[0] for part in self._filter_parts if not isinstance(part, str)}
+        self._parameters.update(value.name for value in (top, skip) if isinstance(value, QueryParameter))
 
     @property
-    def etag(self):
-        """ETag generated by service"""
-        return self._etag
+    def parameters(self):
+        """Names of the parameters which must be bound"""
 
-    def equals(self, other):
-        """Returns true if the self and the other contains the same data"""
-        # pylint: disable=W0212
-        return self._cache == other._cache
+        return frozenset(self._parameters)
 
+    def _prepare_filter(self, filter_val):
+        if filter_val is None:
+            return []
 
-class NavEntityProxy(EntityProxy):
-    """Special case of an Entity access via 1 to 1 Navigation property"""
+        if isinstance(filter_val, str):
+            return [filter_val]
 
-    def __init__(self, parent_entity, prop_name, entity_type, entity):
-        # pylint: disable=protected-access
-        super(NavEntityProxy, self).__init__(parent_entity._service, parent_entity._entity_set, entity_type, entity)
+        parts = []
+        for lookup, value in filter_val.items():
+            field, operator = self._lookups.parse_lookup(lookup)
+            if isinstance(value, QueryParameter):
+                parts.append((value.name, self._lookups.lookup_renderer(field, operator)))
+            else:
+                parts.append(self._lookups.build_lookup(field, operator, value))
 
-        self._parent_entity = parent_entity
-        self._prop_name = prop_name
+        return parts
 
-    def get_path(self):
-        """Returns URL of the entity"""
+    @staticmethod
+    def _prepare_names(names, check):
+        if names is None:
+            return None
 
-        return urljoin(self._parent_entity.get_path(), self._prop_name)
+        if isinstance(names, str):
+            names = names.split(',')
 
+        names = [name.strip() for name in names]
+        for name in names:
+            check(name)
 
-class GetEntitySetFilter:
-    """Create filters for humans"""
+        return ','.join(names)
 
-    def __init__(self, proprty):
-        self._proprty = proprty
+    def _check_proprty(self, name):
+        if not self._entity_type.has_proprty(name):
+            raise PyODataException(f'Property {name} is not declared in {self._entity_type.name} entity type')
 
-    @staticmethod
-    def build_expression(operator, operands):
-        """Creates a expression by joining the operands with the operator"""
+    def _check_nav_proprty(self, name):
+        try:
+            self._entity_type.nav_proprty(name)
+        except KeyError:
+            raise PyODataException(
+                f'Navigation property {name} is not declared in {self._entity_type.name} entity type')
 
-        if len(operands) < 2:
-            raise ExpressionError('The $filter operator \'{}\' needs at least two operands'.format(operator))
+    def _check_select(self, name):
+        head = name.split('/', 1)[0]
+        if head != '*' and not self._entity_type.has_proprty(head):
+            self._check_nav_proprty(head)
 
-        return f"({' {} '.format(operator).join(operands)})"
+    def _check_expand(self, name):
+        self._check_nav_proprty(name.split('/', 1)[0])
 
-    @staticmethod
-    def and_(*operands):
-        """Creates logical AND expression from the operands"""
+    def _check_order_by(self, name):
+        self._check_proprty(name.split(' ', 1)[0])
 
-        return GetEntitySetFilter.build_expression('and', operands)
+    def _render_filter(self, params):
+        expressions = []
+        for part in self._filter_parts:
+            if isinstance(part, str):
+                expressions.append(part)
+            else:
+                name, render = part
+                expressions.append(render(params[name]))
 
-    @staticmethod
-    def or_(*operands):
-        """Creates logical OR expression from the operands"""
+        return ' and '.join(expressions)
 
-        return GetEntitySetFilter.build_expression('or', operands)
+    def bind(self, **params):
+        """Returns GetEntitySetRequest with the values of the parameters"""
 
-    @staticmethod
-    def format_filter(proprty, operator, value):
-        """Creates a filter expression """
+        if params.keys() != self._parameters:
+            missing = self._parameters.difference(params)
+            if missing:
+                raise PyODataException(f'Parameters {", ".join(sorted(missing))} of the prepared query are not bound')
 
-        return f'{proprty.name} {operator} {proprty.to_literal(value)}'
+            raise PyODataException(f'Parameters {", ".join(sorted(set(params).difference(self._parameters)))} '
+                                   'are not declared in the prepared query')
 
-    def __eq__(self, value):
-        return GetEntitySetFilter.format_filter(self._proprty, 'eq', value)
+        service = self._entity_set_proxy.service
+        request = GetEntitySetRequest(service.url, service.connection, self._handler, self._path, self._entity_type,
+                                      encode_path=False, response_hook=service.response_hook,
+                                      entity_set_proxy=self._entity_set_proxy)
 
-    def __ne__(self, value):
-        return GetEntitySetFilter.format_filter(self._proprty, 'ne', value)
+        if self._filter_parts:
+            request.filter(self._render_filter(params))
 
-    def __lt__(self, value):
-        return GetEntitySetFilter.format_filter(self._proprty, 'lt', value)
+        if self._select is not None:
+            request.select(self._select)
 
-    def __le__(self, value):
-        return GetEntitySetFilter.format_filter(self._proprty, 'le', value)
+        if self._expand is not None:
+            request.expand(self._expand)
 
-    def __ge__(self, value):
-        return GetEntitySetFilter.format_filter(self._proprty, 'ge', value)
+        if self._order_by is not None:
+            request.order_by(self._order_by)
 
-    def __gt__(self, value):
-        return GetEntitySetFilter.format_filter(self._proprty, 'gt', value)
+        if self._top is not None:
+            request.top(params[self._top.name] if isinstance(self._top, QueryParameter) else self._top)
 
+        if self._skip is not None:
+            request.skip(params[self._skip.name] if isinstance(self._skip, QueryParameter) else self._skip)
 
-class FilterExpression:
-    """A class representing named expression of OData $filter"""
+        return request
 
-    def __init__(self, **kwargs):
-        self._expressions = kwargs
-        self._other = None
-        self._operator = None
 
-    @property
-    def expressions(self):
-        """Get expressions where key is property name with the operator suffix
-           and value is the left hand side operand.
-        """
+def _matches_lookup(value, operator, arg):
+    """Evaluates the lookup operator of GetEntitySetFilterChainable on client side"""
 
-        return self._expressions.items()
+    # pylint: disable=too-many-return-statements
 
-    @property
-    def other(self):
-        """Get an instance of the other operand"""
+    if operator == 'eq':
+        return value == arg
 
-        return self._other
+    if operator == 'in':
+        return value in arg
 
-    @property
-    def operator(self):
-        """The other operand"""
+    if value is None:
+        return False
 
-        return self._operator
+    if operator == 'length':
+        return len(value) == int(arg)
 
-    def __or__(self, other):
-        if self._other is not None:
-            raise RuntimeError('The FilterExpression already initialized')
+    if operator == 'range':
+        return arg[0] <= value <= arg[1]
 
-        self._other = other
-        self._operator = "or"
-        return self
+    if operator == 'startswith':
+        return value.startswith(arg)
 
-    def __and__(self, other):
-        if self._other is not None:
-            raise RuntimeError('The FilterExpression already initialized')
+    if operator == 'endswith':
+        return value.endswith(arg)
 
-        self._other = other
-        self._operator = "and"
-        return self
+    if operator == 'contains':
+        return arg in value
 
+    return {'lt': value < arg, 'lte': value <= arg, 'gt': value > arg, 'gte': value >= arg}[operator]
 
-class GetEntitySetFilterChainable:
-    """
-    Example expressions
-        FirstName='Tim'
-        FirstName__contains='Tim'
-        Age__gt=56
-        Age__gte=6
-        Age__lt=78
-        Age__lte=90
-        Age__range=(5,9)
-        FirstName__in=['Tim', 'Bob', 'Sam']
-        FirstName__startswith='Tim'
-        FirstName__endswith='mothy'
-        Addresses__Suburb='Chatswood'
-        Addresses__Suburb__contains='wood'
-    """
 
-    OPERATORS = [
-        'startswith',
-        'endswith',
-        'lt',
-        'lte',
-        'gt',
-        'gte',
-        'contains',
-        'range',
-        'in',
-        'length',
-        'eq'
-    ]
+class QueryPlan:
+    """Plan of fetching all entities matching GetEntitySetRequest respecting
+       SAP capabilities of the entity set and its properties
 
-    def __init__(self, entity_type, filter_expressions, exprs):
-        self._entity_type = entity_type
-        self._filter_expressions = filter_expressions
-        self._expressions = exprs
+       paging is one of:
+         'server'   - no $top/$skip, the links to next pages returned by the
+                      service are followed
+         'top_skip' - pages of page_size entities requested by $top and $skip
+                      (pageable and topable entity sets ordered by the query
+                      or by sortable key properties)
+         'keyset'   - pages of page_size entities ordered by the key and
+                      filtered by the last key of the previous page (topable
+                      entity sets with a sortable and filterable key)
 
-    @property
-    def expressions(self):
-        """Get expressions as a list of tuples where the first item
-           is a property name with the operator suffix and the second item
-           is a left hand side value.
-        """
+       The links to next pages are followed also within pages of page_size
+       entities, so services returning less entities per response than
+       page_size are fetched completely.
 
-        return self._expressions.items()
+       Lookups of not filterable properties (client_lookups) and ordering
+       by not sortable properties (client_order_by) are evaluated on client
+       side and then also $top and $skip are applied on client side. $count
+       and $inlinecount of not countable entity sets are computed on client
+       side from all fetched entities.
+    """
 
-    def proprty_obj(self, name):
-        """Returns a model property for a particular property"""
+    # pylint: disable=too-many-instance-attributes
 
-        return self._entity_type.proprty(name)
+    PAGING_SERVER = 'server'
+    PAGING_TOP_SKIP = 'top_skip'
+    PAGING_KEYSET = 'keyset'
 
-    def _decode_and_combine_filter_expression(self, filter_expression):
-        filter_expressions = [self._decode_expression(expr, val) for expr, val in filter_expression.expressions]
-        return self._combine_expressions(filter_expressions)
+    def __init__(self, entity_set, request_factory, query, page_size):
+        self._request_factory = request_factory
+        self._entity_type = entity_set.entity_type
+        self.entity_set = entity_set.name
+        self.page_size = page_size
+
+        self._plan_filter(entity_set, query)
+        self._plan_order_by(query['order_by'])
+
+        client_side = bool(self.client_lookups or self.client_order_by)
+        server_paging = entity_set.pageable and entity_set.topable and not client_side
+
+        self.server_top = query['top'] if server_paging else None
+        self.server_skip = query['skip'] if server_paging else None
+        self.client_top = None if server_paging else query['top']
+        self.client_skip = None if server_paging else query['skip']
+
+        self.count = None
+        if query['count']:
+            self.count = 'server' if entity_set.countable and not client_side else 'client'
+
+        self.inline_count = None
+        if query['inlinecount']:
+            self.inline_count = 'server' if entity_set.countable and not client_side and server_paging else 'client'
+
+        self.select = query['select']
+        if self.select is not None:
+            needed = [name for name in self._client_proprty_names() if name not in self.select.split(',')]
+            self.select = ','.join([self.select] + needed)
+
+        self._keyset_proprty = None
+        if self.count == 'server' or self.inline_count == 'server' or self.server_top is not None \
+                or self.server_skip is not None:
+            self.paging = QueryPlan.PAGING_SERVER
+        elif entity_set.pageable and entity_set.topable and (self.server_order_by or self._key_order_by()):
+            # pages requested by $top and $skip are consistent only in deterministic order
+            self.paging = QueryPlan.PAGING_TOP_SKIP
+            if self.server_order_by is None:
+                self.server_order_by = self._key_order_by()
+        elif entity_set.topable and self._keyset_key() is not None and not self.server_order_by:
+            self.paging = QueryPlan.PAGING_KEYSET
+            self._keyset_proprty = self._keyset_key()
+            self.server_order_by = self._keyset_proprty.name
+        else:
+            self.paging = QueryPlan.PAGING_SERVER
 
-    def _process_query_objects(self):
-        """Processes FilterExpression objects to OData lookups"""
+    def _plan_filter(self, entity_set, query):
+        lookups = query['lookups']
+        self.client_lookups = []
 
-        filter_expressions = []
+        if lookups is None or not lookups:
+            self.server_filter = query['filter']
+            server_names = set() if self.server_filter is None else None
+        else:
+            chainable = GetEntitySetFilterChainable(self._entity_type, (), {})
+            server_expressions = []
+            server_names = set()
+            for lookup, value in lookups:
+                field, operator = chainable.parse_lookup(lookup)
+                if self._entity_type.proprty(field).filterable:
+                    server_expressions.append(chainable.build_lookup(field, operator, value))
+                    server_names.add(field)
+                else:
+                    self.client_lookups.append((field, operator, value))
 
-        for expr in self._filter_expressions:
-            lhs_expressions = self._decode_and_combine_filter_expression(expr)
+            self.server_filter = ' and '.join(server_expressions) or None
 
-            if expr.other is not None:
-                rhs_expressions = self._decode_and_combine_filter_expression(expr.other)
-                filter_expressions.append(f'({lhs_expressions}) {expr.operator} ({rhs_expressions})')
-            else:
-                filter_expressions.append(lhs_expressions)
+        if entity_set.requires_filter and self.server_filter is None:
+            raise PyODataException(f'Entity set {entity_set.name} requires $filter with filterable properties')
 
-        return filter_expressions
+        for proprty in self._entity_type.proprties():
+            if not proprty.required_in_filter:
+                continue
 
-    def _process_expressions(self):
-        filter_expressions = [self._decode_expression(expr, val) for expr, val in self.expressions]
+            if server_names is None:
+                server_names = parse_filter(self.server_filter).members()
 
-        filter_expressions.extend(self._process_query_objects())
+            if proprty.name not in server_names:
+                raise PyODataException(
+                    f'Property {proprty.name} of entity set {entity_set.name} is required in $filter')
 
-        return filter_expressions
+    def _plan_order_by(self, order_by):
+        self.server_order_by = order_by
+        self.client_order_by = []
 
-    def _decode_expression(self, expr, val):
-        field = None
-        # field_heirarchy = []
-        operator = 'eq'
-        exprs = expr.split('__')
+        if order_by is None:
+            return
 
-        for part in exprs:
-            if self._entity_type.has_proprty(part):
-                field = part
-                # field_heirarchy.append(part)
-            elif part in self.__class__.OPERATORS:
-                operator = part
-            else:
-                raise ValueError(f'"{part}" is not a valid property or operator')
-        # field = '/'.join(field_heirarchy)
+        terms = []
+        for term in order_by.split(','):
+            name, _, direction = term.strip().partition(' ')
+            terms.append((name, direction.strip().lower() == 'desc'))
 
-        # target_field = self.proprty_obj(field_heirarchy[-1])
-        expression = self._build_expression(field, operator, val)
+        if all(not self._entity_type.has_proprty(name) or self._entity_type.proprty(name).sortable
+               for name, _ in terms):
+            return
 
-        return expression
+        self.server_order_by = None
+        self.client_order_by = terms
 
-    # pylint: disable=no-self-use
-    def _combine_expressions(self, expressions):
-        return ' and '.join(expressions)
+    def _client_proprty_names(self):
+        names = [field for field, _, _ in self.client_lookups]
+        names.extend(name for name, _ in self.client_order_by)
+        return names
 
-    # pylint: disable=too-many-return-statements, too-many-branches
-    def _build_expression(self, field_name, operator, value):
-        target_field = self.proprty_obj(field_name)
+    def _key_order_by(self):
+        key_proprties = self._entity_type.key_proprties
+        if all(proprty.sortable for proprty in key_proprties):
+            return ','.join(proprty.name for proprty in key_proprties)
 
-        if operator not in ['length', 'in', 'range']:
-            value = target_field.to_literal(value)
+        return None
 
-        if operator == 'lt':
-            return f'{field_name} lt {value}'
+    def _keyset_key(self):
+        key_proprties = self._entity_type.key_proprties
+        if len(key_proprties) == 1 and key_proprties[0].sortable and key_proprties[0].filterable:
+            return key_proprties[0]
 
-        if operator == 'lte':
-            return f'{field_name} le {value}'
+        return None
 
-        if operator == 'gte':
-            return f'{field_name} ge {value}'
+    def __repr__(self):
+        return (f'{self.__class__.__name__}(entity_set={self.entity_set!r}, paging={self.paging!r}, '
+                f'server_filter={self.server_filter!r}, client_lookups={self.client_lookups!r}, '
+                f'server_order_by={self.server_order_by!r}, client_order_by={self.client_order_by!r}, '
+                f'count={self.count!r}, inline_count={self.inline_count!r})')
 
-        if operator == 'gt':
-            return f'{field_name} gt {value}'
+    def _request(self, filter_val=None, top=None, skip=None):
+        return self._request_factory(filter_val, self.select, self.server_order_by, top, skip)
 
-        if operator == 'startswith':
-            return f'startswith({field_name}, {value}) eq true'
+    def _keyset_filter(self, last_key):
+        key_filter = f'{self._keyset_proprty.name} gt {self._keyset_proprty.to_literal(last_key)}'
+        if self.server_filter is None:
+            return key_filter
 
-        if operator == 'endswith':
-            return f'endswith({field_name}, {value}) eq true'
+        return f'({self.server_filter}) and {key_filter}'
 
-        if operator == 'length':
-            value = int(value)
-            return f'length({field_name}) eq {value}'
+    def iter_pages(self):
+        """Yields pages (lists) of entities fetched by requests of the plan
+           before evaluation of client side lookups and ordering
+        """
 
-        if operator in ['contains']:
-            return f'substringof({value}, {field_name}) eq true'
+        if self.count == 'server':
+            yield self._request(self.server_filter).count().execute()
+            return
 
-        if operator == 'range':
-            if not isinstance(value, (tuple, list)):
-                raise TypeError(f'Range must be tuple or list not {type(value)}')
+        if self.paging == QueryPlan.PAGING_SERVER:
+            request = self._request(self.server_filter, self.server_top, self.server_skip)
+            if self.inline_count == 'server':
+                request.count(inline=True)
 
-            if len(value) != 2:
-                raise ValueError('Only two items can be passed in a range.')
+            yield from QueryPlan._iter_linked_pages(request)
+            return
 
-            low_bound = target_field.to_literal(value[0])
-            high_bound = target_field.to_literal(value[1])
+        skip = 0
+        last_key = None
+        while True:
+            if self.paging == QueryPlan.PAGING_KEYSET:
+                filter_val = self.server_filter if last_key is None else self._keyset_filter(last_key)
+                request = self._request(filter_val, self.page_size)
+            else:
+                request = self._request(self.server_filter, self.page_size, skip)
 
-            return f'{field_name} gte {low_bound} and {field_name} lte {high_bound}'
+            fetched = 0
+            for page in QueryPlan._iter_linked_pages(request):
+                fetched += len(page)
+                if page and self.paging == QueryPlan.PAGING_KEYSET:
+                    last_key = getattr(page[-1], self._keyset_proprty.name)
 
-        if operator == 'in':
-            literal_values = (f'{field_name} eq {target_field.to_literal(item)}' for item in value)
-            return ' or '.join(literal_values)
+                yield page
 
-        if operator == 'eq':
-            return f'{field_name} eq {value}'
+            if fetched < self.page_size:
+                return
 
-        raise ValueError(f'Invalid expression {operator}')
+            skip += fetched
 
-    def __str__(self):
-        expressions = self._process_expressions()
-        result = self._combine_expressions(expressions)
-        return result
+    @staticmethod
+    def _iter_linked_pages(request):
+        """Yields pages returned by the request and by the links to its next pages"""
 
+        while True:
+            page = ODataHttpRequest.execute(request)
+            yield page
 
-class GetEntitySetRequest(QueryRequest):
-    """GET on EntitySet"""
+            if page.next_url is None:
+                return
 
-    def __init__(self, url, connection, handler, last_segment, entity_type, encode_path=True, response_hook=None):
-        super(GetEntitySetRequest, self).__init__(url, connection, handler, last_segment, response_hook=response_hook)
+            request.next_url(page.next_url)
 
-        self._entity_type = entity_type
-        self._encode_path = encode_path
+    def execute(self):
+        """Fetches all entities of the plan and returns them in ListWithTotalCount,
+           or returns the number of entities if the request counts them
+        """
 
-    def __getattr__(self, name):
-        proprty = self._entity_type.proprty(name)
-        return GetEntitySetFilter(proprty)
+        entities = []
+        total_count = None
+        for page in self.iter_pages():
+            if self.count == 'server':
+                return page
 
-    def _set_filter(self, filter_val):
-        filter_text = self._filter + ' and ' if self._filter else ''
-        filter_text += filter_val
-        self._filter = filter_text
+            if self.inline_count == 'server' and total_count is None:
+                total_count = page.total_count
 
-    def filter(self, *args, **kwargs):
-        if args and len(args) == 1 and isinstance(args[0], str):
-            self._filter = args[0]
-        else:
-            self._set_filter(str(GetEntitySetFilterChainable(self._entity_type, args, kwargs)))
+            entities.extend(page)
+
+        if self.client_lookups:
+            entities = [entity for entity in entities
+                        if all(_matches_lookup(getattr(entity, field), operator, arg)
+                               for field, operator, arg in self.client_lookups)]
+
+        for name, descending in reversed(self.client_order_by):
+            entities.sort(key=lambda entity, name=name: (getattr(entity, name) is not None, getattr(entity, name)),
+                          reverse=descending)
 
-        return self
+        if self.inline_count == 'client':
+            total_count = len(entities)
 
-    def get_path(self):
-        if self.get_encode_path():
-            path = quote(self._last_segment)
-        else:
-            path = self._last_segment
+        start = self.client_skip or 0
+        end = None if self.client_top is None else start + self.client_top
+        entities = entities[start:end]
 
-        if self._count:
-            return urljoin(path, '/$count')
-        return path
+        if self.count == 'client':
+            return len(entities)
 
-    def get_encode_path(self):
-        """Getter for encode path flag"""
-        return self._encode_path
+        result = ListWithTotalCount(total_count, None)
+        result.extend(entities)
+        return result
 
 
 class ListWithTotalCount(list):
@@ -1445,6 +4103,11 @@ class EntitySetProxy:
         """Return service"""
         return self._service
 
+    @property
+    def entity_set(self):
+        """Return entity set"""
+        return self._entity_set
+
     @property
     def last_segment(self):
         """Return last segment of url"""
@@ -1455,26 +4118,14 @@ class EntitySetProxy:
     def nav(self, nav_property, key):
         """Navigates to given navigation property and returns the EntitySetProxy"""
 
-        try:
-            navigation_property = self._entity_set.entity_type.nav_proprty(nav_property)
-        except KeyError:
-            raise PyODataException('Navigation property {} is not declared in {} entity type'.format(
-                nav_property, self._entity_set.entity_type))
-
-        # Get entity set of navigation property
-        association_info = navigation_property.association_info
-        association_set = self._service.schema.association_set_by_association(
-            association_info.name)
+        route = self._service.navigation_routes.resolve(self._entity_set.entity_type, nav_property)
 
-        end = association_set.end_by_role(navigation_property.to_role.role)
-        navigation_entity_set = self._service.schema.entity_set(end.entity_set_name)
-
-        if navigation_property.to_role.multiplicity != model.EndRole.MULTIPLICITY_ZERO_OR_MORE:
-            return self._get_nav_entity(key, nav_property, navigation_entity_set)
+        if route.multiplicity != model.EndRole.MULTIPLICITY_ZERO_OR_MORE:
+            return self._get_nav_entity(key, nav_property, route.entity_set)
 
         return EntitySetProxy(
             self._service,
-            navigation_entity_set,
+            route.entity_set,
             nav_property,
             self._entity_set.name + key.to_key_string())
 
@@ -1519,7 +4170,8 @@ class EntitySetProxy:
             entity = response.json()['d']
             etag = response.headers.get('ETag', None)
 
-            return EntityProxy(self._service, self._entity_set, self._entity_set.entity_type, entity, etag=etag)
+            return self._service.entity_identity(
+                EntityProxy(self._service, self._entity_set, self._entity_set.entity_type, entity, etag=etag))
 
         if key is not None and isinstance(key, EntityKey):
             entity_key = key
@@ -1528,7 +4180,7 @@ class EntitySetProxy:
 
         self._logger.info('Getting entity %s for key %s and args %s', self._entity_set.entity_type.name, key, args)
 
-        return EntityGetRequest(get_entity_handler, entity_key, self, encode_path=encode_path)
+        return EntityGetRequest(get_entity_handler, entity_key, self, encode_path=encode_path, shares_result=True)
 
     def get_entities(self, encode_path=True):
         """Get some, potentially all entities"""
@@ -1561,14 +4213,29 @@ class EntitySetProxy:
             result = ListWithTotalCount(total_count, next_url)
             for props in entities:
                 entity = EntityProxy(self._service, self._entity_set, self._entity_set.entity_type, props)
-                result.append(entity)
+                result.append(self._service.entity_identity(entity))
 
             return result
 
         entity_set_name = self._alias if self._alias is not None else self._entity_set.name
         return GetEntitySetRequest(self._service.url, self._service.connection, get_entities_handler,
                                    self._parent_last_segment + entity_set_name, self._entity_set.entity_type,
-                                   encode_path=encode_path, response_hook=self._service.response_hook)
+                                   encode_path=encode_path, response_hook=self._service.response_hook,
+                                   entity_set_proxy=self)
+
+    # pylint: disable=too-many-arguments,redefined-builtin
+    def prepare(self, filter=None, select=None, expand=None, order_by=None, top=None, skip=None):
+        """Returns PreparedQuery of entities of this entity set
+
+           The filter is either a string or a dict of lookups like those
+           accepted by GetEntitySetRequest.filter whose values may be
+           QueryParameter placeholders. The values of top and skip may be
+           QueryParameter placeholders too. The names in select, expand and
+           order_by are validated against the entity type.
+        """
+
+        return PreparedQuery(self, self.get_entities().handler, filter=filter, select=select, expand=expand,
+                             order_by=order_by, top=top, skip=skip)
 
     def create_entity(self, return_code=HTTP_CODE_CREATED):
         """Creates a new entity in the given entity-set."""
@@ -1583,11 +4250,116 @@ class EntitySetProxy:
             entity_props = response.json()['d']
             etag = response.headers.get('ETag', None)
 
-            return EntityProxy(self._service, self._entity_set, self._entity_set.entity_type, entity_props, etag=etag)
+            return self._service.entity_identity(
+                EntityProxy(self._service, self._entity_set, self._entity_set.entity_type, entity_props, etag=etag))
 
         return EntityCreateRequest(self._service.url, self._service.connection, create_entity_handler, self._entity_set,
                                    self.last_segment, response_hook=self._service.response_hook)
 
+    def create_entities(self, rows, chunk_size=None, concurrency=None):
+        """Creates entities with property values of the given iterable of dicts.
+
+           The entities are created in changesets of chunk_size entities sent
+           in separate batch requests by at most concurrency concurrent HTTP
+           requests (defaults are taken from config['batch']). Rows are read
+           from the iterable only when there is a free slot for their batch.
+
+           Returns generator of the created entity proxies in the order of rows.
+           The exception raised for a failed changeset, including transport
+           errors of its batch request, is yielded for every row of the
+           changeset instead.
+        """
+
+        requests = ((row, self.create_entity().set(**row)) for row in rows)
+
+        return (result for _, result in self._execute_in_changesets(requests, chunk_size, concurrency))
+
+    def update_entities(self, updates, chunk_size=None, concurrency=None, method=None):
+        """Updates entities with the given iterable of (key, property values)
+           pairs or dict of property values by keys. Keys can be EntityKey
+           instances, values of single key properties or dicts of key properties.
+
+           The entities are updated by the method from config['http'] if no
+           method is given in changesets sent the same way create_entities
+           sends them.
+
+           Returns list of (key, exception) pairs of entities which failed.
+        """
+
+        if isinstance(updates, dict):
+            updates = updates.items()
+
+        requests = ((key, self.update_entity(self._bulk_entity_key(key), method=method).set(**values))
+                    for key, values in updates)
+
+        return self._failures(self._execute_in_changesets(requests, chunk_size, concurrency))
+
+    def delete_entities(self, keys, chunk_size=None, concurrency=None):
+        """Deletes entities of the given iterable of keys in changesets sent
+           the same way create_entities sends them. Keys can be EntityKey
+           instances, values of single key properties or dicts of key properties.
+
+           Returns list of (key, exception) pairs of entities which failed.
+        """
+
+        requests = ((key, self.delete_entity(self._bulk_entity_key(key))) for key in keys)
+
+        return self._failures(self._execute_in_changesets(requests, chunk_size, concurrency))
+
+    def _bulk_entity_key(self, key):
+        if isinstance(key, EntityKey):
+            return key
+
+        if isinstance(key, dict):
+            return EntityKey(self._entity_set.entity_type, **key)
+
+        return EntityKey(self._entity_set.entity_type, key)
+
+    @staticmethod
+    def _failures(results):
+        return [(key, result) for key, result in results if isinstance(result, Exception)]
+
+    def _execute_in_changesets(self, requests, chunk_size, concurrency):
+        """Yields (item, result) for the iterable of (item, request) pairs"""
+
+        config = self._service.config['batch']
+        chunk_size = chunk_size or config['max_parts']
+        concurrency = concurrency or config['parallelism']
+
+        def execute_changeset(chunk):
+            """Sends the requests in one changeset"""
+
+            changeset = self._service.create_changeset()
+            for _, request in chunk:
+                changeset.add_request(request)
+
+            batch = self._service.create_batch()
+            batch.add_request(changeset)
+
+            # pylint: disable=broad-except
+            # transport errors must be reported for the items of the changeset too
+            try:
+                results = batch.execute()[0]
+            except Exception as ex:
+                self._logger.info('Changeset of %d requests for %s failed: %s', len(chunk), self._name, ex)
+                results = [ex] * len(chunk)
+
+            return [(item, result) for (item, _), result in zip(chunk, results)]
+
+        requests = iter(requests)
+        chunks = iter(lambda: list(itertools.islice(requests, chunk_size)), [])
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(execute_changeset, chunk))
+
+                if len(pending) >= concurrency:
+                    yield from pending.popleft().result()
+
+            while pending:
+                yield from pending.popleft().result()
+
     def update_entity(self, key=None, method=None, encode_path=True, **kwargs):
         """Updates an existing entity in the given entity-set."""
 
@@ -1598,6 +4370,9 @@ class EntitySetProxy:
                 raise HttpError('HTTP modify request for Entity Set {} failed with status code {}'
                                 .format(self._name, response.status_code), response)
 
+            if self._service.identity_map is not None:
+                self._service.identity_map.discard(self._entity_set.name, entity_key)
+
         if key is not None and isinstance(key, EntityKey):
             entity_key = key
         else:
@@ -1623,6 +4398,9 @@ class EntitySetProxy:
                                 f'failed with status code {response.status_code}',
                                 response)
 
+            if self._service.identity_map is not None:
+                self._service.identity_map.discard(self._entity_set.name, entity_key)
+
         if key is not None and isinstance(key, EntityKey):
             entity_key = key
         else:
@@ -1634,28 +4412,38 @@ class EntitySetProxy:
 
 # pylint: disable=too-few-public-methods
 class EntityContainer:
-    """Set of EntitSet proxies"""
+    """Set of EntitSet proxies
+
+       The proxies are created on first access and cached.
+    """
 
     def __init__(self, service):
         self._service = service
 
         self._entity_sets = dict()
 
-        for entity_set in self._service.schema.entity_sets:
-            self._entity_sets[entity_set.name] = EntitySetProxy(self._service, entity_set)
-
     def __getattr__(self, name):
         try:
             return self._entity_sets[name]
+        except KeyError:
+            pass
+
+        try:
+            entity_set = self._service.schema.entity_set(name)
         except KeyError:
             raise AttributeError(
-                f"EntitySet {name} not defined in {','.join(list(self._entity_sets.keys()))}.")
+                f"EntitySet {name} not defined in {','.join(es.name for es in self._service.schema.entity_sets)}.")
+
+        proxy = EntitySetProxy(self._service, entity_set)
+        self._entity_sets[name] = proxy
+        return proxy
 
 
 class FunctionContainer:
     """Set of Function proxies
 
        Call a server-side functions (also known as a service operation).
+       The response handlers are created on first access and cached.
     """
 
     def __init__(self, service):
@@ -1663,110 +4451,125 @@ class FunctionContainer:
 
         self._functions = dict()
 
-        for fimport in self._service.schema.function_imports:
-            self._functions[fimport.name] = fimport
-
     def __getattr__(self, name):
+        try:
+            fimport, handler = self._functions[name]
+        except KeyError:
+            try:
+                fimport = self._service.schema.function_import(name)
+            except KeyError:
+                raise AttributeError(
+                    f"Function {name} not defined in "
+                    f"{','.join(fi.name for fi in self._service.schema.function_imports)}.")
 
-        if name not in self._functions:
-            raise AttributeError(
-                f"Function {name} not defined in {','.join(list(self._functions.keys()))}.")
-
-        fimport = self._service.schema.function_import(name)
+            handler = partial(self._function_import_handler, fimport)
+            self._functions[name] = (fimport, handler)
 
-        def _handle_response_status(fimport, response):
-            # errors — raise on any non-2xx response
-            if 300 <= response.status_code < 400:
-                raise HttpError(f'Function Import {fimport.name} requires Redirection which is not supported',
-                                response)
-            if response.status_code == 401:
-                raise HttpError(f'Not authorized to call Function Import {fimport.name}',
-                                response)
-            if response.status_code == 403:
-                raise HttpError(f'Missing privileges to call Function Import {fimport.name}',
-                                response)
-            if response.status_code == 405:
-                raise HttpError(
-                    f'Despite definition Function Import {fimport.name} does not support HTTP {fimport.http_method}',
-                    response)
-            if 400 <= response.status_code < 500:
-                raise HttpError(
-                    f'Function Import {fimport.name} call has failed with status code {response.status_code}',
-                    response)
-            if response.status_code >= 500:
-                raise HttpError(f'Server has encountered an error while processing Function Import {fimport.name}',
-                                response)
+        return FunctionRequest(self._service.url, self._service.connection, handler, fimport,
+                               response_hook=self._service.response_hook,
+                               max_url_length=self._service.config['http']['max_url_length'])
 
-            # warnings — unexpected 2xx codes
-            if fimport.return_type is None:
-                if response.status_code != 204:
-                    logging.getLogger(LOGGER_NAME).warning(
-                        'The No Return Function Import %s has replied with HTTP Status Code %d instead of 204',
-                        fimport.name, response.status_code)
-            elif response.status_code != 200:
+    @staticmethod
+    def _handle_response_status(fimport, response):
+        # errors — raise on any non-2xx response
+        if 300 <= response.status_code < 400:
+            raise HttpError(f'Function Import {fimport.name} requires Redirection which is not supported',
+                            response)
+        if response.status_code == 401:
+            raise HttpError(f'Not authorized to call Function Import {fimport.name}',
+                            response)
+        if response.status_code == 403:
+            raise HttpError(f'Missing privileges to call Function Import {fimport.name}',
+                            response)
+        if response.status_code == 405:
+            raise HttpError(
+                f'Despite definition Function Import {fimport.name} does not support HTTP {fimport.http_method}',
+                response)
+        if 400 <= response.status_code < 500:
+            raise HttpError(
+                f'Function Import {fimport.name} call has failed with status code {response.status_code}',
+                response)
+        if response.status_code >= 500:
+            raise HttpError(f'Server has encountered an error while processing Function Import {fimport.name}',
+                            response)
+
+        # warnings — unexpected 2xx codes
+        if fimport.return_type is None:
+            if response.status_code != 204:
                 logging.getLogger(LOGGER_NAME).warning(
-                    'The Function Import %s has replied with HTTP Status Code %d instead of 200',
+                    'The No Return Function Import %s has replied with HTTP Status Code %d instead of 204',
                     fimport.name, response.status_code)
+        elif response.status_code != 200:
+            logging.getLogger(LOGGER_NAME).warning(
+                'The Function Import %s has replied with HTTP Status Code %d instead of 200',
+                fimport.name, response.status_code)
 
-        def function_import_handler(fimport, response):
-            """Get function call response from HTTP Response"""
+    def _function_import_handler(self, fimport, response):
+        """Get function call response from HTTP Response"""
 
-            _handle_response_status(fimport, response)
+        self._handle_response_status(fimport, response)
 
-            if fimport.return_type is None:
-                if response.text:
-                    logging.getLogger(LOGGER_NAME).warning(
-                        'The No Return Function Import %s has returned content:\n%s', fimport.name, response.text)
-
-                return None
+        if fimport.return_type is None:
+            if response.text:
+                logging.getLogger(LOGGER_NAME).warning(
+                    'The No Return Function Import %s has returned content:\n%s', fimport.name, response.text)
 
-            response_data = response.json()['d']
+            return None
 
-            # 1. if return type is an entity type or collection, resolve the entity set once
-            if isinstance(fimport.return_type, (model.EntityType, model.Collection)):
-                entity_set = self._service.schema.entity_set(fimport.entity_set_name)
+        response_data = response.json()['d']
 
-            if isinstance(fimport.return_type, model.EntityType):
-                return EntityProxy(self._service, entity_set, fimport.return_type, response_data)
+        # 1. if return type is an entity type or collection, resolve the entity set once
+        if isinstance(fimport.return_type, (model.EntityType, model.Collection)):
+            entity_set = self._service.schema.entity_set(fimport.entity_set_name)
 
-            if isinstance(fimport.return_type, model.Collection):
-                total_count = None
-                next_url = None
-                if '__count' in response_data:
-                    total_count = int(response_data['__count'])
-                if '__next' in response_data:
-                    next_url = response_data['__next']
-                results = response_data.get('results')
-                if results is None:
-                    raise PyODataException(
-                        f'Function import {fimport.name} returned a Collection response without a "results" key')
-                collection = ListWithTotalCount(total_count, next_url)
-                collection_item_type = fimport.return_type.item_type
-                for entity in results:
-                    collection.append(EntityProxy(self._service, entity_set, collection_item_type, entity))
-                return collection
+        if isinstance(fimport.return_type, model.EntityType):
+            return self._service.entity_identity(
+                EntityProxy(self._service, entity_set, fimport.return_type, response_data))
 
-            # 2. return raw data for all other return types (primitives, complex types encoded in dicts, etc.)
-            return response_data
+        if isinstance(fimport.return_type, model.Collection):
+            total_count = None
+            next_url = None
+            if '__count' in response_data:
+                total_count = int(response_data['__count'])
+            if '__next' in response_data:
+                next_url = response_data['__next']
+            results = response_data.get('results')
+            if results is None:
+                raise PyODataException(
+                    f'Function import {fimport.name} returned a Collection response without a "results" key')
+            collection = ListWithTotalCount(total_count, next_url)
+            collection_item_type = fimport.return_type.item_type
+            for entity in results:
+                collection.append(self._service.entity_identity(
+                    EntityProxy(self._service, entity_set, collection_item_type, entity)))
+            return collection
 
-        return FunctionRequest(self._service.url, self._service.connection,
-                               partial(function_import_handler, fimport), fimport,
-                               response_hook=self._service.response_hook)
+        # 2. return raw data for all other return types (primitives, complex types encoded in dicts, etc.)
+        return response_data
 
 
 class Service:
     """OData service"""
 
+    # pylint: disable=too-many-public-methods
+
     def __init__(self, url, schema, connection, config=None, response_hook=None):
         self._url = url
         self._schema = schema
         self._connection = connection
         self._retain_null = config.retain_null if config else False
         self._response_hook = response_hook
+        self._identity_map = None
+        self._coalescer = None
+        self._select_profiler = None
+        self._navigation_routes = None
         self._entity_container = EntityContainer(self)
         self._function_container = FunctionContainer(self)
 
-        self._config = {'http': {'update_method': 'PATCH'}}
+        self._config = {'http': {'update_method': 'PATCH', 'max_url_length': None},
+                        'entity': {'load_all_on_miss': False},
+                        'batch': {'max_parts': 100, 'max_size': None, 'parallelism': 4},
+                        'filter': {'max_size': None, 'parallelism': 4}}
 
     @property
     def schema(self):
@@ -1792,6 +4595,55 @@ class Service:
 
         return self._response_hook
 
+    @property
+    def identity_map(self):
+        """Optional EntityIdentityMap deduplicating entity proxies"""
+
+        return self._identity_map
+
+    @identity_map.setter
+    def identity_map(self, value):
+        self._identity_map = value
+
+    @property
+    def coalescer(self):
+        """Optional RequestCoalescer sending concurrent entity requests in batches"""
+
+        return self._coalescer
+
+    @coalescer.setter
+    def coalescer(self, value):
+        self._coalescer = value
+
+    @property
+    def select_profiler(self):
+        """Optional SelectProfiler adding learned $select to entity set queries"""
+
+        return self._select_profiler
+
+    @select_profiler.setter
+    def select_profiler(self, value):
+        self._select_profiler = value
+
+    @property
+    def navigation_routes(self):
+        """NavigationRoutingTable of the schema built on first use"""
+
+        if self._navigation_routes is None:
+            self._navigation_routes = NavigationRoutingTable(self._schema)
+
+        return self._navigation_routes
+
+    def entity_identity(self, entity):
+        """Returns the proxy tracked by the identity map for the entity
+           or the entity itself if the identity map is not enabled.
+        """
+
+        if self._identity_map is None:
+            return entity
+
+        return self._identity_map.add(entity)
+
     @property
     def retain_null(self):
         """Whether to respect null-ed values or to substitute them with type specific default values"""
@@ -1848,6 +4700,152 @@ class Service:
             handler,
             headers={'Accept': 'application/json'})
 
+    def bulk_load(self, entities, *names):
+        """Returns batch request fetching values of the properties missing
+           in the given entity proxies (all not loaded properties if no names
+           are given) by one $batch with one $select request per entity.
+
+           The batch request returns the list of updated entity proxies.
+           If no entity misses any of the properties, the batch has no requests
+           and executing it sends nothing and returns an empty list.
+        """
+
+        batch = self.create_batch()
+
+        for entity in entities:
+            # pylint: disable=protected-access
+            unloaded = entity._unloaded_proprties(names)
+            if unloaded:
+                batch.add_request(entity.get_proprties(*unloaded))
+
+        return batch
+
+    def _prefetch_route(self, entities, nav_name):
+        """Returns the route of the navigation property of the entities
+           and the values of the referential constraint of every entity
+        """
+
+        # pylint: disable=protected-access
+        entity_types = {entity._entity_type for entity in entities}
+        if len(entity_types) != 1:
+            raise PyODataException(f'Cannot prefetch {nav_name} of entities of types '
+                                   f'{", ".join(sorted(entity_type.name for entity_type in entity_types))}')
+
+        entity_type = entity_types.pop()
+        route = self.navigation_routes.resolve(entity_type, nav_name)
+
+        if not route.key_mapping:
+            raise PyODataException(
+                f'Navigation property {nav_name} of {entity_type.name} has no referential constraint')
+
+        keys = [tuple(getattr(entity, source) for source, _ in route.key_mapping) for entity in entities]
+
+        return route, keys
+
+    @staticmethod
+    def _prefetch_filters(route, keys, chunk_size):
+        """Returns $filter strings matching targets of chunks of chunk_size keys"""
+
+        chainable = GetEntitySetFilterChainable(route.entity_set.entity_type, (), {})
+        renderers = [chainable.lookup_renderer(target, 'eq') for _, target in route.key_mapping]
+
+        def render(key):
+            expressions = [render_eq(value) for render_eq, value in zip(renderers, key)]
+            if len(expressions) == 1:
+                return expressions[0]
+
+            return f"({' and '.join(expressions)})"
+
+        keys = [key for key in OrderedDict.fromkeys(keys) if None not in key]
+
+        return [' or '.join(render(key) for key in keys[start:start + chunk_size])
+                for start in range(0, len(keys), chunk_size)]
+
+    @staticmethod
+    def _attach_prefetched(entities, nav_name, route, keys, results):
+        """Caches the fetched targets grouped by the referential constraint
+           as the values of the navigation property of the entities
+        """
+
+        targets = {}
+        for result in results:
+            for target in result:
+                key = tuple(getattr(target, target_name) for _, target_name in route.key_mapping)
+                targets.setdefault(key, OrderedDict()).setdefault(target.entity_key, target)
+
+        many = route.multiplicity == model.EndRole.MULTIPLICITY_ZERO_OR_MORE
+        for entity, key in zip(entities, keys):
+            values = list(targets.get(key, {}).values())
+
+            # pylint: disable=protected-access
+            entity._cache[nav_name] = values if many else next(iter(values), None)
+
+        return entities
+
+    def prefetch(self, entities, nav_name, chunk_size=100):
+        """Fetches the entities referenced by the navigation property of all
+           the given entity proxies by requests filtering the target entity
+           set by the referential constraint of the association for chunks
+           of chunk_size entities. The requests are sent concurrently
+           according to config['filter']['parallelism'].
+
+           The targets are cached as values of the navigation property of
+           the proxies, the same way as expanded entities, and the list of
+           the proxies is returned.
+        """
+
+        entities = list(entities)
+        if not entities:
+            return entities
+
+        route, keys = self._prefetch_route(entities, nav_name)
+        filters = self._prefetch_filters(route, keys, chunk_size)
+        entity_set_proxy = getattr(self.entity_sets, route.entity_set.name)
+
+        def fetch(filter_val):
+            request = entity_set_proxy.get_entities().filter(filter_val)
+            result = request.execute()
+            while result.next_url is not None:
+                page = request.next_url(result.next_url).execute()
+                page[:0] = result
+                result = page
+
+            return result
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.config['filter']['parallelism']) as executor:
+            results = list(executor.map(fetch, filters))
+
+        return self._attach_prefetched(entities, nav_name, route, keys, results)
+
+    async def async_prefetch(self, entities, nav_name, chunk_size=100):
+        """Fetches asynchronously the entities referenced by the navigation
+           property of all the given entity proxies the same way as prefetch()
+        """
+
+        entities = list(entities)
+        if not entities:
+            return entities
+
+        route, keys = self._prefetch_route(entities, nav_name)
+        filters = self._prefetch_filters(route, keys, chunk_size)
+        entity_set_proxy = getattr(self.entity_sets, route.entity_set.name)
+        semaphore = asyncio.Semaphore(self.config['filter']['parallelism'])
+
+        async def fetch(filter_val):
+            async with semaphore:
+                request = entity_set_proxy.get_entities().filter(filter_val)
+                result = await request.async_execute()
+                while result.next_url is not None:
+                    page = await request.next_url(result.next_url).async_execute()
+                    page[:0] = result
+                    result = page
+
+                return result
+
+        results = await asyncio.gather(*(fetch(filter_val) for filter_val in filters))
+
+        return self._attach_prefetched(entities, nav_name, route, keys, results)
+
     def create_batch(self, batch_id=None):
         """Create instance of OData batch request"""
 
@@ -1860,18 +4858,17 @@ class Service:
             for part, req in zip(parts, batch.requests):
                 logging.getLogger(LOGGER_NAME).debug('Batch handler is processing part %s for request %s', part, req)
 
-                # if part represents multiple requests, dont' parse body and
-                # process parts by appropriate reuqest instance
-                if isinstance(req, MultipartRequest):
-                    result.append(req.handler(req, part))
-                else:
-                    # part represents single request, we have to parse
-                    # content (without checking Content type for binary/http)
-                    response = ODataHttpResponse.from_string(part[0])
-                    result.append(req.handler(response))
+                result.append(BatchRequest.part_result(req, part))
             return result
 
-        return BatchRequest(self._url, self._connection, batch_handler, batch_id)
+        return BatchRequest(self._url, self._connection, batch_handler, batch_id, response_hook=self._response_hook)
+
+    def create_batch_dispatcher(self, max_parts=None, max_size=None, parallelism=None):
+        """Create instance of dispatcher sending requests in several concurrent
+           batch requests. Limits not given are taken from config['batch'].
+        """
+
+        return BatchDispatcher(self, max_parts, max_size, parallelism)
 
     def create_changeset(self, changeset_id=None):
         """Create instance of OData changeset"""
@@ -1889,7 +4886,7 @@ class Service:
             if not isinstance(parts[0], list):
                 # raise error (even for successfull status codes) since such changeset response
                 # always means something wrong happened on server
-                response = ODataHttpResponse.from_string(parts[0])
+                response = parts[0]
                 raise HttpError('Changeset cannot be processed due to single response received, status code: {}'.format(
                     response.status_code), response)
 
@@ -1900,11 +4897,8 @@ class Service:
                 if isinstance(req, MultipartRequest):
                     raise PyODataException('Changeset cannot contain nested multipart content')
 
-                # part represents single request, we have to parse
-                # content (without checking Content type for binary/http)
-                response = ODataHttpResponse.from_string(part[0])
-
-                result.append(req.handler(response))
+                # part represents single request and contains its response
+                result.append(req.handler(part[0]))
 
             return result
 
@@ -1914,11 +4908,13 @@ class Service:
 class MultipartRequest(ODataHttpRequest):
     """HTTP Batch request"""
 
-    def __init__(self, url, connection, handler, request_id=None):
-        super(MultipartRequest, self).__init__(url, connection, partial(MultipartRequest.http_response_handler, self))
+    def __init__(self, url, connection, handler, request_id=None, response_hook=None):
+        super(MultipartRequest, self).__init__(url, connection, partial(MultipartRequest.http_response_handler, self),
+                                               response_hook=response_hook)
 
         self.requests = []
         self._handler_decoded = handler
+        self._chunked = False
 
         # generate random id of form dddd-dddd-dddd
         # pylint: disable=invalid-name
@@ -1942,24 +4938,49 @@ class MultipartRequest(ODataHttpRequest):
     def get_body(self):
         return encode_multipart(self.get_boundary(), self.requests)
 
+    def get_payload(self):
+        if self._chunked:
+            return iter_encode_multipart(self.get_boundary(), self.requests)
+
+        return encode_multipart_bytes(self.get_boundary(), self.requests)
+
+    def get_async_payload(self):
+        if self._chunked:
+            return async_iter_encode_multipart(self.get_boundary(), self.requests)
+
+        return encode_multipart_bytes(self.get_boundary(), self.requests)
+
+    def chunked(self, enabled=True):
+        """Sends body encoded part by part with chunked transfer encoding
+           instead of encoding it whole in memory before sending
+        """
+
+        self._chunked = enabled
+        return self
+
     def add_request(self, request):
         """Add request to be sent in batch"""
 
         self.requests.append(request)
         self._logger.debug('New %s request added to multipart request %s', request.get_method(), self.id)
 
+    def check_response_status(self, response):
+        """Raise HttpError if the service did not accept the mutipart HTTP request"""
+
+        if response.status_code != 202:  # 202 Accepted
+            raise HttpError('HTTP POST for multipart request {0} failed with status code {1}'
+                            .format(self.id, response.status_code), response)
+
     @staticmethod
     def http_response_handler(request, response):
         """Process HTTP response to mutipart HTTP request"""
 
-        if response.status_code != 202:  # 202 Accepted
-            raise HttpError('HTTP POST for multipart request {0} failed with status code {1}'
-                            .format(request.id, response.status_code), response)
+        request.check_response_status(response)
 
         logging.getLogger(LOGGER_NAME).debug('Generic multipart http response request handler called')
 
         # get list of all parts (headers + body)
-        decoded = decode_multipart(response.content.decode('utf-8'), response.headers['Content-Type'])
+        decoded = decode_multipart_bytes(response.content, response.headers['Content-Type'])
 
         return request.handler(request, decoded)
 
@@ -1978,6 +4999,217 @@ class BatchRequest(MultipartRequest):
         # pylint: disable=no-self-use
         return 'POST'
 
+    @staticmethod
+    def part_result(request, part):
+        """Returns result of handler of the request for its part of batch response"""
+
+        # if part represents multiple requests, process parts by appropriate request instance
+        if isinstance(request, MultipartRequest):
+            return request.handler(request, part)
+
+        # part represents single request and contains its response
+        return request.handler(part[0])
+
+    def execute(self):
+        """Sends the batch request and returns processed result
+
+           An empty batch is not sent and its handler processes no parts.
+        """
+
+        if not self.requests:
+            self._logger.debug('Batch %s has no requests, nothing is sent', self.id)
+            return self.handler(self, [])
+
+        return super(BatchRequest, self).execute()
+
+    async def async_execute(self):
+        """Sends the batch request and returns processed result
+
+           An empty batch is not sent and its handler processes no parts.
+        """
+
+        if not self.requests:
+            self._logger.debug('Batch %s has no requests, nothing is sent', self.id)
+            return self.handler(self, [])
+
+        return await super(BatchRequest, self).async_execute()
+
+    def iter_execute(self, chunk_size=65536):
+        """Sends the batch request and yields results of the requests as soon
+           as their parts of the batch response are received
+
+           The connection must support streamed responses the way requests
+           (request() with stream=True) or httpx (stream()) does.
+        """
+
+        if not self.requests:
+            return
+
+        url, body, headers, params = self._build_request()
+        method = self.get_method()
+
+        if callable(getattr(self._connection, 'stream', None)):
+            # httpx takes raw bodies as content
+            with self._connection.stream(method, url, headers=headers, params=urlencode(params),
+                                         content=body) as response:
+                yield from self._iter_streamed_results(response, response.iter_bytes(chunk_size))
+
+            return
+
+        try:
+            response = self._connection.request(method, url, headers=headers, params=urlencode(params), data=body,
+                                                stream=True)
+        except TypeError as ex:
+            raise PyODataException(self._streaming_not_supported_message()) from ex
+
+        if not hasattr(response, 'iter_content'):
+            raise PyODataException(self._streaming_not_supported_message())
+
+        try:
+            yield from self._iter_streamed_results(response, response.iter_content(chunk_size))
+        finally:
+            response.close()
+
+    def _streaming_not_supported_message(self):
+        return (f'Connection {self._connection.__class__.__name__} of batch {self.id} does not support streamed '
+                'responses, use a requests or httpx connection')
+
+    def _iter_streamed_results(self, response, chunks):
+        """Yields results of the requests for parts of the streamed response"""
+
+        # the body is streamed, so neither the log nor the hook can read it in advance
+        self._log_response(response)
+        self._call_response_hook(response)
+
+        self.check_response_status(response)
+
+        decoder = MultipartStreamDecoder(response.headers['Content-Type'])
+
+        for part, request in zip(decoder.iter_parts(chunks), self.requests):
+            yield BatchRequest.part_result(request, part)
+
+    async def async_iter_execute(self, chunk_size=65536):
+        """Sends the batch request and yields results of the requests as soon
+           as their parts of the batch response are received
+
+           The connection must support streamed responses the way aiohttp does.
+        """
+
+        if not self.requests:
+            return
+
+        url, body, headers, params = self._build_request(asynchronous=True)
+
+        async with self._connection.request(self.get_method(), url, headers=headers, params=params,
+                                            data=body) as async_response:
+            # the body is streamed, so the hook receives the response without content
+            response = ODataHttpResponse(url=async_response.url,
+                                         headers=async_response.headers,
+                                         status_code=async_response.status,
+                                         content=b'')
+            self._log_response(response)
+            self._call_response_hook(response)
+
+            if async_response.status != 202:
+                response.content = await async_response.read()
+                self.check_response_status(response)
+
+            decoder = MultipartStreamDecoder(async_response.headers['Content-Type'])
+            requests = iter(self.requests)
+
+            async for part in decoder.async_iter_parts(async_response.content.iter_chunked(chunk_size)):
+                request = next(requests, None)
+                if request is None:
+                    break
+
+                yield BatchRequest.part_result(request, part)
+
+
+class BatchDispatcher:
+    """Sends requests of a very large batch in several smaller $batch requests
+
+       Requests are split into batches of at most max_parts parts (requests
+       of a changeset are counted separately but never split) and at most
+       max_size bytes of encoded body. The batches are sent by at most
+       parallelism concurrent HTTP requests and the results are returned in
+       the order the requests were added.
+    """
+
+    def __init__(self, service, max_parts=None, max_size=None, parallelism=None):
+        config = service.config['batch']
+
+        self._service = service
+        self._max_parts = max_parts if max_parts is not None else config['max_parts']
+        self._max_size = max_size if max_size is not None else config['max_size']
+        self._parallelism = parallelism if parallelism is not None else config['parallelism']
+        self.requests = []
+
+    def add_request(self, request):
+        """Add request to be sent in one of the batches"""
+
+        self.requests.append(request)
+
+    @staticmethod
+    def _part_count(request):
+        if isinstance(request, MultipartRequest):
+            return len(request.requests)
+
+        return 1
+
+    @staticmethod
+    def _encoded_size(request):
+        return len(encode_multipart_bytes('batch', [request]))
+
+    def split(self):
+        """Returns list of batch requests respecting the limits"""
+
+        batches = []
+        batch = None
+        parts = 0
+        size = 0
+
+        for request in self.requests:
+            request_parts = BatchDispatcher._part_count(request)
+            request_size = BatchDispatcher._encoded_size(request) if self._max_size is not None else 0
+
+            if batch is None or (self._max_parts is not None and parts + request_parts > self._max_parts) or \
+                    (self._max_size is not None and size + request_size > self._max_size):
+                batch = self._service.create_batch()
+                batches.append(batch)
+                parts = 0
+                size = 0
+
+            batch.add_request(request)
+            parts += request_parts
+            size += request_size
+
+        return batches
+
+    def execute(self):
+        """Sends the batches and returns results of all requests"""
+
+        batches = self.split()
+        if len(batches) <= 1:
+            return batches[0].execute() if batches else []
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self._parallelism) as executor:
+            results = executor.map(lambda batch: batch.execute(), batches)
+
+            return [result for batch_results in results for result in batch_results]
+
+    async def async_execute(self):
+        """Sends the batches and returns results of all requests"""
+
+        semaphore = asyncio.Semaphore(self._parallelism)
+
+        async def execute_batch(batch):
+            async with semaphore:
+                return await batch.async_execute()
+
+        results = await asyncio.gather(*(execute_batch(batch) for batch in self.split()))
+
+        return [result for batch_results in results for result in batch_results]
+
 
 class Changeset(MultipartRequest):
     """Representation of changeset (unsorted group of requests)"""
@@ -2,6 +2,9 @@
 
 https://docs.aiohttp.org/en/stable/
 """
+import asyncio
+import re
+
 import aiohttp
 from aiohttp import web
 import pytest
@@ -129,3 +132,242 @@ async def test_client_custom_configuration(aiohttp_client, metadata):
 
     assert isinstance(service, pyodata.v2.service.Service)
     assert service.schema.config == custom_config
+
+
+def employees_batch_body(request_body):
+    """Batch response body with an employee for every requested employee key"""
+
+    parts = ''.join(
+        '--batch_r1\n'
+        'Content-Type: application/http\n'
+        'Content-Transfer-Encoding: binary\n'
+        '\n'
+        'HTTP/1.1 200 OK\n'
+        'Content-Type: application/json\n'
+        '\n'
+        f'{{"d": {{"ID": {key}}}}}\n'
+        for key in re.findall(r'GET Employees%28(\d+)%29', request_body))
+
+    return parts + '--batch_r1--'
+
+
+@pytest.mark.asyncio
+async def test_coalesced_get_entities(aiohttp_client, metadata):
+    """Check entity requests awaited together are sent in one batch"""
+
+    batches = []
+
+    async def batch_response(request):
+        body = await request.text()
+        batches.append(body)
+
+        return web.Response(status=202, headers={'Content-Type': 'multipart/mixed; boundary=batch_r1'},
+                            body=employees_batch_body(body))
+
+    app = web.Application()
+    app.router.add_post('/$batch', batch_response)
+    client = await aiohttp_client(app)
+
+    service = await Client.build_async_client(SERVICE_URL, client, metadata=metadata)
+    service.coalescer = pyodata.v2.service.RequestCoalescer(window=0)
+
+    employees = await asyncio.gather(
+        *(service.entity_sets.Employees.get_entity(key).async_execute() for key in (23, 24, 23)))
+
+    assert [employee.ID for employee in employees] == [23, 24, 23]
+    assert employees[0] is employees[2]
+    assert len(batches) == 1
+    assert batches[0].count('GET Employees') == 2
+
+
+@pytest.mark.asyncio
+async def test_batch_request_async_iter_execute(aiohttp_client, metadata):
+    """Check results of batch requests are yielded part by part"""
+
+    async def batch_response(request):
+        return web.Response(status=202, headers={'Content-Type': 'multipart/mixed; boundary=batch_r1'},
+                            body=employees_batch_body(await request.text()))
+
+    app = web.Application()
+    app.router.add_post('/$batch', batch_response)
+    client = await aiohttp_client(app)
+
+    service = await Client.build_async_client(SERVICE_URL, client, metadata=metadata)
+
+    batch = service.create_batch()
+    for key in (23, 24, 25):
+        batch.add_request(service.entity_sets.Employees.get_entity(key))
+
+    assert [employee.ID async for employee in batch.async_iter_execute(chunk_size=16)] == [23, 24, 25]
+
+
+@pytest.mark.asyncio
+async def test_batch_request_async_iter_execute_response_hook(aiohttp_client, metadata):
+    """Check response hook receives the streamed batch response before its parts are decoded"""
+
+    async def batch_response(request):
+        return web.Response(status=202, headers={'Content-Type': 'multipart/mixed; boundary=batch_r1'},
+                            body=employees_batch_body(await request.text()))
+
+    app = web.Application()
+    app.router.add_post('/$batch', batch_response)
+    client = await aiohttp_client(app)
+
+    hooked = []
+    service = await Client.build_async_client(SERVICE_URL, client, metadata=metadata, response_hook=hooked.append)
+
+    batch = service.create_batch()
+    batch.add_request(service.entity_sets.Employees.get_entity(23))
+
+    results = batch.async_iter_execute()
+    assert (await results.__anext__()).ID == 23
+    assert [response.status_code for response in hooked] == [202]
+    assert hooked[0].headers['Content-Type'] == 'multipart/mixed; boundary=batch_r1'
+    await results.aclose()
+
+
+@pytest.mark.asyncio
+async def test_empty_batch_request(aiohttp_client, metadata):
+    """Check batch without requests is not sent"""
+
+    batches = []
+
+    async def batch_response(request):
+        batches.append(await request.text())
+        return web.Response(status=202, headers={'Content-Type': 'multipart/mixed; boundary=batch_r1'},
+                            body='--batch_r1--')
+
+    app = web.Application()
+    app.router.add_post('/$batch', batch_response)
+    client = await aiohttp_client(app)
+
+    service = await Client.build_async_client(SERVICE_URL, client, metadata=metadata)
+
+    assert await service.bulk_load([], 'NickName').async_execute() == []
+    assert [employee async for employee in service.create_batch().async_iter_execute()] == []
+    assert not batches
+
+
+@pytest.mark.asyncio
+async def test_get_entities_split_in_filter(aiohttp_client, metadata):
+    """Check oversized __in filter is split into concurrent requests"""
+
+    filters = []
+
+    async def employees_response(request):
+        filters.append(request.query['$filter'])
+        results = [{'ID': int(key)} for key in re.findall(r'ID eq (\d+)', request.query['$filter'])]
+
+        return web.json_response({'d': {'results': results}})
+
+    app = web.Application()
+    app.router.add_get('/Employees', employees_response)
+    client = await aiohttp_client(app)
+
+    service = await Client.build_async_client(SERVICE_URL, client, metadata=metadata)
+    service.config['filter']['max_size'] = 60
+
+    employees = await service.entity_sets.Employees.get_entities().filter(ID__in=range(20)).async_execute()
+
+    assert sorted(employee.ID for employee in employees) == list(range(20))
+    assert len(filters) > 1
+    assert all(len(filter_val) <= 60 for filter_val in filters)
+
+
+@pytest.mark.asyncio
+async def test_async_prefetch(aiohttp_client, metadata):
+    """Check navigation properties of many entities are prefetched by chunked requests"""
+
+    filters = []
+
+    async def orders_response(request):
+        filters.append(request.query['$filter'])
+        owners = re.findall(r"Owner eq '(\w+)'", request.query['$filter'])
+
+        return web.json_response({'d': {'results': [{'Number': owner, 'Owner': owner} for owner in owners]}})
+
+    app = web.Application()
+    app.router.add_get('/Orders', orders_response)
+    client = await aiohttp_client(app)
+
+    service = await Client.build_async_client(SERVICE_URL, client, metadata=metadata)
+
+    customers = [pyodata.v2.service.EntityProxy(service, service.schema.entity_set('Customers'),
+                                                service.schema.entity_type('Customer'), {'Name': name})
+                 for name in ('Anna', 'Bob', 'Carl')]
+
+    await service.async_prefetch(customers, 'Orders', chunk_size=2)
+
+    assert [[order.Number for order in customer.Orders] for customer in customers] == [['Anna'], ['Bob'], ['Carl']]
+    assert len(filters) == 2
+
+
+@pytest.mark.asyncio
+async def test_chunked_batch_request(aiohttp_client, metadata):
+    """Check body of chunked batch request is streamed by asynchronous client"""
+
+    bodies = []
+
+    async def batch_response(request):
+        bodies.append(await request.text())
+        return web.Response(status=202, headers={'Content-Type': 'multipart/mixed; boundary=batch_r1'},
+                            body=employees_batch_body(bodies[-1]))
+
+    app = web.Application()
+    app.router.add_post('/$batch', batch_response)
+    client = await aiohttp_client(app)
+
+    service = await Client.build_async_client(SERVICE_URL, client, metadata=metadata)
+
+    batch = service.create_batch().chunked()
+    for key in (23, 24):
+        batch.add_request(service.entity_sets.Employees.get_entity(key))
+
+    assert [employee.ID for employee in await batch.async_execute()] == [23, 24]
+    assert bodies[0].encode('utf-8') == pyodata.v2.service.encode_multipart_bytes(batch.get_boundary(),
+                                                                                   batch.requests)
+
+
+@pytest.mark.asyncio
+async def test_coalesced_loads_of_different_proxies(aiohttp_client, metadata):
+    """Check loads of properties into different proxies of the same entity are not merged"""
+
+    batches = []
+
+    async def batch_response(request):
+        body = await request.text()
+        batches.append(body)
+
+        parts = ''.join(
+            '--batch_r1\n'
+            'Content-Type: application/http\n'
+            'Content-Transfer-Encoding: binary\n'
+            '\n'
+            'HTTP/1.1 200 OK\n'
+            'Content-Type: application/json\n'
+            '\n'
+            f'{{"d": {{"ID": {key}, "NameFirst": "Rob"}}}}\n'
+            for key in re.findall(r'GET Employees%28(\d+)%29', body))
+
+        return web.Response(status=202, headers={'Content-Type': 'multipart/mixed; boundary=batch_r1'},
+                            body=parts + '--batch_r1--')
+
+    app = web.Application()
+    app.router.add_post('/$batch', batch_response)
+    client = await aiohttp_client(app)
+
+    service = await Client.build_async_client(SERVICE_URL, client, metadata=metadata)
+    coalescer = pyodata.v2.service.RequestCoalescer(window=0)
+    service.coalescer = coalescer
+
+    entity_set = service.schema.entity_set('Employees')
+    first, second = (pyodata.v2.service.EntityProxy(service, entity_set, entity_set.entity_type, {'ID': 23})
+                     for _ in range(2))
+
+    await asyncio.gather(first.async_load('NameFirst'), second.async_load('NameFirst'))
+
+    assert await first.async_getattr('NameFirst') == 'Rob'
+    assert await second.async_getattr('NameFirst') == 'Rob'
+    assert len(batches) == 1
+    assert batches[0].count('GET Employees') == 2
+    assert not coalescer._async_tasks  # pylint: disable=protected-access
@@ -141,4 +141,32 @@ def test_client_custom_configuration(respx_mock,metadata):
     client = pyodata.Client(SERVICE_URL, httpx, config=custom_config)
 
     assert isinstance(client, pyodata.v2.service.Service)
-    assert client.schema.config == custom_config
\ No newline at end of file
+    assert client.schema.config == custom_config
+
+
+def test_batch_request_iter_execute(respx_mock, metadata):
+    """Check results of batch requests are yielded part by part from streamed response"""
+
+    body = ''.join(
+        '--batch_r1\n'
+        'Content-Type: application/http\n'
+        'Content-Transfer-Encoding: binary\n'
+        '\n'
+        'HTTP/1.1 200 OK\n'
+        'Content-Type: application/json\n'
+        '\n'
+        f'{{"d": {{"ID": {key}}}}}\n'
+        for key in (23, 24)) + '--batch_r1--'
+
+    respx_mock.post(f"{SERVICE_URL}/$batch").mock(
+        return_value=Response(status_code=202,
+                              content=body.encode('utf-8'),
+                              headers={'Content-Type': 'multipart/mixed; boundary=batch_r1'}))
+
+    service = pyodata.Client(SERVICE_URL, httpx, metadata=metadata)
+
+    batch = service.create_batch()
+    for key in (23, 24):
+        batch.add_request(service.entity_sets.Employees.get_entity(key))
+
+    assert [employee.ID for employee in batch.iter_execute(chunk_size=16)] == [23, 24]
@@ -1,17 +1,24 @@
 """Service tests"""
 
+import concurrent.futures
 import datetime
+import dataclasses
+import gc
+import json
+import re
+import typing
 import responses
 import requests
 import pytest
-from urllib.parse import quote
+from urllib.parse import quote, parse_qsl, urlparse
 from unittest.mock import patch
 
 import pyodata.v2.model
 import pyodata.v2.service
 from pyodata.exceptions import PyODataException, HttpError, ExpressionError, ProgramError, PyODataModelError
 from pyodata.v2 import model
-from pyodata.v2.service import EntityKey, EntityProxy, GetEntitySetFilter, ODataHttpResponse, HTTP_CODE_OK
+from pyodata.v2.service import EntityKey, EntityProxy, GetEntitySetFilter, ODataHttpResponse, HTTP_CODE_OK, \
+    EntityIdentityMap, RequestCoalescer, FilterBinary, FilterLogical, parse_filter
 
 from tests.conftest import assert_request_contains_header, contents_of_fixtures_file
 
@@ -372,6 +379,72 @@ def test_entity_key_complex_single_value(service):
     assert str(e_info.value).startswith('Key of entity type')
 
 
+def test_entity_key_hashable(service):
+    """Test entity keys can be used as keys of dictionaries and in sets"""
+
+    employee = service.schema.entity_type('Employee')
+    key = EntityKey(employee, 23)
+
+    assert key == EntityKey(employee, 23)
+    assert key != EntityKey(employee, 24)
+    assert key != EntityKey(service.schema.entity_type('MasterEntity'), Key='23')
+    assert key != '(23)'
+    assert {key: 'Jane'}[EntityKey(employee, 23)] == 'Jane'
+    assert len({key, EntityKey(employee, 23), EntityKey(employee, 24)}) == 2
+
+    # the string form is built once
+    assert key.to_key_string() is key.to_key_string()
+
+    with pytest.raises(AttributeError):
+        key.extra = 'value'
+
+
+def test_entity_key_immutable(service, metadata):
+    """Test entity keys of same named entity types differ and key values cannot be changed"""
+
+    employee = service.schema.entity_type('Employee')
+    other_employee = pyodata.v2.model.schema_from_xml(metadata).entity_type('Employee')
+
+    assert EntityKey(employee, 23) != EntityKey(other_employee, 23)
+    assert len({EntityKey(employee, 23), EntityKey(other_employee, 23)}) == 2
+
+    key = EntityKey(employee, ID=23)
+    assert key.to_key_string() == '(ID=23)'
+
+    with pytest.raises(TypeError):
+        key._proprties['ID'] = 24  # pylint: disable=protected-access
+
+    with pytest.raises(AttributeError):
+        key._proprties = {'ID': 24}  # pylint: disable=protected-access
+
+    assert key.to_key_string() == '(ID=23)'
+
+
+def test_containers_create_proxies_lazily(service):
+    """Entity set proxies and function handlers are created on first access and cached"""
+
+    # pylint: disable=redefined-outer-name,protected-access
+
+    assert not service.entity_sets._entity_sets
+    assert not service.functions._functions
+
+    assert service.entity_sets.MasterEntities is service.entity_sets.MasterEntities
+    assert list(service.entity_sets._entity_sets.keys()) == ['MasterEntities']
+
+    assert service.functions.sum is not service.functions.sum
+    assert service.functions.sum._handler is service.functions.sum._handler
+
+    with pytest.raises(AttributeError) as e_info:
+        service.entity_sets.Unknown
+
+    assert str(e_info.value).startswith('EntitySet Unknown not defined in MasterEntities,')
+
+    with pytest.raises(AttributeError) as e_info:
+        service.functions.unknown
+
+    assert str(e_info.value).startswith('Function unknown not defined in ')
+
+
 @responses.activate
 def test_function_import_primitive(service):
     """Simple function call with primitive return type"""
@@ -1355,6 +1428,84 @@ def test_navigation_when_nes_in_another_ns(service):
     assert orders[0].Owner == 'Mammon'
 
 
+def test_navigation_routes(service):
+    """Navigation routes are resolved once for the whole schema"""
+
+    # pylint: disable=redefined-outer-name
+
+    routes = service.navigation_routes
+    assert routes is service.navigation_routes
+
+    route = routes.route(service.schema.entity_type('Customer'), 'Orders')
+    assert route.navigation_property.name == 'Orders'
+    assert route.entity_set.name == 'Orders'
+    assert route.multiplicity == pyodata.v2.model.EndRole.MULTIPLICITY_ZERO_OR_MORE
+    assert route.key_mapping == (('Name', 'Owner'),)
+
+    route = routes.route(service.schema.entity_type('Car'), 'IDPic')
+    assert route.entity_set.name == 'CarIDPics'
+    assert route.multiplicity == pyodata.v2.model.EndRole.MULTIPLICITY_ONE
+    assert route.key_mapping == (('Name', 'CarName'),)
+
+    with pytest.raises(KeyError):
+        routes.route(service.schema.entity_type('Customer'), 'Invoices')
+
+    with pytest.raises(PyODataException) as e_info:
+        service.entity_sets.Customers.get_entity('Mammon').nav('Invoices')
+
+    assert str(e_info.value) == 'Navigation property Invoices is not declared in EntityType(Customer) entity type'
+
+
+def test_navigation_routes_of_namespaces(xml_builder_factory):
+    """Navigation routes of same named entity types of different namespaces are distinct"""
+
+    def items_schema(namespace, with_association_set):
+        association_set = f"""
+            <AssociationSet Name="ItemParts_AssocSet" Association="{namespace}.ItemParts">
+              <End Role="ItemRole" EntitySet="{namespace}Items"/>
+              <End Role="PartRole" EntitySet="{namespace}Parts"/>
+            </AssociationSet>""" if with_association_set else ''
+
+        return f"""
+            <EntityType Name="Item">
+              <Key><PropertyRef Name="ID"/></Key>
+              <Property Name="ID" Type="Edm.Int32" Nullable="false"/>
+              <NavigationProperty Name="Parts" Relationship="{namespace}.ItemParts" FromRole="ItemRole"
+                                  ToRole="PartRole"/>
+            </EntityType>
+            <EntityType Name="Part">
+              <Key><PropertyRef Name="ID"/></Key>
+              <Property Name="ID" Type="Edm.Int32" Nullable="false"/>
+            </EntityType>
+            <Association Name="ItemParts">
+              <End Type="{namespace}.Item" Multiplicity="1" Role="ItemRole"/>
+              <End Type="{namespace}.Part" Multiplicity="*" Role="PartRole"/>
+            </Association>
+            <EntityContainer Name="{namespace}_SRV">
+              <EntitySet Name="{namespace}Items" EntityType="{namespace}.Item"/>
+              <EntitySet Name="{namespace}Parts" EntityType="{namespace}.Part"/>{association_set}
+            </EntityContainer>"""
+
+    xml_builder = xml_builder_factory()
+    xml_builder.add_schema('First', items_schema('First', True))
+    xml_builder.add_schema('Second', items_schema('Second', False))
+
+    schema = pyodata.v2.model.MetadataBuilder(xml_builder.serialize()).build()
+    svc = pyodata.v2.service.Service(URL_ROOT, schema, requests)
+
+    route = svc.navigation_routes.route(schema.entity_type('Item', namespace='First'), 'Parts')
+    assert route.entity_set.name == 'FirstParts'
+
+    with pytest.raises(KeyError):
+        svc.navigation_routes.route(schema.entity_type('Item', namespace='Second'), 'Parts')
+
+    with pytest.raises(PyODataException) as e_info:
+        svc.entity_sets.SecondItems.get_entity(1).nav('Parts')
+
+    assert str(e_info.value) == \
+        'Target entity set of navigation property Parts of EntityType(Item) entity type cannot be resolved'
+
+
 @responses.activate
 def test_entity_get_value_1on1_with_proxy(service):
     """Check getting $value"""
@@ -1719,246 +1870,1275 @@ def test_get_entity_expanded(service):
     
 
 @responses.activate
-def test_batch_request(service):
-    """Batch requests"""
+def test_identity_map_get_entity(service):
+    """Entity tracked by the identity map is not fetched again"""
 
     # pylint: disable=redefined-outer-name
 
-    response_body = (b'--batch_r1\n'
-                     b'Content-Type: application/http\n'
-                     b'Content-Transfer-Encoding: binary\n'
-                     b'\n'
-                     b'HTTP/1.1 200 OK\n'
-                     b'Content-Type: application/json\n'
-                     b'\n'
-                     b'{"d": {"ID": 23, "NameFirst": "Rob", "NameLast": "Ickes", "Address": { "ID": 456, "Street": "Baker Street", "City": "London"} }}'
-                     b'\n'
-                     b'--batch_r1\n'
-                     b'Content-Type: multipart/mixed; boundary=changeset_1\n'
-                     b'\n'
-                     b'--changeset_1\n'
-                     b'Content-Type: application/http\n'
-                     b'Content-Transfer-Encoding: binary\n'
-                     b'\n'
-                     b'HTTP/1.1 204 Updated\n'
-                     b'Content-Type: application/json\n'
-                     b'\n'
-                     b"{b'd': {'Sensor': 'Sensor-address', 'Date': datetime\'2017-12-24T18:00\', 'Value': '34.0d'}}"
-                     b'\n'
-                     b'--changeset_1--\n'
-                     b'\n'
-                     b'--batch_r1--')
+    service.identity_map = EntityIdentityMap()
 
     responses.add(
-        responses.POST,
-        f'{URL_ROOT}/$batch',
-        body=response_body,
-        content_type='multipart/mixed; boundary=batch_r1',
-        status=202)
+        responses.GET,
+        f"{service.url}/{quote('Employees(23)')}",
+        json={'d': {'ID': 23, 'NameFirst': 'Rob', 'NameLast': 'Ickes'}},
+        status=200)
 
-    batch = service.create_batch('batch1')
+    first = service.entity_sets.Employees.get_entity(23).execute()
+    second = service.entity_sets.Employees.get_entity(23).execute()
 
-    chset = service.create_changeset('chset1')
+    assert first is second
+    assert len(responses.calls) == 1
+    assert service.identity_map.hits == 1
+    assert service.identity_map.hit_ratio == 0.5
 
-    employee_request = service.entity_sets.Employees.get_entity(23)
 
-    temp_request = service.entity_sets.TemperatureMeasurements.update_entity(
-        Sensor='sensor1',
-        Date=datetime.datetime(2017, 12, 24, 18, 0, tzinfo=datetime.timezone.utc)).set(Value=34.0)
+@responses.activate
+def test_identity_map_deduplicates_entities(service):
+    """The same entity in several responses is represented by one proxy"""
 
-    batch.add_request(employee_request)
+    # pylint: disable=redefined-outer-name
 
-    chset.add_request(temp_request)
+    service.identity_map = EntityIdentityMap()
 
-    batch.add_request(chset)
+    responses.add(
+        responses.GET,
+        f"{service.url}/Employees",
+        json={'d': {'results': [{'ID': 23, 'NameFirst': 'Rob', 'NameLast': 'Ickes'}]}},
+        status=200)
 
-    response = batch.execute()
+    responses.add(
+        responses.GET,
+        f"{service.url}/Employees?$expand=Addresses",
+        json={'d': {'results': [{
+            'ID': 23,
+            'NameFirst': 'Robert',
+            'NameLast': 'Ickes',
+            'Addresses': {'results': [{'ID': 456, 'Street': 'Baker Street', 'City': 'London'}]}
+        }]}},
+        status=200)
 
-    assert len(response) == 2
+    first = service.entity_sets.Employees.get_entities().execute()[0]
+    second = service.entity_sets.Employees.get_entities().expand('Addresses').execute()[0]
 
-    employee_response = response[0]
-    assert isinstance(employee_response, pyodata.v2.service.EntityProxy)
+    assert first is second
+    assert first.NameFirst == 'Robert'
+    assert first.Addresses[0] is service.entity_sets.Addresses.get_entity(456).execute()
+    assert len(responses.calls) == 2
 
-    chset_response = response[1]
-    assert isinstance(chset_response, list)
-    assert len(chset_response) == 1
-    assert chset_response[0] is None   # response to update request is None
 
 @responses.activate
-def test_batch_request_not_encoded_path(service):
-    """Batch requests"""
+def test_identity_map_discards_deleted_entity(service):
+    """Deleted entity is not tracked anymore"""
 
     # pylint: disable=redefined-outer-name
 
-    response_body = (b'--batch_r1\n'
-                     b'Content-Type: application/http\n'
-                     b'Content-Transfer-Encoding: binary\n'
-                     b'\n'
-                     b'HTTP/1.1 200 OK\n'
-                     b'Content-Type: application/json\n'
-                     b'\n'
-                     b'{"d": {"ID": 23, "NameFirst": "Rob", "NameLast": "Ickes", "Address": { "ID": 456, "Street": "Baker Street", "City": "London"} }}'
-                     b'\n'
-                     b'--batch_r1\n'
-                     b'Content-Type: multipart/mixed; boundary=changeset_1\n'
-                     b'\n'
-                     b'--changeset_1\n'
-                     b'Content-Type: application/http\n'
-                     b'Content-Transfer-Encoding: binary\n'
-                     b'\n'
-                     b'HTTP/1.1 204 Updated\n'
-                     b'Content-Type: application/json\n'
-                     b'\n'
-                     b"{b'd': {'Sensor': 'Sensor-address', 'Date': datetime\'2017-12-24T18:00\', 'Value': '34.0d'}}"
-                     b'\n'
-                     b'--changeset_1--\n'
-                     b'\n'
-                     b'--batch_r1--')
+    service.identity_map = EntityIdentityMap()
 
     responses.add(
-        responses.POST,
-        f'{URL_ROOT}/$batch',
-        body=response_body,
-        content_type='multipart/mixed; boundary=batch_r1',
-        status=202)
+        responses.GET,
+        f"{service.url}/{quote('Employees(23)')}",
+        json={'d': {'ID': 23, 'NameFirst': 'Rob', 'NameLast': 'Ickes'}},
+        status=200)
 
-    batch = service.create_batch('batch1')
+    responses.add(responses.DELETE, f"{service.url}/{quote('Employees(23)')}", status=204)
 
-    chset = service.create_changeset('chset1')
+    service.entity_sets.Employees.get_entity(23).execute()
+    service.entity_sets.Employees.delete_entity(23).execute()
 
-    employee_request = service.entity_sets.Employees.get_entity(23, encode_path=False)
+    assert len(service.identity_map) == 0
 
-    assert employee_request.get_path() == 'Employees(23)'
 
-    temp_request = service.entity_sets.TemperatureMeasurements.update_entity(
-        Sensor='sensor1',
-        Date=datetime.datetime(2017, 12, 24, 18, 0, tzinfo=datetime.timezone.utc),
-        encode_path=True).set(Value=34.0)
+def test_identity_map_lru_eviction(service):
+    """The least recently used entity is evicted"""
 
-    batch.add_request(employee_request)
+    # pylint: disable=redefined-outer-name
 
-    chset.add_request(temp_request)
+    identity_map = EntityIdentityMap(max_size=2)
+    entity_set = service.schema.entity_set('Employees')
+    entity_type = entity_set.entity_type
 
-    assert f'{temp_request.get_method()} TemperatureMeasurements%28Sensor%3D%27sensor1%27%2CDate%3Ddatetime%272017-12-24T18%3A00%3A00%27%29' in chset.get_body()
+    first, second, third = (EntityProxy(service, entity_set, entity_type, {'ID': i}) for i in range(3))
 
-    batch.add_request(chset)
-    batch.add_request(temp_request)
+    identity_map.add(first)
+    identity_map.add(second)
+    assert identity_map.get('Employees', first.entity_key) is first
+    identity_map.add(third)
 
-    response = batch.execute()
+    assert len(identity_map) == 2
+    assert identity_map.get('Employees', second.entity_key) is None
+    assert identity_map.get('Employees', first.entity_key) is first
 
-    assert len(response) == 2
 
-    employee_response = response[0]
-    assert isinstance(employee_response, pyodata.v2.service.EntityProxy)
+def test_identity_map_weak_references(service):
+    """Weak identity map does not keep entities alive"""
+
+    # pylint: disable=redefined-outer-name
+
+    identity_map = EntityIdentityMap(weak=True)
+    entity_set = service.schema.entity_set('Employees')
+
+    entity = identity_map.add(EntityProxy(service, entity_set, entity_set.entity_type, {'ID': 23}))
+    key = entity.entity_key
+    assert identity_map.get('Employees', key) is entity
+
+    del entity
+    gc.collect()
+
+    assert identity_map.get('Employees', key) is None
 
-    chset_response = response[1]
-    assert isinstance(chset_response, list)
-    assert len(chset_response) == 1
-    assert chset_response[0] is None   # response to update request is None
 
 @responses.activate
-def test_enormous_batch_request(service):
-    """Batch requests"""
+def test_entity_refresh_not_modified(service):
+    """Refresh of not modified entity returns the same proxy"""
 
     # pylint: disable=redefined-outer-name
 
-    response_body = contents_of_fixtures_file('enormous_batch_response')
+    responses.add(
+        responses.GET,
+        f"{service.url}/{quote('Employees(23)')}",
+        headers={'ETag': 'W/"1"'},
+        json={'d': {'ID': 23, 'NameFirst': 'Rob', 'NameLast': 'Ickes'}},
+        status=200)
 
     responses.add(
-        responses.POST,
-        f'{URL_ROOT}/$batch',
-        body=response_body,
-        content_type='multipart/mixed; boundary=16804F9C063D8720EACA19F7DFB3CD4A0',
-        status=202)
+        responses.GET,
+        f"{service.url}/{quote('Employees(23)')}",
+        status=304)
 
-    batch = service.create_batch()
+    employee = service.entity_sets.Employees.get_entity(23).execute()
+    refreshed = employee.refresh().execute()
 
-    employee_request = service.entity_sets.Enumerations.get_entities()
+    assert refreshed is employee
+    assert_request_contains_header(responses.calls[1].request.headers, 'If-None-Match', 'W/"1"')
 
-    batch.add_request(employee_request)
 
-    response = batch.execute()
+@responses.activate
+def test_entity_refresh_modified(service):
+    """Refresh of modified entity returns new values"""
 
-    assert len(response) == 1
-    assert len(response[0]) == 1016
+    # pylint: disable=redefined-outer-name
+
+    responses.add(
+        responses.GET,
+        f"{service.url}/{quote('Employees(23)')}",
+        headers={'ETag': 'W/"1"'},
+        json={'d': {'ID': 23, 'NameFirst': 'Rob', 'NameLast': 'Ickes'}},
+        status=200)
+
+    responses.add(
+        responses.GET,
+        f"{service.url}/{quote('Employees(23)')}",
+        headers={'ETag': 'W/"2"'},
+        json={'d': {'ID': 23, 'NameFirst': 'Robert', 'NameLast': 'Ickes'}},
+        status=200)
+
+    employee = service.entity_sets.Employees.get_entity(23).execute()
+    refreshed = employee.refresh().execute()
+
+    assert refreshed.NameFirst == 'Robert'
+    assert refreshed.etag == 'W/"2"'
 
 
 @responses.activate
-def test_batch_request_failed_changeset(service):
-    """Check single response for changeset"""
+def test_identity_map_revalidate(service):
+    """Revalidating identity map sends conditional requests"""
 
     # pylint: disable=redefined-outer-name
 
-    response_body = ('--batch_r1\n'
-                     'Content-Type: application/http\n'
-                     'Content-Transfer-Encoding: binary\n'
-                     '\n'
-                     'HTTP/1.1 400 Bad Request\n'
-                     'Content-Type: application/json;charset=utf-8'
-                     ''
-                     '{"error": "this is error description"}'
-                     '--batch_r1--')
+    service.identity_map = EntityIdentityMap(revalidate=True)
 
     responses.add(
-        responses.POST,
-        f'{URL_ROOT}/$batch',
-        body=response_body,
-        content_type='multipart/mixed; boundary=batch_r1',
-        status=202)
+        responses.GET,
+        f"{service.url}/{quote('Employees(23)')}",
+        headers={'ETag': 'W/"1"'},
+        json={'d': {'ID': 23, 'NameFirst': 'Rob', 'NameLast': 'Ickes'}},
+        status=200)
 
-    batch = service.create_batch('batch1')
+    responses.add(
+        responses.GET,
+        f"{service.url}/{quote('Employees(23)')}",
+        status=304)
 
-    chset = service.create_changeset('chset1')
+    first = service.entity_sets.Employees.get_entity(23).execute()
+    second = service.entity_sets.Employees.get_entity(23).execute()
 
-    employee_request1 = service.entity_sets.Employees.get_entity(23)
-    employee_request2 = service.entity_sets.Employees.get_entity(23)
+    assert first is second
+    assert len(responses.calls) == 2
+    assert_request_contains_header(responses.calls[1].request.headers, 'If-None-Match', 'W/"1"')
 
-    chset.add_request(employee_request1)
-    chset.add_request(employee_request2)
 
-    batch.add_request(chset)
+@responses.activate
+def test_entity_get_proprties(service):
+    """Get values of several properties by one request"""
 
-    with pytest.raises(HttpError) as e_info:
-        batch.execute()
+    # pylint: disable=redefined-outer-name
 
-    assert str(e_info.value).startswith('Changeset cannot be processed')
-    assert isinstance(e_info.value, HttpError)
-    assert e_info.value.response.status_code == 400
+    responses.add(
+        responses.GET,
+        f"{service.url}/{quote('Employees(23)')}?$select=NameFirst,NickName",
+        json={'d': {'NameFirst': 'Rob', 'NickName': 'Bob'}},
+        status=200)
 
+    entity_set = service.schema.entity_set('Employees')
+    employee = EntityProxy(service, entity_set, entity_set.entity_type, {'ID': 23})
+
+    assert employee.get_proprties('NameFirst', 'NickName').execute() is employee
+    assert employee.NameFirst == 'Rob'
+    assert employee.NickName == 'Bob'
+    assert len(responses.calls) == 1
 
-def test_get_entity_with_entity_key(service):
-    """Make sure the method get_entity handles correctly the parameter key which is EntityKey"""
+
+def test_entity_get_proprties_invalid_property(service):
+    """Only declared properties can be requested"""
 
     # pylint: disable=redefined-outer-name
 
+    entity_set = service.schema.entity_set('Employees')
+    employee = EntityProxy(service, entity_set, entity_set.entity_type, {'ID': 23})
 
-    key = EntityKey(
-        service.schema.entity_type('TemperatureMeasurement'),
-        Sensor='sensor1',
-        Date=datetime.datetime(2017, 12, 24, 18, 0, tzinfo=datetime.timezone.utc))
+    with pytest.raises(PyODataException) as e_info:
+        employee.get_proprties('Age')
 
-    query = service.entity_sets.TemperatureMeasurements.get_entity(key)
-    assert query.get_path() == quote("TemperatureMeasurements(Sensor='sensor1',Date=datetime'2017-12-24T18:00:00')")
+    assert str(e_info.value) == 'Property Age is not declared in Employee entity type'
 
 
-def test_get_entity_with_entity_key_and_other_params(service):
-    """Make sure the method get_entity handles correctly the parameter key which is EntityKey"""
+@responses.activate
+def test_entity_load(service):
+    """Load all not loaded properties by one request"""
 
     # pylint: disable=redefined-outer-name
 
-    key = EntityKey(
-        service.schema.entity_type('TemperatureMeasurement'),
-        Sensor='sensor1',
-        Date=datetime.datetime(2017, 12, 24, 18, 0, tzinfo=datetime.timezone.utc))
+    responses.add(
+        responses.GET,
+        f"{service.url}/{quote('Employees(23)')}?$select=NameLast,NickName",
+        json={'d': {'NameLast': 'Ickes', 'NickName': 'Bob'}},
+        status=200)
 
-    query = service.entity_sets.TemperatureMeasurements.get_entity(key=key, Foo='Bar')
-    assert query.get_path() == quote("TemperatureMeasurements(Sensor='sensor1',Date=datetime'2017-12-24T18:00:00')")
+    entity_set = service.schema.entity_set('Employees')
+    employee = EntityProxy(service, entity_set, entity_set.entity_type, {'ID': 23, 'NameFirst': 'Rob'})
 
+    assert employee.load() is employee
+    assert employee.load('NameLast', 'NickName') is employee
+    assert employee.NameLast == 'Ickes'
+    assert employee.NickName == 'Bob'
+    assert len(responses.calls) == 1
 
-def test_entity_proxy_equals(service):
-    """Two entity proxies are equal if they hold the same data"""
 
-    properties = {'Key': 'a', 'DataType': 'b', 'Data': 'c', 'DataName': 'd'}
+@responses.activate
+def test_entity_load_all_on_miss(service):
+    """The first lazy miss loads all not loaded properties"""
+
+    # pylint: disable=redefined-outer-name
+
+    service.config['entity']['load_all_on_miss'] = True
+
+    responses.add(
+        responses.GET,
+        f"{service.url}/{quote('Employees(23)')}?$select=NameFirst,NameLast,NickName",
+        json={'d': {'NameFirst': 'Rob', 'NameLast': 'Ickes', 'NickName': 'Bob'}},
+        status=200)
+
+    entity_set = service.schema.entity_set('Employees')
+    employee = EntityProxy(service, entity_set, entity_set.entity_type, {'ID': 23})
+
+    assert employee.NameLast == 'Ickes'
+    assert employee.NameFirst == 'Rob'
+    assert employee.NickName == 'Bob'
+    assert len(responses.calls) == 1
+
+    expanded = EntityProxy(service, None, entity_set.entity_type, {'ID': 23})
+    assert not hasattr(expanded, 'NameFirst')
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_bulk_load(service):
+    """Missing property values of several entities are fetched by one batch"""
+
+    # pylint: disable=redefined-outer-name
+
+    response_body = (b'--batch_r1\n'
+                     b'Content-Type: application/http\n'
+                     b'Content-Transfer-Encoding: binary\n'
+                     b'\n'
+                     b'HTTP/1.1 200 OK\n'
+                     b'Content-Type: application/json\n'
+                     b'\n'
+                     b'{"d": {"NickName": "Bob"}}'
+                     b'\n'
+                     b'--batch_r1\n'
+                     b'Content-Type: application/http\n'
+                     b'Content-Transfer-Encoding: binary\n'
+                     b'\n'
+                     b'HTTP/1.1 200 OK\n'
+                     b'Content-Type: application/json\n'
+                     b'\n'
+                     b'{"d": {"NickName": "Geo"}}'
+                     b'\n'
+                     b'--batch_r1--')
+
+    responses.add(
+        responses.POST,
+        f'{URL_ROOT}/$batch',
+        body=response_body,
+        content_type='multipart/mixed; boundary=batch_r1',
+        status=202)
+
+    entity_set = service.schema.entity_set('Employees')
+    employees = [EntityProxy(service, entity_set, entity_set.entity_type, props) for props in (
+        {'ID': 23},
+        {'ID': 24, 'NickName': 'Joe'},
+        {'ID': 25})]
+
+    batch = service.bulk_load(employees, 'NickName')
+    assert len(batch.requests) == 2
+    assert 'GET Employees%2823%29?%24select=NickName HTTP/1.1' in batch.get_body()
+
+    assert batch.execute() == [employees[0], employees[2]]
+    assert [employee.NickName for employee in employees] == ['Bob', 'Joe', 'Geo']
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_bulk_load_nothing_missing(service):
+    """Bulk load of loaded properties sends no request"""
+
+    # pylint: disable=redefined-outer-name
+
+    entity_set = service.schema.entity_set('Employees')
+    employees = [EntityProxy(service, entity_set, entity_set.entity_type, {'ID': key, 'NickName': name})
+                 for key, name in ((23, 'Bob'), (24, 'Joe'))]
+
+    batch = service.bulk_load(employees, 'NickName')
+    assert not batch.requests
+
+    assert batch.execute() == []
+    assert not list(batch.iter_execute())
+    assert not responses.calls
+
+
+@responses.activate
+def test_get_request_with_long_url_tunneled_through_batch(schema):
+    """GET requests with URL longer than the limit are sent in $batch"""
+
+    # pylint: disable=redefined-outer-name
+
+    responses.add(
+        responses.POST,
+        f'{URL_ROOT}/$batch',
+        body=(b'--batch_r1\n'
+              b'Content-Type: application/http\n'
+              b'Content-Transfer-Encoding: binary\n'
+              b'\n'
+              b'HTTP/1.1 200 OK\n'
+              b'Content-Type: application/json\n'
+              b'\n'
+              b'{"d": {"results": [{"ID": 23, "NameFirst": "Rob"}]}}'
+              b'\n'
+              b'--batch_r1--'),
+        content_type='multipart/mixed; boundary=batch_r1',
+        status=202)
+
+    responses.add(
+        responses.GET,
+        f'{URL_ROOT}/Employees',
+        json={'d': {'results': [{'ID': 23, 'NameFirst': 'Rob'}]}},
+        status=200)
+
+    hooked = []
+    service = pyodata.v2.service.Service(URL_ROOT, schema, requests, response_hook=hooked.append)
+    service.config['http']['max_url_length'] = 100
+
+    employees = service.entity_sets.Employees.get_entities().filter(NameFirst__in=['Rob', 'Robert', 'Bob', 'Bobby'])
+    result = employees.execute()
+
+    assert [employee.ID for employee in result] == [23]
+    assert len(responses.calls) == 1
+    assert responses.calls[0].request.method == 'POST'
+
+    body = responses.calls[0].request.body.decode('utf-8')
+    assert "GET Employees?%24filter=%28NameFirst+eq+%27Rob%27+or+NameFirst+eq+%27Robert%27" in body
+    assert [response.status_code for response in hooked] == [200]
+
+    result = service.entity_sets.Employees.get_entities().filter(NameFirst='Rob').execute()
+
+    assert [employee.ID for employee in result] == [23]
+    assert len(responses.calls) == 2
+    assert responses.calls[1].request.method == 'GET'
+
+
+@responses.activate
+def test_function_import_with_long_url_tunneled_through_batch(service):
+    """Function import calls with URL longer than the limit are sent in $batch"""
+
+    # pylint: disable=redefined-outer-name
+
+    responses.add(
+        responses.POST,
+        f'{URL_ROOT}/$batch',
+        body=(b'--batch_r1\n'
+              b'Content-Type: application/http\n'
+              b'Content-Transfer-Encoding: binary\n'
+              b'\n'
+              b'HTTP/1.1 200 OK\n'
+              b'Content-Type: application/json\n'
+              b'\n'
+              b'{"d": 6}'
+              b'\n'
+              b'--batch_r1--'),
+        content_type='multipart/mixed; boundary=batch_r1',
+        status=202)
+
+    service.config['http']['max_url_length'] = len(URL_ROOT)
+
+    assert service.functions.sum.parameter('A', 2).parameter('B', 4).execute() == 6
+    assert 'GET sum?A=2&B=4 HTTP/1.1' in responses.calls[0].request.body.decode('utf-8')
+
+
+def employees_batch_response(request):
+    """Batch response with an employee for every requested employee key"""
+
+    body = b''.join(
+        b'--batch_r1\n'
+        b'Content-Type: application/http\n'
+        b'Content-Transfer-Encoding: binary\n'
+        b'\n'
+        b'HTTP/1.1 200 OK\n'
+        b'Content-Type: application/json\n'
+        b'\n' +
+        f'{{"d": {{"ID": {key}}}}}'.encode('utf-8') +
+        b'\n'
+        for key in re.findall(r'GET Employees%28(\d+)%29', request.body.decode('utf-8')))
+
+    return 202, {'Content-Type': 'multipart/mixed; boundary=batch_r1'}, body + b'--batch_r1--'
+
+
+@responses.activate
+def test_coalesced_get_entities(service):
+    """Concurrent requests for single entities are sent in one batch"""
+
+    # pylint: disable=redefined-outer-name
+
+    responses.add_callback(responses.POST, f'{URL_ROOT}/$batch', callback=employees_batch_response)
+
+    service.coalescer = RequestCoalescer(window=0.2)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+        results = list(executor.map(lambda key: service.entity_sets.Employees.get_entity(key).execute(), [23, 24, 23]))
+
+    assert [employee.ID for employee in results] == [23, 24, 23]
+    assert results[0] is results[2]
+    assert len(responses.calls) == 1
+    assert responses.calls[0].request.body.count(b'GET Employees') == 2
+
+
+@responses.activate
+def test_coalesced_get_entity_single(service):
+    """Request not accompanied by any other request is sent without batch"""
+
+    # pylint: disable=redefined-outer-name
+
+    responses.add(
+        responses.GET,
+        f"{service.url}/{quote('Employees(23)')}",
+        json={'d': {'ID': 23, 'NameFirst': 'Rob'}},
+        status=200)
+
+    service.coalescer = RequestCoalescer(window=0)
+
+    assert service.entity_sets.Employees.get_entity(23).execute().NameFirst == 'Rob'
+    assert len(responses.calls) == 1
+
+
+@dataclasses.dataclass(slots=True)
+class EmployeeName:
+    """Projection of Employee onto its name properties"""
+
+    ID: int
+    NameFirst: str
+    NameLast: str
+
+
+class AddressCity(typing.NamedTuple):
+    """Projection of Address onto its city"""
+
+    ID: int
+    City: str
+
+
+@dataclasses.dataclass(slots=True)
+class EmployeeAddresses:
+    """Projection of Employee expanding its addresses"""
+
+    ID: int
+    Addresses: typing.List[AddressCity]
+
+
+@responses.activate
+def test_get_entities_project(service):
+    """Get entities decoded into a projection type"""
+
+    # pylint: disable=redefined-outer-name
+
+    responses.add(
+        responses.GET,
+        f"{service.url}/Employees?$select=ID,NameFirst,NameLast",
+        json={'d': {
+            'results': [
+                {
+                    'ID': 669,
+                    'NameFirst': 'Yennefer',
+                    'NameLast': 'De Vengerberg'
+                }
+            ]
+        }},
+        status=200)
+
+    request = service.entity_sets.Employees.get_entities().project(EmployeeName)
+    assert request.get_query_params() == {'$select': 'ID,NameFirst,NameLast'}
+
+    empls = request.execute()
+    assert empls == [EmployeeName(669, 'Yennefer', 'De Vengerberg')]
+    assert not hasattr(empls[0], '__dict__')
+
+
+@responses.activate
+def test_get_entities_project_null_values(service, service_retain_null):
+    """Null values of projections are decoded the way entity proxies decode them"""
+
+    # pylint: disable=redefined-outer-name
+
+    for svc in (service, service_retain_null):
+        responses.add(
+            responses.GET,
+            f"{svc.url}/Employees?$select=ID,NameFirst,NameLast",
+            json={'d': {'results': [{'ID': 1337, 'NameFirst': 'Neo', 'NameLast': None}]}},
+            status=200)
+
+    assert service.entity_sets.Employees.get_entities().project(EmployeeName).execute() == [
+        EmployeeName(1337, 'Neo', '')]
+    assert service_retain_null.entity_sets.Employees.get_entities().project(EmployeeName).execute() == [
+        EmployeeName(1337, 'Neo', None)]
+
+
+@responses.activate
+def test_get_entities_project_expand(service):
+    """Navigation fields of a projection are selected and expanded"""
+
+    # pylint: disable=redefined-outer-name
+
+    responses.add(
+        responses.GET,
+        f"{service.url}/Employees?$select=ID,Addresses/ID,Addresses/City&$expand=Addresses",
+        json={'d': {
+            'results': [
+                {
+                    'ID': 23,
+                    'Addresses': {'results': [{'ID': 456, 'City': 'London'}]}
+                }
+            ]
+        }},
+        status=200)
+
+    empls = service.entity_sets.Employees.get_entities().project(EmployeeAddresses).execute()
+
+    assert empls[0].ID == 23
+    assert empls[0].Addresses == [AddressCity(456, 'London')]
+
+
+@dataclasses.dataclass
+class CustomerName:
+    """Projection of Customer name"""
+
+    Name: str
+
+
+@dataclasses.dataclass
+class CustomerReferrer:
+    """Projection of Customer with optional referrer spelled as PEP 604 union"""
+
+    Name: str
+    ReferredBy: CustomerName | None
+
+
+@responses.activate
+def test_get_entities_project_optional_navigation(service):
+    """Navigation fields annotated as X | None are selected and expanded"""
+
+    # pylint: disable=redefined-outer-name
+
+    responses.add(
+        responses.GET,
+        f"{service.url}/Customers?$select=Name,ReferredBy/Name&$expand=ReferredBy",
+        json={'d': {'results': [{'Name': 'Anna', 'ReferredBy': {'Name': 'Bob'}}, {'Name': 'Bob', 'ReferredBy': None}]}},
+        status=200)
+
+    customers = service.entity_sets.Customers.get_entities().project(CustomerReferrer).execute()
+
+    assert customers == [CustomerReferrer('Anna', CustomerName('Bob')), CustomerReferrer('Bob', None)]
+
+
+def test_get_entities_project_invalid_field(service):
+    """Fields of a projection must be declared in the entity type"""
+
+    # pylint: disable=redefined-outer-name
+
+    class EmployeeAge(typing.NamedTuple):
+        ID: int
+        Age: int
+
+    with pytest.raises(PyODataException) as e_info:
+        service.entity_sets.Employees.get_entities().project(EmployeeAge)
+
+    assert str(e_info.value) == 'Projection EmployeeAge field Age is not declared in Employee entity type'
+
+
+@responses.activate
+def test_batch_request(service):
+    """Batch requests"""
+
+    # pylint: disable=redefined-outer-name
+
+    response_body = (b'--batch_r1\n'
+                     b'Content-Type: application/http\n'
+                     b'Content-Transfer-Encoding: binary\n'
+                     b'\n'
+                     b'HTTP/1.1 200 OK\n'
+                     b'Content-Type: application/json\n'
+                     b'\n'
+                     b'{"d": {"ID": 23, "NameFirst": "Rob", "NameLast": "Ickes", "Address": { "ID": 456, "Street": "Baker Street", "City": "London"} }}'
+                     b'\n'
+                     b'--batch_r1\n'
+                     b'Content-Type: multipart/mixed; boundary=changeset_1\n'
+                     b'\n'
+                     b'--changeset_1\n'
+                     b'Content-Type: application/http\n'
+                     b'Content-Transfer-Encoding: binary\n'
+                     b'\n'
+                     b'HTTP/1.1 204 Updated\n'
+                     b'Content-Type: application/json\n'
+                     b'\n'
+                     b"{b'd': {'Sensor': 'Sensor-address', 'Date': datetime\'2017-12-24T18:00\', 'Value': '34.0d'}}"
+                     b'\n'
+                     b'--changeset_1--\n'
+                     b'\n'
+                     b'--batch_r1--')
+
+    responses.add(
+        responses.POST,
+        f'{URL_ROOT}/$batch',
+        body=response_body,
+        content_type='multipart/mixed; boundary=batch_r1',
+        status=202)
+
+    batch = service.create_batch('batch1')
+
+    chset = service.create_changeset('chset1')
+
+    employee_request = service.entity_sets.Employees.get_entity(23)
+
+    temp_request = service.entity_sets.TemperatureMeasurements.update_entity(
+        Sensor='sensor1',
+        Date=datetime.datetime(2017, 12, 24, 18, 0, tzinfo=datetime.timezone.utc)).set(Value=34.0)
+
+    batch.add_request(employee_request)
+
+    chset.add_request(temp_request)
+
+    batch.add_request(chset)
+
+    response = batch.execute()
+
+    assert len(response) == 2
+
+    employee_response = response[0]
+    assert isinstance(employee_response, pyodata.v2.service.EntityProxy)
+
+    chset_response = response[1]
+    assert isinstance(chset_response, list)
+    assert len(chset_response) == 1
+    assert chset_response[0] is None   # response to update request is None
+
+@responses.activate
+def test_batch_request_not_encoded_path(service):
+    """Batch requests"""
+
+    # pylint: disable=redefined-outer-name
+
+    response_body = (b'--batch_r1\n'
+                     b'Content-Type: application/http\n'
+                     b'Content-Transfer-Encoding: binary\n'
+                     b'\n'
+                     b'HTTP/1.1 200 OK\n'
+                     b'Content-Type: application/json\n'
+                     b'\n'
+                     b'{"d": {"ID": 23, "NameFirst": "Rob", "NameLast": "Ickes", "Address": { "ID": 456, "Street": "Baker Street", "City": "London"} }}'
+                     b'\n'
+                     b'--batch_r1\n'
+                     b'Content-Type: multipart/mixed; boundary=changeset_1\n'
+                     b'\n'
+                     b'--changeset_1\n'
+                     b'Content-Type: application/http\n'
+                     b'Content-Transfer-Encoding: binary\n'
+                     b'\n'
+                     b'HTTP/1.1 204 Updated\n'
+                     b'Content-Type: application/json\n'
+                     b'\n'
+                     b"{b'd': {'Sensor': 'Sensor-address', 'Date': datetime\'2017-12-24T18:00\', 'Value': '34.0d'}}"
+                     b'\n'
+                     b'--changeset_1--\n'
+                     b'\n'
+                     b'--batch_r1--')
+
+    responses.add(
+        responses.POST,
+        f'{URL_ROOT}/$batch',
+        body=response_body,
+        content_type='multipart/mixed; boundary=batch_r1',
+        status=202)
+
+    batch = service.create_batch('batch1')
+
+    chset = service.create_changeset('chset1')
+
+    employee_request = service.entity_sets.Employees.get_entity(23, encode_path=False)
+
+    assert employee_request.get_path() == 'Employees(23)'
+
+    temp_request = service.entity_sets.TemperatureMeasurements.update_entity(
+        Sensor='sensor1',
+        Date=datetime.datetime(2017, 12, 24, 18, 0, tzinfo=datetime.timezone.utc),
+        encode_path=True).set(Value=34.0)
+
+    batch.add_request(employee_request)
+
+    chset.add_request(temp_request)
+
+    assert f'{temp_request.get_method()} TemperatureMeasurements%28Sensor%3D%27sensor1%27%2CDate%3Ddatetime%272017-12-24T18%3A00%3A00%27%29' in chset.get_body()
+
+    batch.add_request(chset)
+    batch.add_request(temp_request)
+
+    response = batch.execute()
+
+    assert len(response) == 2
+
+    employee_response = response[0]
+    assert isinstance(employee_response, pyodata.v2.service.EntityProxy)
+
+    chset_response = response[1]
+    assert isinstance(chset_response, list)
+    assert len(chset_response) == 1
+    assert chset_response[0] is None   # response to update request is None
+
+@responses.activate
+def test_enormous_batch_request(service):
+    """Batch requests"""
+
+    # pylint: disable=redefined-outer-name
+
+    response_body = contents_of_fixtures_file('enormous_batch_response')
+
+    responses.add(
+        responses.POST,
+        f'{URL_ROOT}/$batch',
+        body=response_body,
+        content_type='multipart/mixed; boundary=16804F9C063D8720EACA19F7DFB3CD4A0',
+        status=202)
+
+    batch = service.create_batch()
+
+    employee_request = service.entity_sets.Enumerations.get_entities()
+
+    batch.add_request(employee_request)
+
+    response = batch.execute()
+
+    assert len(response) == 1
+    assert len(response[0]) == 1016
+
+
+@responses.activate
+def test_batch_request_failed_changeset(service):
+    """Check single response for changeset"""
+
+    # pylint: disable=redefined-outer-name
+
+    response_body = ('--batch_r1\n'
+                     'Content-Type: application/http\n'
+                     'Content-Transfer-Encoding: binary\n'
+                     '\n'
+                     'HTTP/1.1 400 Bad Request\n'
+                     'Content-Type: application/json;charset=utf-8'
+                     ''
+                     '{"error": "this is error description"}'
+                     '--batch_r1--')
+
+    responses.add(
+        responses.POST,
+        f'{URL_ROOT}/$batch',
+        body=response_body,
+        content_type='multipart/mixed; boundary=batch_r1',
+        status=202)
+
+    batch = service.create_batch('batch1')
+
+    chset = service.create_changeset('chset1')
+
+    employee_request1 = service.entity_sets.Employees.get_entity(23)
+    employee_request2 = service.entity_sets.Employees.get_entity(23)
+
+    chset.add_request(employee_request1)
+    chset.add_request(employee_request2)
+
+    batch.add_request(chset)
+
+    with pytest.raises(HttpError) as e_info:
+        batch.execute()
+
+    assert str(e_info.value).startswith('Changeset cannot be processed')
+    assert isinstance(e_info.value, HttpError)
+    assert e_info.value.response.status_code == 400
+
+
+@responses.activate
+def test_batch_dispatcher(service):
+    """Requests of a large batch are sent in several concurrent batches"""
+
+    # pylint: disable=redefined-outer-name
+
+    responses.add_callback(responses.POST, f'{URL_ROOT}/$batch', callback=employees_batch_response)
+
+    dispatcher = service.create_batch_dispatcher(max_parts=2, parallelism=2)
+    for key in range(20, 25):
+        dispatcher.add_request(service.entity_sets.Employees.get_entity(key))
+
+    assert [len(batch.requests) for batch in dispatcher.split()] == [2, 2, 1]
+    assert [employee.ID for employee in dispatcher.execute()] == [20, 21, 22, 23, 24]
+    assert len(responses.calls) == 3
+
+
+def test_batch_dispatcher_split(service):
+    """Batches respect size limits and keep changesets intact"""
+
+    # pylint: disable=redefined-outer-name
+
+    chset = service.create_changeset('chset1')
+    chset.add_request(service.entity_sets.Employees.get_entity(23))
+    chset.add_request(service.entity_sets.Employees.get_entity(24))
+
+    dispatcher = service.create_batch_dispatcher(max_parts=2)
+    dispatcher.add_request(service.entity_sets.Employees.get_entity(22))
+    dispatcher.add_request(chset)
+    dispatcher.add_request(service.entity_sets.Employees.get_entity(25))
+
+    batches = dispatcher.split()
+    assert [batch.requests for batch in batches[1:2]] == [[chset]]
+    assert [len(batch.requests) for batch in batches] == [1, 1, 1]
+
+    dispatcher = service.create_batch_dispatcher(max_parts=10, max_size=250)
+    for key in range(20, 25):
+        dispatcher.add_request(service.entity_sets.Employees.get_entity(key))
+
+    batches = dispatcher.split()
+    assert len(batches) > 1
+    assert all(len(batch.get_body().encode('utf-8')) <= 250 for batch in batches)
+
+
+def test_encode_multipart_bytes(service):
+    """Bytes encoder produces the same body as the string encoder"""
+
+    # pylint: disable=redefined-outer-name
+
+    chset = service.create_changeset('chset1')
+    chset.add_request(service.entity_sets.Employees.update_entity(23).set(NameFirst='Žofie'))
+    chset.add_request(service.entity_sets.Employees.delete_entity(24))
+
+    batch = service.create_batch('batch1')
+    batch.add_request(service.entity_sets.Employees.get_entity(23).select('ID'))
+    batch.add_request(chset)
+    batch.add_request(service.entity_sets.Employees.get_entity(25))
+
+    body = batch.get_body().encode('utf-8')
+
+    assert pyodata.v2.service.encode_multipart_bytes(batch.get_boundary(), batch.requests) == body
+    assert batch.get_payload() == body
+    assert b''.join(batch.chunked().get_payload()) == body
+    assert pyodata.v2.service.encode_multipart_bytes('batch1', []) == b'\r\n--batch1--'
+
+
+@responses.activate
+def test_batch_request_chunked(service):
+    """Batch request body can be sent with chunked transfer encoding"""
+
+    # pylint: disable=redefined-outer-name
+
+    responses.add(
+        responses.POST,
+        f'{URL_ROOT}/$batch',
+        body=(b'--batch_r1\n'
+              b'Content-Type: application/http\n'
+              b'\n'
+              b'HTTP/1.1 200 OK\n'
+              b'Content-Type: application/json\n'
+              b'\n'
+              b'{"d": {"ID": 23}}\n'
+              b'--batch_r1--'),
+        content_type='multipart/mixed; boundary=batch_r1',
+        status=202)
+
+    batch = service.create_batch().chunked()
+    batch.add_request(service.entity_sets.Employees.get_entity(23))
+
+    assert [employee.ID for employee in batch.execute()] == [23]
+
+
+def changeset_batch_response(part_response, failing=None):
+    """Returns callback responding to batch of one changeset by part_response
+       for every request line or by single error response if the request
+       body contains failing
+    """
+
+    def batch_response(request):
+        body = request.body.decode('utf-8')
+
+        if failing is not None and failing in body:
+            return 202, {'Content-Type': 'multipart/mixed; boundary=batch_r1'}, (
+                '--batch_r1\n'
+                'Content-Type: application/http\n'
+                '\n'
+                'HTTP/1.1 400 Bad Request\n'
+                'Content-Type: application/json\n'
+                '\n'
+                '{"error": "invalid entity"}\n'
+                '--batch_r1--')
+
+        parts = ''.join(
+            '--changeset_1\n'
+            'Content-Type: application/http\n'
+            '\n' +
+            part_response(match) +
+            '\n'
+            for match in re.finditer(r'^(POST|PATCH|MERGE|DELETE) (.*) HTTP/1.1\r$', body, re.MULTILINE))
+
+        return 202, {'Content-Type': 'multipart/mixed; boundary=batch_r1'}, (
+            '--batch_r1\n'
+            'Content-Type: multipart/mixed; boundary=changeset_1\n'
+            '\n' +
+            parts +
+            '--changeset_1--\n'
+            '--batch_r1--')
+
+    return batch_response
+
+
+@responses.activate
+def test_create_entities(service):
+    """Entities are created in concurrently sent changesets"""
+
+    # pylint: disable=redefined-outer-name
+
+    created = iter(range(1, 100))
+
+    def created_response(match):
+        return f'HTTP/1.1 201 Created\nContent-Type: application/json\n\n{{"d": {{"ID": {next(created)}}}}}'
+
+    responses.add_callback(responses.POST, f'{URL_ROOT}/$batch',
+                           callback=changeset_batch_response(created_response, failing='Invalid'))
+
+    rows = ({'NameFirst': name} for name in ['Jane', 'John', 'Invalid', 'Jack', 'Jill'])
+    results = list(service.entity_sets.Employees.create_entities(rows, chunk_size=2, concurrency=1))
+
+    assert [result.ID for result in results[:2]] == [1, 2]
+    assert all(isinstance(result, HttpError) for result in results[2:4])
+    assert str(results[2]).startswith('Changeset cannot be processed')
+    assert results[4].ID == 3
+    assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_create_entities_transport_error(service):
+    """Transport error of a changeset is yielded for every row of the changeset"""
+
+    # pylint: disable=redefined-outer-name
+
+    def created_response(match):
+        return 'HTTP/1.1 201 Created\nContent-Type: application/json\n\n{"d": {"ID": 1}}'
+
+    responses.add_callback(responses.POST, f'{URL_ROOT}/$batch', callback=transport_error_response(
+        changeset_batch_response(created_response), failing='Jack'))
+
+    rows = ({'NameFirst': name} for name in ['Jane', 'John', 'Jack', 'Jill', 'Joe'])
+    results = list(service.entity_sets.Employees.create_entities(rows, chunk_size=2, concurrency=1))
+
+    assert len(results) == 5
+    assert [result.ID for result in results[:2] + results[4:]] == [1, 1, 1]
+    assert all(isinstance(result, requests.ConnectionError) for result in results[2:4])
+
+
+@responses.activate
+def test_create_entities_reads_rows_lazily(service):
+    """Rows are read only when their changeset can be sent"""
+
+    # pylint: disable=redefined-outer-name
+
+    def created_response(match):
+        return 'HTTP/1.1 201 Created\nContent-Type: application/json\n\n{"d": {"ID": 1}}'
+
+    responses.add_callback(responses.POST, f'{URL_ROOT}/$batch', callback=changeset_batch_response(created_response))
+
+    read = []
+
+    def rows():
+        for name in ['Jane', 'John', 'Jack', 'Jill', 'Joe']:
+            read.append(name)
+            yield {'NameFirst': name}
+
+    results = service.entity_sets.Employees.create_entities(rows(), chunk_size=2, concurrency=1)
+    assert not read
+
+    next(results)
+    assert read == ['Jane', 'John']
+    assert len(list(results)) == 4
+
+
+@responses.activate
+def test_update_entities(service):
+    """Entities are updated in changesets and failed keys are reported"""
+
+    # pylint: disable=redefined-outer-name
+
+    responses.add_callback(responses.POST, f'{URL_ROOT}/$batch',
+                           callback=changeset_batch_response(lambda match: 'HTTP/1.1 204 No Content\n',
+                                                             failing='Employees%2825%29'))
+
+    service.config['http']['update_method'] = 'MERGE'
+
+    failures = service.entity_sets.Employees.update_entities(
+        {23: {'NameFirst': 'Jane'}, 24: {'NameFirst': 'John'}, 25: {'NameFirst': 'Jack'}},
+        chunk_size=2)
+
+    assert [key for key, _ in failures] == [25]
+    assert isinstance(failures[0][1], HttpError)
+    assert any(b'MERGE Employees%2823%29 HTTP/1.1' in call.request.body for call in responses.calls)
+
+
+def transport_error_response(callback, failing):
+    """Returns callback raising ConnectionError if the request body contains failing"""
+
+    def batch_response(request):
+        if failing in request.body.decode('utf-8'):
+            raise requests.ConnectionError('Connection reset by peer')
+
+        return callback(request)
+
+    return batch_response
+
+
+@responses.activate
+def test_update_entities_transport_error(service):
+    """Transport errors of changesets are reported for every key of the changeset"""
+
+    # pylint: disable=redefined-outer-name
+
+    responses.add_callback(responses.POST, f'{URL_ROOT}/$batch', callback=transport_error_response(
+        changeset_batch_response(lambda match: 'HTTP/1.1 204 No Content\n'), failing='Employees%2825%29'))
+
+    failures = service.entity_sets.Employees.update_entities(
+        [(key, {'NameFirst': 'Jane'}) for key in (23, 24, 25, 26, 27)], chunk_size=2, concurrency=1)
+
+    assert [key for key, _ in failures] == [25, 26]
+    assert all(isinstance(error, requests.ConnectionError) for _, error in failures)
+
+    responses.add(responses.GET, f'{URL_ROOT}/Employees', json={'d': {'results': [{'ID': 24}, {'ID': 25}]}})
+
+    failures = service.entity_sets.Employees.get_entities().delete(chunk_size=10)
+
+    assert [key.to_key_string() for key, _ in failures] == ['(24)', '(25)']
+    assert all(isinstance(error, requests.ConnectionError) for _, error in failures)
+
+
+@responses.activate
+def test_delete_entities(service):
+    """Entities are deleted in changesets by keys of several forms"""
+
+    # pylint: disable=redefined-outer-name
+
+    responses.add_callback(responses.POST, f'{URL_ROOT}/$batch',
+                           callback=changeset_batch_response(lambda match: 'HTTP/1.1 204 No Content\n'))
+
+    keys = [23, {'ID': 24}, EntityKey(service.schema.entity_type('Employee'), ID=25)]
+
+    assert service.entity_sets.Employees.delete_entities(keys, chunk_size=10) == []
+    assert len(responses.calls) == 1
+
+    body = responses.calls[0].request.body.decode('utf-8')
+    assert 'DELETE Employees%2823%29 HTTP/1.1' in body
+    assert 'DELETE Employees%28ID%3D24%29 HTTP/1.1' in body
+    assert 'DELETE Employees%28ID%3D25%29 HTTP/1.1' in body
+
+
+@responses.activate
+def test_get_entities_delete(service):
+    """Entities matching filter are deleted by keys fetched page by page"""
+
+    # pylint: disable=redefined-outer-name
+
+    responses.add(
+        responses.GET,
+        f'{URL_ROOT}/Employees',
+        json={'d': {'results': [{'ID': 23}, {'ID': 24}],
+                    '__next': f'{URL_ROOT}/Employees?$skiptoken=24'}},
+        status=200)
+
+    responses.add(
+        responses.GET,
+        f'{URL_ROOT}/Employees',
+        json={'d': {'results': [{'ID': 25}]}},
+        status=200)
+
+    responses.add_callback(responses.POST, f'{URL_ROOT}/$batch',
+                           callback=changeset_batch_response(lambda match: 'HTTP/1.1 204 No Content\n',
+                                                             failing='Employees%2825%29'))
+
+    request = service.entity_sets.Employees.get_entities().filter("NameFirst eq 'Jane'")
+    failures = request.delete(chunk_size=2, concurrency=1)
+
+    assert [key.to_key_string() for key, _ in failures] == ['(25)']
+
+    gets = [call.request for call in responses.calls if call.request.method == 'GET']
+    assert gets[0].params == {'$filter': "NameFirst eq 'Jane'", '$select': 'ID'}
+    assert gets[1].url == f'{URL_ROOT}/Employees?$skiptoken=24'
+
+
+@responses.activate
+def test_get_entities_delete_offset_skiptoken(service):
+    """All keys are fetched before deleting so offset based next links do not skip entities"""
+
+    # pylint: disable=redefined-outer-name
+
+    employees = [23, 24, 25, 26, 27]
+
+    def employees_page(request):
+        skip = int(request.params.get('$skiptoken', 0))
+        page = {'results': [{'ID': key} for key in employees[skip:skip + 2]]}
+        if skip + 2 < len(employees):
+            page['__next'] = f'{URL_ROOT}/Employees?$skiptoken={skip + 2}'
+
+        return 200, {'Content-Type': 'application/json'}, json.dumps({'d': page})
+
+    def delete_response(match):
+        employees.remove(int(re.search(r'%28(\d+)%29', match.group(2)).group(1)))
+        return 'HTTP/1.1 204 No Content\n'
+
+    responses.add_callback(responses.GET, f'{URL_ROOT}/Employees', callback=employees_page)
+    responses.add_callback(responses.POST, f'{URL_ROOT}/$batch', callback=changeset_batch_response(delete_response))
+
+    assert service.entity_sets.Employees.get_entities().delete(chunk_size=2, concurrency=1) == []
+    assert employees == []
+
+
+@responses.activate
+def test_get_entities_update(service):
+    """Entities matching filter are updated by keys"""
+
+    # pylint: disable=redefined-outer-name
+
+    responses.add(
+        responses.GET,
+        f'{URL_ROOT}/Employees',
+        json={'d': {'results': [{'ID': 23}, {'ID': 24}]}},
+        status=200)
+
+    responses.add_callback(responses.POST, f'{URL_ROOT}/$batch',
+                           callback=changeset_batch_response(lambda match: 'HTTP/1.1 204 No Content\n'))
+
+    assert service.entity_sets.Employees.get_entities().filter(ID__lt=25).update(NameFirst='Jane') == []
+
+    body = responses.calls[1].request.body.decode('utf-8')
+    assert body.count('{"NameFirst": "Jane"}') == 2
+    assert 'PATCH Employees%2824%29 HTTP/1.1' in body
+
+
+@responses.activate
+def test_get_entities_keys(service):
+    """Keys of entities are fetched page by page as tuples of key values"""
+
+    # pylint: disable=redefined-outer-name
+
+    responses.add(
+        responses.GET,
+        f'{URL_ROOT}/TemperatureMeasurements',
+        json={'d': {'results': [{'Sensor': 'sensor1', 'Date': '/Date(1514138400000)/'}],
+                    '__next': f'{URL_ROOT}/TemperatureMeasurements?$skiptoken=1'}},
+        status=200)
+
+    responses.add(
+        responses.GET,
+        f'{URL_ROOT}/TemperatureMeasurements',
+        json={'d': [{'Sensor': 'sensor2', 'Date': '/Date(1514138400000)/'}]},
+        status=200)
+
+    date = datetime.datetime(2017, 12, 24, 18, 0, tzinfo=datetime.timezone.utc)
+
+    keys = list(service.entity_sets.TemperatureMeasurements.get_entities().keys())
+
+    assert keys == [('sensor1', date), ('sensor2', date)]
+    assert responses.calls[0].request.params == {'$select': 'Sensor,Date'}
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_get_entities_diff_keys(service):
+    """Local keys are compared with keys of the service"""
+
+    # pylint: disable=redefined-outer-name
+
+    responses.add(
+        responses.GET,
+        f'{URL_ROOT}/Employees',
+        json={'d': {'results': [{'ID': 23}, {'ID': 24}]}},
+        status=200)
+
+    inserts, deletes = service.entity_sets.Employees.get_entities().diff_keys([(24,), (25,)])
+
+    assert inserts == {(25,)}
+    assert deletes == {(23,)}
+
+
+def test_get_entity_with_entity_key(service):
+    """Make sure the method get_entity handles correctly the parameter key which is EntityKey"""
+
+    # pylint: disable=redefined-outer-name
+
+
+    key = EntityKey(
+        service.schema.entity_type('TemperatureMeasurement'),
+        Sensor='sensor1',
+        Date=datetime.datetime(2017, 12, 24, 18, 0, tzinfo=datetime.timezone.utc))
+
+    query = service.entity_sets.TemperatureMeasurements.get_entity(key)
+    assert query.get_path() == quote("TemperatureMeasurements(Sensor='sensor1',Date=datetime'2017-12-24T18:00:00')")
+
+
+def test_get_entity_with_entity_key_and_other_params(service):
+    """Make sure the method get_entity handles correctly the parameter key which is EntityKey"""
+
+    # pylint: disable=redefined-outer-name
+
+    key = EntityKey(
+        service.schema.entity_type('TemperatureMeasurement'),
+        Sensor='sensor1',
+        Date=datetime.datetime(2017, 12, 24, 18, 0, tzinfo=datetime.timezone.utc))
+
+    query = service.entity_sets.TemperatureMeasurements.get_entity(key=key, Foo='Bar')
+    assert query.get_path() == quote("TemperatureMeasurements(Sensor='sensor1',Date=datetime'2017-12-24T18:00:00')")
+
+
+def test_entity_proxy_equals(service):
+    """Two entity proxies are equal if they hold the same data"""
+
+    properties = {'Key': 'a', 'DataType': 'b', 'Data': 'c', 'DataName': 'd'}
     fst_entity = EntityProxy(service, service.entity_sets.MasterEntities,
                              service.schema.entity_type('MasterEntity'), properties)
     scn_entity = EntityProxy(service, service.entity_sets.MasterEntities,
@@ -2371,6 +3551,76 @@ def test_count_with_chainable_filter(service):
     assert request.execute() == 3
 
 
+@responses.activate
+def test_prepared_query(service):
+    """Prepared query renders static parts once and formats only bound values"""
+
+    # pylint: disable=redefined-outer-name
+
+    responses.add(
+        responses.GET,
+        f'{URL_ROOT}/Employees',
+        json={'d': {'results': [{'ID': 23, 'NameFirst': 'Rob'}]}},
+        status=200)
+
+    prepared = service.entity_sets.Employees.prepare(
+        filter={'NameFirst': pyodata.v2.service.QueryParameter('name'), 'ID__gt': 20},
+        select=['ID', 'NameFirst'],
+        expand='Addresses',
+        order_by='ID desc',
+        top=pyodata.v2.service.QueryParameter('top'))
+
+    assert prepared.parameters == {'name', 'top'}
+
+    request = prepared.bind(name='Jane', top=5)
+    assert isinstance(request, pyodata.v2.service.GetEntitySetRequest)
+
+    result = request.execute()
+    assert result[0].ID == 23
+
+    result = prepared.bind(name='Rob', top=1).execute()
+    assert result[0].NameFirst == 'Rob'
+
+    assert [call.request.params for call in responses.calls] == [
+        {'$filter': "NameFirst eq 'Jane' and ID gt 20", '$select': 'ID,NameFirst', '$expand': 'Addresses',
+         '$orderby': 'ID desc', '$top': '5'},
+        {'$filter': "NameFirst eq 'Rob' and ID gt 20", '$select': 'ID,NameFirst', '$expand': 'Addresses',
+         '$orderby': 'ID desc', '$top': '1'}]
+
+
+def test_prepared_query_validation(service):
+    """Prepared query validates property names and bound parameters"""
+
+    # pylint: disable=redefined-outer-name
+
+    employees = service.entity_sets.Employees
+
+    with pytest.raises(ValueError):
+        employees.prepare(filter={'Age__gt': 18})
+
+    with pytest.raises(PyODataException) as e_info:
+        employees.prepare(select='ID,Age')
+    assert str(e_info.value) == 'Navigation property Age is not declared in Employee entity type'
+
+    with pytest.raises(PyODataException) as e_info:
+        employees.prepare(expand='NameFirst')
+    assert str(e_info.value) == 'Navigation property NameFirst is not declared in Employee entity type'
+
+    with pytest.raises(PyODataException) as e_info:
+        employees.prepare(order_by='Age desc')
+    assert str(e_info.value) == 'Property Age is not declared in Employee entity type'
+
+    prepared = employees.prepare(filter={'ID': pyodata.v2.service.QueryParameter('id')})
+
+    with pytest.raises(PyODataException) as e_info:
+        prepared.bind()
+    assert str(e_info.value) == 'Parameters id of the prepared query are not bound'
+
+    with pytest.raises(PyODataException) as e_info:
+        prepared.bind(id=1, name='Rob')
+    assert str(e_info.value) == 'Parameters name are not declared in the prepared query'
+
+
 @responses.activate
 def test_partial_listing(service):
     """Using __next URI to fetch all entities in a collection"""
@@ -2571,7 +3821,7 @@ def test_count_with_chainable_filter_in_operator(service):
 
     responses.add(
         responses.GET,
-        f"{service.url}/Employees/$count?$filter=ID%20eq%201%20or%20ID%20eq%202%20or%20ID%20eq%203",
+        f"{service.url}/Employees/$count?$filter=%28ID%20eq%201%20or%20ID%20eq%202%20or%20ID%20eq%203%29",
         json=3,
         status=200)
 
@@ -2583,6 +3833,179 @@ def test_count_with_chainable_filter_in_operator(service):
     assert request.execute() == 3
 
 
+def test_chainable_filter_compiled_lookups(service):
+    """Lookups are compiled once per entity type and reused by later filters"""
+
+    # pylint: disable=redefined-outer-name,protected-access
+
+    entity_type = service.schema.entity_type('Employee')
+    lookups = pyodata.v2.service.GetEntitySetFilterChainable._compiled_lookups(entity_type)
+    lookups.clear()
+
+    employees = service.entity_sets.Employees
+
+    request = employees.get_entities().filter(NameFirst__startswith='Ja', ID__range=(1, 5))
+    assert request.get_query_params()['$filter'] == \
+        "startswith(NameFirst, 'Ja') eq true and ID gte 1 and ID lte 5"
+
+    render = lookups['NameFirst__startswith']
+    assert set(lookups.keys()) == {'NameFirst__startswith', 'ID__range'}
+
+    request = employees.get_entities().filter(NameFirst__startswith='Jo', ID__range=(6, 9))
+    assert request.get_query_params()['$filter'] == \
+        "startswith(NameFirst, 'Jo') eq true and ID gte 6 and ID lte 9"
+    assert lookups['NameFirst__startswith'] is render
+
+    with pytest.raises(TypeError):
+        employees.get_entities().filter(ID__range=1)
+
+    with pytest.raises(ValueError):
+        employees.get_entities().filter(ID__ne=1)
+
+    assert 'ID__ne' not in lookups
+
+
+@responses.activate
+def test_select_profiler(service):
+    """Queries select the properties read on entities of their previous executions"""
+
+    # pylint: disable=redefined-outer-name
+
+    def employees_response(request):
+        employee = {'ID': 23, 'NameFirst': 'Rob', 'NameLast': 'Ickes'}
+        if '$select' in request.params:
+            employee = {name: employee[name] for name in request.params['$select'].split(',')}
+
+        return 200, {'Content-Type': 'application/json'}, json.dumps({'d': {'results': [employee]}})
+
+    responses.add_callback(responses.GET, f'{URL_ROOT}/Employees', callback=employees_response)
+
+    responses.add(
+        responses.GET,
+        f'{URL_ROOT}/Employees(23)/NameLast/',
+        json={'d': {'NameLast': 'Ickes'}},
+        status=200)
+
+    service.select_profiler = pyodata.v2.service.SelectProfiler()
+
+    def query_site():
+        return service.entity_sets.Employees.get_entities().filter(ID__gt=20).top(10)
+
+    employees = query_site().execute()
+    assert employees[0].NameFirst == 'Rob'
+    assert '$select' not in responses.calls[0].request.params
+
+    employees = query_site().execute()
+    assert responses.calls[1].request.params['$select'] == 'ID,NameFirst'
+    assert employees[0].NameLast == 'Ickes'
+    assert responses.calls[2].request.url == f'{URL_ROOT}/Employees(23)/NameLast/'
+
+    query_site().execute()
+    assert responses.calls[3].request.params['$select'] == 'ID,NameFirst,NameLast'
+
+    service.entity_sets.Employees.get_entities().select('ID').execute()
+    assert responses.calls[4].request.params['$select'] == 'ID'
+
+    assert service.select_profiler.profiles() == [
+        {'entity_set': 'Employees', 'query': ['$filter', '$top'], 'expand': None, 'observations': 3,
+         'properties': ['NameFirst', 'NameLast']}]
+
+
+def test_select_profiler_concurrent_reads(service):
+    """Profiles can be read while other threads record reads of attributes"""
+
+    # pylint: disable=redefined-outer-name,protected-access
+
+    profiler = pyodata.v2.service.SelectProfiler()
+    entity_set = service.schema.entity_set('Employees')
+    entity = EntityProxy(service, entity_set, entity_set.entity_type, {'ID': 23})
+    profiler.track(('Employees', (), None), [entity])
+
+    assert isinstance(entity._accessed, pyodata.v2.service.AccessRecord)
+
+    def read_attributes(thread):
+        for index in range(500):
+            entity._accessed.add(f'Name{thread}_{index}')
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(read_attributes, thread) for thread in range(4)]
+        while not all(future.done() for future in futures):
+            profiler.profiles()
+
+        for future in futures:
+            future.result()
+
+    assert len(profiler.profiles()[0]['properties']) == 2000
+
+
+def employees_in_filter_response(request):
+    """Response with employees of IDs in the $filter and the employee 1 of every chunk"""
+
+    ids = [int(key) for key in re.findall(r'ID eq (\d+)', request.params['$filter'])]
+    results = [{'ID': key, 'NameFirst': 'Jane'} for key in [1] + ids]
+
+    return 200, {'Content-Type': 'application/json'}, json.dumps({'d': {'results': results}})
+
+
+@responses.activate
+def test_chainable_filter_in_operator_split(service):
+    """Oversized __in filter is split into chunks whose entities are merged"""
+
+    # pylint: disable=redefined-outer-name
+
+    responses.add_callback(responses.GET, f'{URL_ROOT}/Employees', callback=employees_in_filter_response)
+
+    service.config['filter']['max_size'] = 100
+
+    ids = list(range(10, 40)) + [10, 11]
+    result = service.entity_sets.Employees.get_entities().filter(NameFirst='Jane', ID__in=ids).execute()
+
+    assert sorted(entity.ID for entity in result) == [1] + list(range(10, 40))
+
+    filters = [call.request.params['$filter'] for call in responses.calls]
+    assert len(filters) > 1
+    assert all(len(filter_val) <= 100 for filter_val in filters)
+    assert all(filter_val.startswith("NameFirst eq 'Jane' and (ID eq ") for filter_val in filters)
+
+    responses.calls.reset()
+
+    result = service.entity_sets.Employees.get_entities().filter(ID__in=ids).top(50).execute()
+    assert len(responses.calls) == 1
+
+    service.config['filter']['max_size'] = None
+
+    result = service.entity_sets.Employees.get_entities().filter(ID__in=ids).execute()
+    assert len(responses.calls) == 2
+    assert len(result) == len(ids) + 1
+
+
+@responses.activate
+def test_keys_and_delete_with_split_in_filter(service):
+    """Keys of entities of oversized __in filter are fetched by split requests and merged"""
+
+    # pylint: disable=redefined-outer-name
+
+    responses.add_callback(responses.GET, f'{URL_ROOT}/Employees', callback=employees_in_filter_response)
+    responses.add_callback(responses.POST, f'{URL_ROOT}/$batch',
+                           callback=changeset_batch_response(lambda match: 'HTTP/1.1 204 No Content\n'))
+
+    service.config['filter']['max_size'] = 40
+
+    keys = list(service.entity_sets.Employees.get_entities().filter(ID__in=range(20, 26)).keys())
+
+    assert sorted(keys) == [(1,), (20,), (21,), (22,), (23,), (24,), (25,)]
+    gets = [call.request for call in responses.calls]
+    assert len(gets) > 1
+    assert all(request.params['$select'] == 'ID' for request in gets)
+
+    responses.calls.reset()
+
+    assert service.entity_sets.Employees.get_entities().filter(ID__in=range(20, 26)).delete(chunk_size=100) == []
+
+    body = [call.request for call in responses.calls if call.request.method == 'POST'][0].body.decode('utf-8')
+    assert body.count('DELETE Employees') == 7
+
+
 @responses.activate
 def test_count_with_chainable_filter_startswith_operator(service):
     """Check getting $count with $filter in"""
@@ -3019,6 +4442,205 @@ def test_odata_http_response():
     assert response.json()['d']['ID'] == 23
 
 
+def test_odata_http_response_from_bytes():
+    """Test that ODataHttpResponse parses bytes without copying the body"""
+
+    response = ODataHttpResponse.from_bytes(b'HTTP/1.1 404 Not Found\r\n'
+                                            b'Content-Type: application/json\r\n'
+                                            b'\r\n'
+                                            b'{"error": "not found"}')
+
+    assert response.status_code == 404
+    assert response.headers == {'Content-Type': 'application/json'}
+    assert response.json() == {'error': 'not found'}
+    assert response.content == b'{"error": "not found"}'
+
+    with pytest.raises(PyODataException) as e_info:
+        ODataHttpResponse.from_bytes(b'Content-Type: application/json\n\n{}')
+
+    assert str(e_info.value).startswith('Invalid HTTP status line')
+
+
+def test_decode_multipart_bytes():
+    """Test that multipart responses are decoded to trees of responses"""
+
+    body = (b'--batch_r1\r\n'
+            b'Content-Type: application/http\r\n'
+            b'\r\n'
+            b'HTTP/1.1 200 OK\r\n'
+            b'Content-Type: application/json\r\n'
+            b'\r\n'
+            b'{"d": {"ID": 23}}\r\n'
+            b'--batch_r1\r\n'
+            b'Content-Type: multipart/mixed; boundary="changeset_1"\r\n'
+            b'\r\n'
+            b'--changeset_1\r\n'
+            b'Content-Type: application/http\r\n'
+            b'\r\n'
+            b'HTTP/1.1 204 No Content\r\n'
+            b'\r\n'
+            b'\r\n'
+            b'--changeset_1--\r\n'
+            b'\r\n'
+            b'--batch_r1--\r\n')
+
+    parts = pyodata.v2.service.decode_multipart_bytes(body, 'multipart/mixed; boundary=batch_r1')
+
+    assert len(parts) == 2
+    assert parts[0][0].status_code == 200
+    assert parts[0][0].json() == {'d': {'ID': 23}}
+    assert len(parts[1]) == 1
+    assert parts[1][0][0].status_code == 204
+    assert parts[1][0][0].content == b''
+
+    with pytest.raises(PyODataException) as e_info:
+        pyodata.v2.service.decode_multipart_bytes(body, 'multipart/mixed')
+
+    assert str(e_info.value) == 'Multipart content type without boundary: multipart/mixed'
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 4096])
+def test_multipart_stream_decoder(chunk_size):
+    """Test that parts are decoded as soon as chunks complete them"""
+
+    body = (b'preamble\n'
+            b'--batch_r1\n'
+            b'Content-Type: application/http\n'
+            b'\n'
+            b'HTTP/1.1 200 OK\n'
+            b'Content-Type: application/json\n'
+            b'\n'
+            b'{"d": {"ID": 23}}\n'
+            b'--batch_r1\n'
+            b'Content-Type: multipart/mixed; boundary=changeset_1\n'
+            b'\n'
+            b'--changeset_1\n'
+            b'Content-Type: application/http\n'
+            b'\n'
+            b'HTTP/1.1 204 No Content\n'
+            b'\n'
+            b'\n'
+            b'--changeset_1--\n'
+            b'\n'
+            b'--batch_r1--\n')
+
+    decoder = pyodata.v2.service.MultipartStreamDecoder('multipart/mixed; boundary=batch_r1')
+
+    first_complete = body.index(b'\n--batch_r1', body.index(b'HTTP/1.1 200')) + len(b'\n--batch_r1')
+    last_complete = body.index(b'\n--batch_r1--') + len(b'\n--batch_r1')
+
+    parts = []
+    for start in range(0, len(body), chunk_size):
+        parts.extend(decoder.feed(body[start:start + chunk_size]))
+
+        # parts are available as soon as the next delimiter is received
+        received = start + chunk_size
+        if received < first_complete:
+            assert not parts
+        elif received < last_complete:
+            assert len(parts) == 1
+
+    assert decoder.close() == []
+    assert len(parts) == 2
+    assert parts[0][0].json() == {'d': {'ID': 23}}
+    assert parts[1][0][0].status_code == 204
+
+
+@responses.activate
+def test_batch_request_iter_execute(service):
+    """Results of batch requests are yielded part by part"""
+
+    # pylint: disable=redefined-outer-name
+
+    responses.add_callback(responses.POST, f'{URL_ROOT}/$batch', callback=employees_batch_response)
+
+    batch = service.create_batch()
+    batch.add_request(service.entity_sets.Employees.get_entity(23))
+    batch.add_request(service.entity_sets.Employees.get_entity(24))
+
+    results = batch.iter_execute(chunk_size=16)
+    assert next(results).ID == 23
+    assert [employee.ID for employee in results] == [24]
+
+
+@responses.activate
+def test_batch_request_iter_execute_failed(service):
+    """Rejected streamed batch request raises HttpError"""
+
+    # pylint: disable=redefined-outer-name
+
+    responses.add(responses.POST, f'{URL_ROOT}/$batch', body='Bad request', status=400)
+
+    batch = service.create_batch('batch1')
+    batch.add_request(service.entity_sets.Employees.get_entity(23))
+
+    with pytest.raises(HttpError) as e_info:
+        list(batch.iter_execute())
+
+    assert str(e_info.value) == 'HTTP POST for multipart request batch1 failed with status code 400'
+
+
+def test_batch_request_iter_execute_unsupported_connection(schema):
+    """Streamed batch requests of connections not supporting streamed responses are rejected"""
+
+    class Connection:
+        """Connection without streamed responses"""
+
+        # pylint: disable=too-few-public-methods,too-many-arguments
+
+        def request(self, method, url, headers=None, params=None, data=None):
+            """Sends request"""
+
+    svc = pyodata.v2.service.Service(URL_ROOT, schema, Connection())
+
+    batch = svc.create_batch('batch1')
+    batch.add_request(svc.entity_sets.Employees.get_entity(23))
+
+    with pytest.raises(PyODataException) as e_info:
+        list(batch.iter_execute())
+
+    assert str(e_info.value) == ('Connection Connection of batch batch1 does not support streamed responses, '
+                                 'use a requests or httpx connection')
+
+
+@responses.activate
+def test_batch_request_response_hook(schema):
+    """response_hook receives the batch response before its parts are decoded"""
+
+    hooked = []
+    svc = pyodata.v2.service.Service(URL_ROOT, schema, requests, response_hook=hooked.append)
+
+    responses.add_callback(responses.POST, f'{URL_ROOT}/$batch', callback=employees_batch_response)
+
+    batch = svc.create_batch()
+    batch.add_request(svc.entity_sets.Employees.get_entity(23))
+
+    assert [employee.ID for employee in batch.execute()] == [23]
+    assert [response.status_code for response in hooked] == [202]
+
+    results = batch.iter_execute()
+    assert next(results).ID == 23
+    assert [response.status_code for response in hooked] == [202, 202]
+
+
+@responses.activate
+def test_batch_request_iter_execute_response_hook_raising(schema):
+    """An exception raised in response_hook stops the streamed batch before decoding"""
+
+    def hook(response):
+        raise RuntimeError('hook blocked this')
+
+    svc = pyodata.v2.service.Service(URL_ROOT, schema, requests, response_hook=hook)
+
+    responses.add(responses.POST, f'{URL_ROOT}/$batch', body='Bad request', status=400)
+
+    batch = svc.create_batch()
+    batch.add_request(svc.entity_sets.Employees.get_entity(23))
+
+    with pytest.raises(RuntimeError, match='hook blocked this'):
+        list(batch.iter_execute())
+
+
 @responses.activate
 def test_custom_with_get_entity(service):
     """ Test that `custom` can be called after `get_entity`"""
@@ -3174,4 +4796,231 @@ def test_response_hook_raising_prevents_domain_handler(schema):
 
 def test_service_without_response_hook_works(service):
     """response_hook defaults to None and does not affect normal operation"""
-    assert service.response_hook is None
\ No newline at end of file
+    assert service.response_hook is None
+
+@responses.activate
+def test_query_plan_keyset_paging(service):
+    """Not pageable but topable entity sets are fetched in pages filtered by the last key"""
+
+    cars = ['A', 'B', 'C']
+    requested = []
+
+    def callback(request):
+        params = dict(parse_qsl(urlparse(request.url).query))
+        requested.append(params)
+        names = [name for name in cars if "Name gt 'B'" not in params['$filter'] or name > 'B']
+        names = names[:int(params['$top'])]
+        return 200, {}, json.dumps({'d': {'results': [{'Name': name, 'CodeName': 'X'} for name in names]}})
+
+    responses.add_callback(responses.GET, f"{URL_ROOT}/Cars", callback=callback, content_type='application/json')
+
+    request = service.entity_sets.Cars.get_entities().filter(CodeName='X')
+    plan = request.plan(page_size=2)
+
+    assert plan.paging == 'keyset'
+    assert plan.server_order_by == 'Name'
+
+    cars_result = plan.execute()
+
+    assert [car.Name for car in cars_result] == ['A', 'B', 'C']
+    assert [params['$filter'] for params in requested] == ["CodeName eq 'X'", "(CodeName eq 'X') and Name gt 'B'"]
+    assert all(params['$orderby'] == 'Name' for params in requested)
+
+
+@responses.activate
+def test_query_plan_client_side_operations(service):
+    """Lookups and ordering by not filterable and not sortable properties are evaluated on client side"""
+
+    requested = []
+
+    def callback(request):
+        params = dict(parse_qsl(urlparse(request.url).query))
+        requested.append(params)
+        if '$skiptoken' not in params:
+            return 200, {}, json.dumps({'d': {
+                'results': [{'Key': '1', 'DataType': 'a', 'Data': 'xb', 'DataName': 'b'},
+                            {'Key': '2', 'DataType': 'a', 'Data': 'y', 'DataName': 'c'}],
+                '__next': f"{URL_ROOT}/MasterEntities?$filter=DataType%20eq%20%27a%27&$skiptoken=2"}})
+
+        return 200, {}, json.dumps({'d': {'results': [{'Key': '3', 'DataType': 'a', 'Data': 'xa', 'DataName': 'a'}]}})
+
+    responses.add_callback(responses.GET, f"{URL_ROOT}/MasterEntities", callback=callback,
+                           content_type='application/json')
+
+    request = service.entity_sets.MasterEntities.get_entities() \
+        .filter(DataType='a', Data__startswith='x').order_by('DataName').count(inline=True)
+    plan = request.plan(page_size=2)
+
+    # the key is not sortable, so pages cannot be requested by $top and $skip in deterministic order
+    assert plan.paging == 'server'
+    assert plan.server_filter == "DataType eq 'a'"
+    assert plan.client_lookups == [('Data', 'startswith', 'x')]
+    assert plan.client_order_by == [('DataName', False)]
+    assert plan.inline_count == 'client'
+
+    entities = plan.execute()
+
+    assert [entity.Key for entity in entities] == ['3', '1']
+    assert entities.total_count == 2
+    assert all('$top' not in params and '$skip' not in params for params in requested)
+    assert [params.get('$skiptoken') for params in requested] == [None, '2']
+
+
+@responses.activate
+def test_query_plan_pages_capped_by_service(service):
+    """Links to next pages are followed when the service returns less entities than the page size"""
+
+    employees = [{'ID': key} for key in range(1, 6)]
+    requested = []
+
+    def callback(request):
+        params = dict(parse_qsl(urlparse(request.url).query))
+        requested.append(params)
+
+        window = employees[int(params['$skip']):int(params['$skip']) + int(params['$top'])]
+        start = int(params.get('$skiptoken', 0))
+        body = {'results': window[start:start + 2]}
+        if start + 2 < len(window):
+            body['__next'] = (f"{URL_ROOT}/Employees?$orderby=ID&$top={params['$top']}&$skip={params['$skip']}"
+                              f"&$skiptoken={start + 2}")
+
+        return 200, {}, json.dumps({'d': body})
+
+    responses.add_callback(responses.GET, f"{URL_ROOT}/Employees", callback=callback, content_type='application/json')
+
+    plan = service.entity_sets.Employees.get_entities().plan(page_size=3)
+
+    assert plan.paging == 'top_skip'
+    assert plan.server_order_by == 'ID'
+
+    assert [employee.ID for employee in plan.execute()] == [1, 2, 3, 4, 5]
+    assert [(params['$skip'], params.get('$skiptoken')) for params in requested] == [
+        ('0', None), ('0', '2'), ('3', None)]
+
+
+def test_query_plan_filter_restrictions(service):
+    """Entity sets requiring filter and properties required in filter are checked before sending requests"""
+
+    with pytest.raises(PyODataException) as e_info:
+        service.entity_sets.CitiesWithFilter.get_entities().plan()
+
+    assert str(e_info.value) == 'Entity set CitiesWithFilter requires $filter with filterable properties'
+
+    with pytest.raises(PyODataException) as e_info:
+        service.entity_sets.Cars.get_entities().filter(Name='A').plan()
+
+    assert str(e_info.value) == 'Property CodeName of entity set Cars is required in $filter'
+
+
+def test_parse_filter_of_filter_builders(service):
+    """$filter strings of all filter builders and raw strings are parsed to the same tree"""
+
+    request = service.entity_sets.MasterEntities.get_entities()
+    emp = GetEntitySetFilter.and_(request.Key == '12', request.DataType != 'a')
+    chained = request.filter(Key='12', DataType__in=['a', 'b']).filter_tree()
+
+    assert parse_filter(emp) == parse_filter("Key eq '12' and DataType ne 'a'")
+    assert isinstance(chained, FilterLogical)
+    assert chained.operator == 'and'
+    assert chained.operands[1].operator == 'or'
+    assert str(chained) == "Key eq '12' and (DataType eq 'a' or DataType eq 'b')"
+    plan = service.entity_sets.MasterEntities.get_entities().filter(Key='12', DataType__in=['a', 'b']).plan()
+    assert plan.server_filter == str(chained)
+    assert chained.members() == {'Key', 'DataType'}
+
+    tree = parse_filter("substringof('O''Neil', Name) eq true and not (Age gte 18) and Price sub 1.5M lt 2M")
+    assert str(tree) == "substringof('O''Neil', Name) eq true and not (Age ge 18) and Price sub 1.5M lt 2M"
+    assert isinstance(tree.operands[2], FilterBinary)
+    assert tree.operands[0].left.args[0].value == "O'Neil"
+
+    assert service.entity_sets.MasterEntities.get_entities().filter_tree() is None
+
+
+def test_filter_tree_simplify():
+    """Simplified filters have merged ranges, folded constants and deduplicated sorted terms"""
+
+    def simplified(text):
+        return str(parse_filter(text).simplify())
+
+    assert simplified('Age ge 5 and Age le 9 and Age gt 6 and 20 gt Age') == 'Age gt 6 and Age le 9'
+    assert simplified('Age ge 5 and Age le 5') == 'Age eq 5'
+    assert simplified('Age gt 5 and Age lt 5') == 'false'
+    assert simplified("Name eq 'a' and Name eq 'b'") == 'false'
+    assert simplified("Name eq 'a' and Name ne 'b' and Name ge 'a'") == "Name eq 'a'"
+    assert simplified("(Name eq 'b' or Name eq 'a' or Name eq 'b') and true") == "Name eq 'a' or Name eq 'b'"
+    assert simplified('1 add 2 eq 3 and not (Age eq 1)') == 'Age ne 1'
+    assert simplified('Age eq 1 or 2 mul 3 gt 5') == 'true'
+    assert simplified("Created eq datetime'2020-01-01T00:00:00' and Created ge datetime'2019-01-01T00:00:00'") == \
+        "Created eq datetime'2020-01-01T00:00:00' and Created ge datetime'2019-01-01T00:00:00'"
+
+
+def test_filter_tree_canonical_key(service):
+    """Equivalent filters have equal canonical keys and requests can be normalized"""
+
+    assert parse_filter("(DataType eq 'a') and (Key eq '1')").canonical_key() == \
+        parse_filter("Key eq '1' and DataType eq 'a' and Key eq '1'").canonical_key()
+
+    request = service.entity_sets.MasterEntities.get_entities() \
+        .filter(parse_filter("Key eq '2' and (DataType eq 'b' and Key eq '2')")).normalize_filter()
+
+    assert request.get_query_params()['$filter'] == "DataType eq 'b' and Key eq '2'"
+
+    with pytest.raises(ExpressionError) as e_info:
+        parse_filter("Key eq '1')")
+
+    assert str(e_info.value) == "Unexpected \")\" at position 10 of $filter: Key eq '1')"
+
+
+@responses.activate
+def test_prefetch_navigation_property(service):
+    """Targets of navigation properties of many entities are fetched by chunked filters on referential constraint"""
+
+    filters = []
+
+    def orders_callback(request):
+        filter_val = dict(parse_qsl(urlparse(request.url).query))['$filter']
+        filters.append(filter_val)
+        owners = re.findall(r"Owner eq '(\w+)'", filter_val)
+        orders = [{'Number': f'{owner}-{number}', 'Owner': owner} for owner in owners if owner != 'Carl'
+                  for number in (1, 2)]
+        return 200, {}, json.dumps({'d': {'results': orders}})
+
+    responses.add_callback(responses.GET, f"{URL_ROOT}/Orders", callback=orders_callback,
+                           content_type='application/json')
+
+    customers = [EntityProxy(service, service.schema.entity_set('Customers'), service.schema.entity_type('Customer'),
+                             {'Name': name}) for name in ('Anna', 'Bob', 'Carl', 'Anna')]
+
+    assert service.prefetch(customers, 'Orders', chunk_size=2) == customers
+
+    assert sorted(filters) == ["Owner eq 'Anna' or Owner eq 'Bob'", "Owner eq 'Carl'"]
+    assert [order.Number for order in customers[0].Orders] == ['Anna-1', 'Anna-2']
+    assert [order.Number for order in customers[1].Orders] == ['Bob-1', 'Bob-2']
+    assert customers[2].Orders == []
+    assert customers[3].Orders == customers[0].Orders
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_prefetch_navigation_property_to_one(service):
+    """Navigation properties with multiplicity one are cached as the single target or None"""
+
+    responses.add(
+        responses.GET,
+        f"{URL_ROOT}/CarIDPics?$filter=CarName%20eq%20%27Hadraplan%27%20or%20CarName%20eq%20%27Skoda%27",
+        headers={'Content-type': 'application/json'},
+        json={'d': {'results': [{'CarName': 'Hadraplan', 'Content': 'DEADBEAF'}]}},
+        status=200)
+
+    cars = [EntityProxy(service, service.schema.entity_set('Cars'), service.schema.entity_type('Car'),
+                        {'Name': name}) for name in ('Hadraplan', 'Skoda')]
+
+    service.prefetch(cars, 'IDPic')
+
+    assert cars[0].IDPic.CarName == 'Hadraplan'
+    assert cars[1].IDPic is None
+
+    with pytest.raises(PyODataException) as e_info:
+        service.prefetch(cars, 'Unknown')
+
+    assert str(e_info.value) == 'Navigation property Unknown is not declared in EntityType(Car) entity type'